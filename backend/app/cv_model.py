@@ -6,7 +6,129 @@ import json
 from typing import List, Dict, Any, Optional, Tuple
 from ultralytics import YOLO
 import torch
-import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from ocr_cache import make_cache_key
+from wall_masks import crop_letterbox, mask_polygons, masks_to_rle
+
+# Веса модели и бэкенд инференса: torch, torch_compile, onnx (ONNX Runtime), openvino
+# или onnx_int8 (квантованная модель из quantize_yolo.py).
+# Экспорт для onnx/openvino делается один раз и кэшируется рядом с весами
+YOLO_MODEL_PATH = os.getenv('YOLO_MODEL_PATH', 'yolov8n-seg.pt')
+# Размер входа модели: 0 - как при обучении (из чекпойнта), например 416 у ученика из train_student_yolo.py
+YOLO_IMGSZ = int(os.getenv('YOLO_IMGSZ', '0'))
+CV_BACKEND = os.getenv('CV_BACKEND', 'torch')
+EXPORT_FORMATS = {'onnx': 'onnx', 'openvino': 'openvino'}
+
+# Сколько страниц отправлять в YOLO за один прогон
+YOLO_BATCH_SIZE = int(os.getenv('YOLO_BATCH_SIZE', '8'))
+
+# Тайловый инференс больших листов (по умолчанию выключен): 1 - всегда, auto - если лист больше 2 тайлов
+YOLO_TILED = os.getenv('YOLO_TILED', '0')
+YOLO_TILE_SIZE = int(os.getenv('YOLO_TILE_SIZE', '640'))
+YOLO_TILE_OVERLAP = float(os.getenv('YOLO_TILE_OVERLAP', '0.2'))
+# Доля "чернил" в тайле, ниже которой тайл считается пустой бумагой
+YOLO_TILE_MIN_INK = float(os.getenv('YOLO_TILE_MIN_INK', '0.002'))
+# Ограничение пачки тайлов по памяти
+YOLO_TILE_BATCH = int(os.getenv('YOLO_TILE_BATCH', '32'))
+YOLO_NMS_IOU = 0.5
+
+# Форма стен в разметке: bbox - прямоугольник рамки, polygon - контур маски сегментации
+YOLO_WALL_SHAPE = os.getenv('YOLO_WALL_SHAPE', 'bbox')
+# Допуск упрощения контура маски (пиксели маски)
+YOLO_POLYGON_EPSILON = float(os.getenv('YOLO_POLYGON_EPSILON', '1.5'))
+
+# Параметры геометрического анализа (Canny + Hough) - входят в ключ кэша
+GEOMETRY_PARAMS = {
+    'canny_low': 50,
+    'canny_high': 150,
+    'rho': 1,
+    'theta_deg': 1,
+    'threshold': 50,
+    'min_line_length': 100,
+    'max_line_gap': 10,
+    'histogram_bin_deg': 10,  # гистограмма ориентаций 0-180°
+    'density_grid': 8         # сетка плотности линий 8x8 по листу
+}
+# Сколько страниц держать в кэше геометрии (в памяти)
+GEOMETRY_CACHE_SIZE = int(os.getenv('GEOMETRY_CACHE_SIZE', '64'))
+
+
+class PageDetections:
+    """
+    Обнаружения на одной странице в виде колонок NumPy:
+    рамки xyxy (N, 4), уверенности (N,) и классы (N,).
+    В режиме polygon - еще полигоны масок (список, None если маска пустая)
+    и сами маски (N, h, w) для сохранения в RLE.
+    Геометрия страницы хранится один раз, словари для JSON
+    собираются только при выдаче наружу (to_dicts).
+    """
+    
+    def __init__(self, xyxy: np.ndarray = None, confidence: np.ndarray = None,
+                 classes: np.ndarray = None, geometry: Dict[str, Any] = None,
+                 polygons: List = None, masks: np.ndarray = None):
+        self.xyxy = np.zeros((0, 4), dtype=np.float32) if xyxy is None else xyxy
+        self.confidence = np.zeros(0, dtype=np.float64) if confidence is None else confidence
+        self.classes = np.zeros(len(self.xyxy), dtype=np.int64) if classes is None else classes
+        self.geometry = geometry or {}
+        self.polygons = polygons
+        self.masks = masks
+    
+    def __len__(self):
+        return len(self.xyxy)
+    
+    @property
+    def width(self) -> np.ndarray:
+        return self.xyxy[:, 2] - self.xyxy[:, 0]
+    
+    @property
+    def height(self) -> np.ndarray:
+        return self.xyxy[:, 3] - self.xyxy[:, 1]
+    
+    @property
+    def aspect_ratio(self) -> np.ndarray:
+        height = self.height
+        return np.divide(self.width, height, out=np.zeros_like(height), where=height > 0)
+    
+    def select(self, keep: np.ndarray) -> 'PageDetections':
+        """Подмножество обнаружений по булевой маске или индексам"""
+        index = np.flatnonzero(keep) if keep.dtype == bool else keep
+        polygons = [self.polygons[i] for i in index] if self.polygons is not None else None
+        masks = self.masks[index] if self.masks is not None else None
+        return PageDetections(self.xyxy[index], self.confidence[index], self.classes[index],
+                              self.geometry, polygons, masks)
+    
+    def masks_rle(self) -> Optional[Dict[str, Any]]:
+        """Маски страницы в RLE (None, если маски не сохранялись)"""
+        if self.masks is None:
+            return None
+        return masks_to_rle(self.masks)
+    
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Обнаружения в прежнем формате списка словарей (для API и разметки)"""
+        xyxy = self.xyxy.astype(np.float64)
+        polygons = self.polygons if self.polygons is not None else [None] * len(self)
+        columns = zip(xyxy.tolist(), self.confidence.tolist(), self.width.tolist(),
+                      self.height.tolist(), self.aspect_ratio.tolist(), polygons)
+        return [
+            {
+                'type': 'wall',
+                'confidence': conf,
+                'bbox': {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2},
+                'polygon': polygon,
+                'dimensions': {
+                    'width_px': width,
+                    'height_px': height,
+                    'aspect_ratio': aspect_ratio
+                },
+                'center': {'x': (x1 + x2) / 2, 'y': (y1 + y2) / 2}
+            }
+            for (x1, y1, x2, y2), conf, width, height, aspect_ratio, polygon in columns
+        ]
+
 
 class WallDetectionCVModel:
     """
@@ -14,10 +136,23 @@ class WallDetectionCVModel:
     Комбинирует YOLOv8 и геометрический анализ
     """
     
-    def __init__(self, model_path: str = None):
+    def __init__(self, model_path: str = None, backend: str = None):
         self.model = None
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
         self.model_loaded = False
+        self.model_path = Path(model_path or YOLO_MODEL_PATH)
+        self.requested_backend = backend or CV_BACKEND
+        self.backend = None
+        self.backend_model_path = None
+        self.imgsz = YOLO_IMGSZ or 640
+        
+        # Задержка инференса на изображение (последние 100 вызовов)
+        self.latencies_ms = deque(maxlen=100)
+        self.images_processed = 0
+        
+        # Кэш геометрического анализа: ключ - хэш изображения и параметров Hough
+        self.geometry_cache = OrderedDict()
+        self.geometry_lock = threading.Lock()
         
         print(f"🔧 Инициализация улучшенной CV модели...")
         print(f"   Устройство: {self.device}")
@@ -25,107 +160,303 @@ class WallDetectionCVModel:
         self.load_model()
     
     def load_model(self):
-        """Загрузка модели YOLO"""
+        """Загрузка модели YOLO на выбранном бэкенде (при ошибке - обычный PyTorch)"""
         try:
-            # Используем YOLOv8-seg для сегментации (лучше для стен)
-            self.model = YOLO('yolov8n-seg.pt')  # Сегментационная модель
-            print("✅ Загружена предобученная модель YOLOv8n-seg")
-            
-            self.model_loaded = True
-            print(f"   Модель готова к работе на {self.device}")
-            
+            self.model = self._load_backend(self.requested_backend)
+            self.backend = self.requested_backend
         except Exception as e:
-            print(f"❌ Ошибка загрузки модели: {e}")
-            self.model_loaded = False
+            print(f"⚠️ Бэкенд {self.requested_backend} недоступен ({e}), используется torch")
+            try:
+                self.model = self._load_backend('torch')
+                self.backend = 'torch'
+            except Exception as e:
+                print(f"❌ Ошибка загрузки модели: {e}")
+                self.model_loaded = False
+                return
+        
+        self.model_loaded = True
+        print(f"✅ Загружена модель {self.backend_model_path} (бэкенд {self.backend}, вход {self.imgsz}px)")
+        print(f"   Модель готова к работе на {self.device}")
+    
+    def read_imgsz(self, model=None) -> int:
+        """Размер входа, на котором обучались веса (train_args чекпойнта), иначе 640"""
+        if YOLO_IMGSZ:
+            return YOLO_IMGSZ
+        try:
+            model = model or YOLO(str(self.model_path))
+            imgsz = (model.ckpt or {}).get('train_args', {}).get('imgsz')
+        except Exception:
+            imgsz = None
+        if isinstance(imgsz, (list, tuple)):
+            imgsz = max(imgsz)
+        return int(imgsz or 640)
+    
+    def _load_backend(self, backend: str):
+        """Модель ultralytics для бэкенда: результаты в едином формате для всех бэкендов"""
+        if backend in EXPORT_FORMATS:
+            exported = self.ensure_export(EXPORT_FORMATS[backend])
+            self.imgsz = self.read_imgsz()
+            self.backend_model_path = str(exported)
+            return YOLO(str(exported))
+        
+        if backend == 'onnx_int8':
+            quantized = self.export_path('onnx_int8')
+            if not quantized.exists():
+                raise FileNotFoundError(f"{quantized} не найден, запустите quantize_yolo.py")
+            self.imgsz = self.read_imgsz()
+            self.backend_model_path = str(quantized)
+            return YOLO(str(quantized), task='segment' if '-seg' in self.model_path.stem else None)
+        
+        # Используем YOLOv8-seg для сегментации (лучше для стен)
+        model = YOLO(str(self.model_path))
+        self.imgsz = self.read_imgsz(model)
+        self.backend_model_path = str(self.model_path)
+        
+        if backend == 'torch_compile':
+            # Прогрев создает предиктор, затем компилируется его сеть
+            warmup = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+            model(source=warmup, imgsz=self.imgsz, device=self.device, verbose=False)
+            network = model.predictor.model
+            network.model = torch.compile(network.model)
+            model(source=warmup, imgsz=self.imgsz, device=self.device, verbose=False)
+        elif backend != 'torch':
+            raise ValueError(f"Неизвестный бэкенд: {backend}")
+        
+        return model
+    
+    def export_path(self, export_format: str) -> Path:
+        """Куда ultralytics кладет экспорт рядом с весами"""
+        if export_format == 'openvino':
+            return self.model_path.parent / f"{self.model_path.stem}_openvino_model"
+        if export_format == 'onnx_int8':
+            return self.model_path.parent / f"{self.model_path.stem}_int8.onnx"
+        return self.model_path.with_suffix(f".{export_format}")
+    
+    def ensure_export(self, export_format: str) -> Path:
+        """Экспорт весов в формат бэкенда (повторно - только если веса обновились)"""
+        target = self.export_path(export_format)
+        if not self.model_path.exists():
+            YOLO(str(self.model_path))  # ultralytics скачает стандартные веса
+        
+        if target.exists() and target.stat().st_mtime >= self.model_path.stat().st_mtime:
+            return target
+        
+        print(f"📦 Экспорт {self.model_path} в {export_format}...")
+        # dynamic - переменный размер пачки (пакетный и тайловый инференс)
+        model = YOLO(str(self.model_path))
+        exported = model.export(format=export_format, dynamic=True, imgsz=self.read_imgsz(model))
+        return Path(exported)
+    
+    def predict(self, source, **kwargs):
+        """Прогон модели с учетом задержки на изображение"""
+        kwargs.setdefault('imgsz', self.imgsz)
+        started = time.perf_counter()
+        results = self.model(source=source, **kwargs)
+        images = len(source) if isinstance(source, list) else 1
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        self.images_processed += images
+        self.latencies_ms.append(elapsed_ms / max(images, 1))
+        return results
+    
+    def warm_up(self) -> bool:
+        """Пробный прогон на пустом изображении: предиктор и ядра готовы до первого запроса"""
+        if not self.model_loaded:
+            return False
+        blank = np.full((self.imgsz, self.imgsz, 3), 255, dtype=np.uint8)
+        self.model(source=blank, imgsz=self.imgsz, device=self.device, verbose=False)
+        return True
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Активный бэкенд и задержка инференса"""
+        latencies = list(self.latencies_ms)
+        return {
+            'model_loaded': self.model_loaded,
+            'backend': self.backend,
+            'requested_backend': self.requested_backend,
+            'model_path': str(self.model_path),
+            'backend_model_path': self.backend_model_path,
+            'device': self.device,
+            'imgsz': self.imgsz,
+            'geometry_cache_entries': len(self.geometry_cache),
+            'images_processed': self.images_processed,
+            'latency_ms_last': round(latencies[-1], 1) if latencies else None,
+            'latency_ms_avg': round(sum(latencies) / len(latencies), 1) if latencies else None
+        }
+    
+    def load_gray(self, image) -> Optional[np.ndarray]:
+        """Grayscale изображение из пути или готового массива (без повторного декодирования)"""
+        if isinstance(image, np.ndarray):
+            if image.ndim == 2:
+                return image
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.imread(str(image), cv2.IMREAD_GRAYSCALE)
+    
+    def to_model_input(self, image):
+        """Источник для YOLO: путь как есть, массив - в BGR с 3 каналами"""
+        if isinstance(image, np.ndarray):
+            if image.ndim == 2:
+                return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            return image
+        return str(image)
     
-    def analyze_geometry(self, image_path: Path) -> Dict[str, Any]:
+    def describe_image(self, image) -> str:
+        """Короткое описание источника для логов"""
+        if isinstance(image, np.ndarray):
+            return f"массив {image.shape[1]}x{image.shape[0]}"
+        return Path(image).name
+    
+    def analyze_geometry(self, image_path) -> Dict[str, Any]:
         """
-        Геометрический анализ чертежа для поиска стен
+        Геометрический анализ чертежа для поиска стен.
+        Результат кэшируется по содержимому изображения и GEOMETRY_PARAMS:
+        повторный вызов для той же страницы не запускает Canny и Hough заново
         
         Args:
-            image_path: Путь к изображению
+            image_path: Путь к изображению или массив NumPy
             
         Returns:
             Геометрические признаки
         """
         try:
-            image = cv2.imread(str(image_path))
-            if image is None:
+            # Загружаем сразу в grayscale
+            gray = self.load_gray(image_path)
+            if gray is None:
                 return {}
             
-            # Конвертируем в grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Применяем детектор границ Canny
-            edges = cv2.Canny(gray, 50, 150)
+            key = make_cache_key(gray, GEOMETRY_PARAMS)
+            with self.geometry_lock:
+                cached = self.geometry_cache.get(key)
+                if cached is not None:
+                    self.geometry_cache.move_to_end(key)
+                    return dict(cached)
             
-            # Находим линии с помощью преобразования Хафа
-            lines = cv2.HoughLinesP(
-                edges, 
-                rho=1, 
-                theta=np.pi/180, 
-                threshold=50, 
-                minLineLength=100, 
-                maxLineGap=10
-            )
-            
-            geometric_features = {
-                'total_lines': 0,
-                'horizontal_lines': 0,
-                'vertical_lines': 0,
-                'diagonal_lines': 0,
-                'avg_line_length': 0,
-                'line_detected': False
-            }
+            geometric_features = self.compute_geometry(gray, GEOMETRY_PARAMS)
             
-            if lines is not None:
-                geometric_features['total_lines'] = len(lines)
-                lengths = []
-                
-                for line in lines:
-                    x1, y1, x2, y2 = line[0]
-                    length = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-                    lengths.append(length)
-                    
-                    # Определяем ориентацию линии
-                    angle = abs(math.degrees(math.atan2(y2 - y1, x2 - x1)))
-                    
-                    if angle < 10 or angle > 170:  # Горизонтальная
-                        geometric_features['horizontal_lines'] += 1
-                    elif 80 < angle < 100:  # Вертикальная
-                        geometric_features['vertical_lines'] += 1
-                    else:  # Диагональная
-                        geometric_features['diagonal_lines'] += 1
-                
-                if lengths:
-                    geometric_features['avg_line_length'] = sum(lengths) / len(lengths)
-                    geometric_features['line_detected'] = True
+            with self.geometry_lock:
+                self.geometry_cache[key] = geometric_features
+                while len(self.geometry_cache) > GEOMETRY_CACHE_SIZE:
+                    self.geometry_cache.popitem(last=False)
             
-            return geometric_features
+            return dict(geometric_features)
             
         except Exception as e:
             print(f"⚠️ Ошибка геометрического анализа: {e}")
             return {}
     
-    def detect_walls_hybrid(self, image_path: Path) -> List[Dict[str, Any]]:
+    def compute_geometry(self, gray: np.ndarray, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Линии Хафа и их статистика одним векторным проходом по всем отрезкам:
+        ориентации, длины, гистограмма ориентаций и сетка плотности линий по листу
+        """
+        # Применяем детектор границ Canny
+        edges = cv2.Canny(gray, params['canny_low'], params['canny_high'])
+        
+        # Находим линии с помощью преобразования Хафа
+        lines = cv2.HoughLinesP(
+            edges,
+            rho=params['rho'],
+            theta=np.deg2rad(params['theta_deg']),
+            threshold=params['threshold'],
+            minLineLength=params['min_line_length'],
+            maxLineGap=params['max_line_gap']
+        )
+        
+        bins = int(round(180 / params['histogram_bin_deg']))
+        grid = params['density_grid']
+        geometric_features = {
+            'total_lines': 0,
+            'horizontal_lines': 0,
+            'vertical_lines': 0,
+            'diagonal_lines': 0,
+            'avg_line_length': 0,
+            'median_line_length': 0,
+            'max_line_length': 0,
+            'total_line_length': 0,
+            'line_detected': False,
+            'orientation_histogram': {
+                'bin_deg': params['histogram_bin_deg'],
+                'counts': [0] * bins,
+                'lengths': [0.0] * bins
+            },
+            'density_grid': {
+                'rows': grid,
+                'cols': grid,
+                'counts': [[0] * grid for _ in range(grid)],
+                'lengths': [[0.0] * grid for _ in range(grid)]
+            }
+        }
+        
+        if lines is None or len(lines) == 0:
+            return geometric_features
+        
+        segments = lines.reshape(-1, 4).astype(np.float64)
+        dx = segments[:, 2] - segments[:, 0]
+        dy = segments[:, 3] - segments[:, 1]
+        lengths = np.hypot(dx, dy)
+        angles = np.abs(np.degrees(np.arctan2(dy, dx)))
+        
+        # Определяем ориентацию линий
+        horizontal = (angles < 10) | (angles > 170)
+        vertical = (angles > 80) & (angles < 100)
+        
+        geometric_features.update({
+            'total_lines': int(len(segments)),
+            'horizontal_lines': int(horizontal.sum()),
+            'vertical_lines': int(vertical.sum()),
+            'diagonal_lines': int((~horizontal & ~vertical).sum()),
+            'avg_line_length': float(lengths.mean()),
+            'median_line_length': float(np.median(lengths)),
+            'max_line_length': float(lengths.max()),
+            'total_line_length': float(lengths.sum()),
+            'line_detected': True
+        })
+        
+        # Гистограмма ориентаций (0° и 180° - одно направление)
+        histogram_range = (0, 180)
+        counts, _ = np.histogram(angles % 180, bins=bins, range=histogram_range)
+        weighted, _ = np.histogram(angles % 180, bins=bins, range=histogram_range, weights=lengths)
+        geometric_features['orientation_histogram'].update({
+            'counts': counts.tolist(),
+            'lengths': np.round(weighted, 1).tolist()
+        })
+        
+        # Плотность линий по областям листа (по серединам отрезков)
+        height, width = gray.shape[:2]
+        cols = np.minimum(((segments[:, 0] + segments[:, 2]) / 2 * grid / width).astype(np.int64), grid - 1)
+        rows = np.minimum(((segments[:, 1] + segments[:, 3]) / 2 * grid / height).astype(np.int64), grid - 1)
+        cells = rows * grid + cols
+        cell_counts = np.bincount(cells, minlength=grid * grid).reshape(grid, grid)
+        cell_lengths = np.bincount(cells, weights=lengths, minlength=grid * grid).reshape(grid, grid)
+        geometric_features['density_grid'].update({
+            'counts': cell_counts.tolist(),
+            'lengths': np.round(cell_lengths, 1).tolist()
+        })
+        
+        return geometric_features
+    
+    def detect_walls_hybrid(self, image_path) -> PageDetections:
         """
         Гибридное обнаружение стен: YOLO + Геометрический анализ
         
         Args:
-            image_path: Путь к изображению
+            image_path: Путь к изображению или массив NumPy (grayscale или BGR)
             
         Returns:
-            Список обнаруженных стен
+            PageDetections с обнаруженными стенами
         """
         if not self.model_loaded:
-            return []
+            return PageDetections()
+        
+        if self.use_tiling(image_path):
+            return self.detect_walls_tiled(image_path)
         
         try:
-            print(f"🔍 Гибридный анализ: {image_path.name}")
+            print(f"🔍 Гибридный анализ: {self.describe_image(image_path)}")
             
             # 1. YOLO обнаружение
-            results = self.model(
-                source=str(image_path),
+            results = self.predict(
+                source=self.to_model_input(image_path),
                 conf=0.2,  # Более низкий порог для чертежей
                 device=self.device,
                 verbose=False
@@ -134,100 +465,259 @@ class WallDetectionCVModel:
             # 2. Геометрический анализ
             geometry = self.analyze_geometry(image_path)
             
-            detections = []
-            
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        conf = box.conf[0].cpu().numpy()
-                        cls = int(box.cls[0].cpu().numpy())
-                        class_name = result.names[cls]
-                        
-                        # Фильтруем по геометрическим признакам
-                        width = x2 - x1
-                        height = y2 - y1
-                        aspect_ratio = width / height if height > 0 else 0
-                        
-                        # Признаки для определения стены:
-                        # 1. Соотношение сторон (стены обычно длинные и узкие)
-                        # 2. Наличие горизонтальных/вертикальных линий
-                        # 3. Размер относительно изображения
-                        
-                        is_wall_like = False
-                        wall_confidence = float(conf)
-                        
-                        if geometry['line_detected']:
-                            # Увеличиваем уверенность если есть линии
-                            wall_confidence *= 1.2
-                        
-                        # Проверяем признаки стены
-                        if (0.5 < aspect_ratio < 20 or  # Длинная форма
-                            width > 100 or height > 100):  # Достаточно большой размер
-                            is_wall_like = True
-                        
-                        if is_wall_like or wall_confidence > 0.3:
-                            detection = {
-                                'type': 'wall',
-                                'confidence': min(wall_confidence, 1.0),
-                                'bbox': {
-                                    'x1': float(x1),
-                                    'y1': float(y1),
-                                    'x2': float(x2),
-                                    'y2': float(y2)
-                                },
-                                'dimensions': {
-                                    'width_px': float(width),
-                                    'height_px': float(height),
-                                    'aspect_ratio': float(aspect_ratio)
-                                },
-                                'geometry_info': geometry,
-                                'center': {
-                                    'x': float((x1 + x2) / 2),
-                                    'y': float((y1 + y2) / 2)
-                                }
-                            }
-                            detections.append(detection)
+            detections = self.filter_wall_detections(results[0], geometry)
             
             print(f"✅ Найдено возможных стен: {len(detections)}")
-            if geometry['line_detected']:
+            if geometry.get('line_detected'):
                 print(f"📏 Геометрия: {geometry['horizontal_lines']} гориз., {geometry['vertical_lines']} верт. линий")
             
             return detections
             
         except Exception as e:
             print(f"❌ Ошибка гибридного обнаружения: {e}")
-            return []
+            return PageDetections()
+    
+    def filter_wall_detections(self, result, geometry) -> PageDetections:
+        """Отбор похожих на стены объектов из результата YOLO для одного изображения"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return PageDetections(geometry=geometry)
+        
+        polygons, masks = self.extract_masks(result)
+        
+        # Одна выгрузка с устройства на колонку, а не на каждую рамку
+        return self.filter_wall_boxes(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), geometry,
+                                      boxes.cls.cpu().numpy().astype(np.int64), polygons, masks)
+    
+    def extract_masks(self, result, offset=(0, 0)):
+        """
+        Полигоны и маски сегментации результата YOLO (режим YOLO_WALL_SHAPE=polygon)
+        
+        Returns:
+            (полигоны в координатах страницы, маски без полей letterbox) или (None, None)
+        """
+        if YOLO_WALL_SHAPE != 'polygon' or result.masks is None:
+            return None, None
+        
+        masks = crop_letterbox(result.masks.data.cpu().numpy() > 0.5, result.orig_shape)
+        polygons = mask_polygons(masks, result.orig_shape, offset, YOLO_POLYGON_EPSILON)
+        return polygons, masks
     
-    def convert_to_markup_format(self, detections: List[Dict], 
-                                image_path: Path) -> Dict[str, Any]:
+    def filter_wall_boxes(self, xyxy: np.ndarray, confs: np.ndarray, geometry,
+                          classes: np.ndarray = None, polygons: List = None,
+                          masks: np.ndarray = None) -> PageDetections:
+        """
+        Отбор похожих на стены рамок (координаты страницы xyxy и уверенности)
+        одним векторным проходом по всем рамкам страницы.
+        Признаки стены: вытянутая форма (0.5 < w/h < 20) или крупный размер (> 100 px);
+        прочие рамки остаются, если уверенность (x1.2 при найденных линиях) выше 0.3
+        """
+        detections = PageDetections(xyxy, confs.astype(np.float64), classes, geometry, polygons, masks)
+        width, height, aspect_ratio = detections.width, detections.height, detections.aspect_ratio
+        
+        wall_confidence = detections.confidence
+        if geometry.get('line_detected'):
+            # Увеличиваем уверенность если есть линии
+            wall_confidence = wall_confidence * 1.2
+        
+        is_wall_like = ((0.5 < aspect_ratio) & (aspect_ratio < 20)) | (width > 100) | (height > 100)
+        keep = is_wall_like | (wall_confidence > 0.3)
+        
+        detections.confidence = np.minimum(wall_confidence, 1.0)
+        return detections.select(keep)
+    
+    def use_tiling(self, image) -> bool:
+        """Нужен ли тайловый инференс для изображения (по YOLO_TILED и размеру листа)"""
+        if YOLO_TILED == '1':
+            return True
+        if YOLO_TILED != 'auto':
+            return False
+        if isinstance(image, np.ndarray):
+            height, width = image.shape[:2]
+        else:
+            try:
+                from PIL import Image
+                with Image.open(image) as img:
+                    width, height = img.size
+            except Exception:
+                return False
+        return max(width, height) > 2 * YOLO_TILE_SIZE
+    
+    def make_tiles(self, width: int, height: int, tile: int = YOLO_TILE_SIZE,
+                   overlap: float = YOLO_TILE_OVERLAP) -> List[Tuple[int, int, int, int]]:
+        """Перекрывающиеся тайлы (x0, y0, x1, y1); крайние тайлы прижаты к краю листа"""
+        stride = max(1, int(tile * (1 - overlap)))
+        
+        def starts(size):
+            if size <= tile:
+                return [0]
+            positions = list(range(0, size - tile, stride))
+            positions.append(size - tile)
+            return positions
+        
+        return [(x, y, min(x + tile, width), min(y + tile, height))
+                for y in starts(height) for x in starts(width)]
+    
+    def detect_walls_tiled(self, image_path) -> PageDetections:
+        """
+        Тайловое обнаружение стен на листе в исходном разрешении:
+        лист режется на перекрывающиеся тайлы размером со вход модели, почти пустые
+        тайлы отсеиваются по доле "чернил" (интегральное изображение - O(1) на тайл),
+        оставшиеся идут в YOLO пачкой, рамки переводятся в координаты листа
+        и сводятся глобальным NMS.
+        """
+        if not self.model_loaded:
+            return PageDetections()
+        
+        try:
+            gray = self.load_gray(image_path)
+            if gray is None:
+                return PageDetections()
+            height, width = gray.shape[:2]
+            
+            # Доля темных пикселей в каждом тайле через интегральное изображение
+            ink = (gray < 200).astype(np.uint8)
+            integral = cv2.integral(ink)
+            all_tiles = self.make_tiles(width, height)
+            tiles = []
+            for x0, y0, x1, y1 in all_tiles:
+                ink_pixels = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+                if ink_pixels / float((x1 - x0) * (y1 - y0)) >= YOLO_TILE_MIN_INK:
+                    tiles.append((x0, y0, x1, y1))
+            
+            print(f"🧩 Тайловый анализ {width}x{height}: {len(tiles)} из {len(all_tiles)} тайлов с графикой")
+            
+            all_boxes, all_confs, all_classes, all_polygons = [], [], [], []
+            for start in range(0, len(tiles), YOLO_TILE_BATCH):
+                chunk = tiles[start:start + YOLO_TILE_BATCH]
+                results = self.predict(
+                    source=[self.to_model_input(gray[y0:y1, x0:x1]) for x0, y0, x1, y1 in chunk],
+                    imgsz=YOLO_TILE_SIZE,
+                    conf=0.2,  # Более низкий порог для чертежей
+                    device=self.device,
+                    verbose=False
+                )
+                for (x0, y0, _, _), result in zip(chunk, results):
+                    if result.boxes is None or len(result.boxes) == 0:
+                        continue
+                    boxes = result.boxes.xyxy.cpu().numpy() + np.array([x0, y0, x0, y0], dtype=np.float32)
+                    all_boxes.append(boxes)
+                    all_confs.append(result.boxes.conf.cpu().numpy())
+                    all_classes.append(result.boxes.cls.cpu().numpy().astype(np.int64))
+                    # Маски тайлов в RLE не сохраняются, только полигоны в координатах листа
+                    polygons, _ = self.extract_masks(result, offset=(x0, y0))
+                    all_polygons.extend(polygons if polygons is not None else [None] * len(boxes))
+            
+            geometry = self.analyze_geometry(gray)
+            if not all_boxes:
+                return PageDetections(geometry=geometry)
+            
+            xyxy, confs = np.concatenate(all_boxes), np.concatenate(all_confs)
+            keep = self.global_nms(xyxy, confs)
+            polygons = [all_polygons[i] for i in keep] if YOLO_WALL_SHAPE == 'polygon' else None
+            detections = self.filter_wall_boxes(xyxy[keep], confs[keep], geometry,
+                                                np.concatenate(all_classes)[keep], polygons)
+            print(f"✅ Найдено возможных стен: {len(detections)} (после NMS из {sum(len(b) for b in all_boxes)})")
+            return detections
+            
+        except Exception as e:
+            print(f"❌ Ошибка тайлового обнаружения: {e}")
+            return PageDetections()
+    
+    def global_nms(self, xyxy: np.ndarray, confs: np.ndarray, iou: float = YOLO_NMS_IOU) -> np.ndarray:
+        """NMS по всем тайлам листа: индексы рамок без дублей из зон перекрытия"""
+        boxes_xywh = np.column_stack([xyxy[:, 0], xyxy[:, 1],
+                                      xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1]])
+        keep = cv2.dnn.NMSBoxes(boxes_xywh.tolist(), confs.astype(float).tolist(), 0.0, iou)
+        return np.array(keep, dtype=np.int64).reshape(-1)
+    
+    def detect_walls_batch(self, images, batch_size: int = None):
+        """
+        Пакетное обнаружение стен: изображения уходят в YOLO пачками по batch_size
+        (один прогон модели на пачку вместо вызова на каждую страницу)
+        
+        Args:
+            images: Итерируемое путей или массивов NumPy
+            batch_size: Размер пачки (по умолчанию YOLO_BATCH_SIZE из .env)
+            
+        Yields:
+            PageDetections для каждого изображения, в исходном порядке
+        """
+        batch_size = max(1, batch_size or YOLO_BATCH_SIZE)
+        batch = []
+        
+        for image in images:
+            batch.append(image)
+            if len(batch) >= batch_size:
+                yield from self._detect_batch(batch)
+                batch = []
+        
+        if batch:
+            yield from self._detect_batch(batch)
+    
+    def _detect_batch(self, batch) -> List[PageDetections]:
+        """Один прогон YOLO на пачке изображений (большие листы - тайлами, каждый своей пачкой)"""
+        if not self.model_loaded:
+            return [PageDetections() for _ in batch]
+        
+        tiled = [self.use_tiling(image) for image in batch]
+        if any(tiled):
+            whole = [image for image, is_tiled in zip(batch, tiled) if not is_tiled]
+            whole_results = iter(self._detect_batch(whole) if whole else [])
+            return [self.detect_walls_tiled(image) if is_tiled else next(whole_results)
+                    for image, is_tiled in zip(batch, tiled)]
+        
+        try:
+            print(f"🔍 Пакетный анализ: {len(batch)} изобр.")
+            results = self.predict(
+                source=[self.to_model_input(image) for image in batch],
+                conf=0.2,  # Более низкий порог для чертежей
+                device=self.device,
+                verbose=False
+            )
+        except Exception as e:
+            print(f"❌ Ошибка пакетного обнаружения: {e}")
+            return [PageDetections() for _ in batch]
+        
+        # Ultralytics возвращает результаты в порядке источников
+        return [
+            self.filter_wall_detections(result, self.analyze_geometry(image))
+            for image, result in zip(batch, results)
+        ]
+    
+    def convert_to_markup_format(self, detections: PageDetections, 
+                                image_path) -> Dict[str, Any]:
         """
         Конвертация обнаружений в формат разметки
         
         Args:
-            detections: Список обнаружений
-            image_path: Путь к изображению
+            detections: Обнаружения страницы (PageDetections)
+            image_path: Путь к изображению или массив NumPy
             
         Returns:
             Данные в формате разметки
         """
         markup_objects = []
         
-        for det in detections:
+        for det in detections.to_dicts():
             bbox = det['bbox']
             
-            # Преобразуем bounding box в полигон (4 точки)
-            points = [
-                {'x': bbox['x1'], 'y': bbox['y1']},
-                {'x': bbox['x2'], 'y': bbox['y1']},
-                {'x': bbox['x2'], 'y': bbox['y2']},
-                {'x': bbox['x1'], 'y': bbox['y2']}
-            ]
+            if det['polygon']:
+                # Контур маски: диагональные и Г-образные стены без лишней площади рамки
+                points = [{'x': x, 'y': y} for x, y in det['polygon']]
+            else:
+                # Преобразуем bounding box в полигон (4 точки)
+                points = [
+                    {'x': bbox['x1'], 'y': bbox['y1']},
+                    {'x': bbox['x2'], 'y': bbox['y1']},
+                    {'x': bbox['x2'], 'y': bbox['y2']},
+                    {'x': bbox['x1'], 'y': bbox['y2']}
+                ]
             
             obj = {
                 'type': 'wall',
                 'points': points,
+                'shape': 'polygon' if det['polygon'] else 'bbox',
                 'confidence': det['confidence'],
                 'dimensions': det['dimensions'],
                 'center': det['center']
@@ -237,8 +727,11 @@ class WallDetectionCVModel:
         
         # Получаем размеры изображения
         try:
-            image = cv2.imread(str(image_path))
-            height, width = image.shape[:2]
+            if isinstance(image_path, np.ndarray):
+                height, width = image_path.shape[:2]
+            else:
+                image = cv2.imread(str(image_path))
+                height, width = image.shape[:2]
         except:
             width, height = 1000, 1000  # Значения по умолчанию
         
@@ -256,6 +749,113 @@ class WallDetectionCVModel:
             'model_version': 'v1.0-hybrid'
         }
         
+        # Геометрия страницы - один раз на разметку (раньше копировалась в каждое обнаружение)
+        markup['geometry'] = detections.geometry
+        
+        # Маски страницы (порядок совпадает с objects), пропорциональны image_dimensions
+        masks_rle = detections.masks_rle()
+        if masks_rle is not None:
+            markup['masks_rle'] = masks_rle
+        
+        return markup
+    
+    def find_page_image(self, project_id: str, page_num: int) -> Optional[Path]:
+        """Поиск изображения страницы проекта в processed_images"""
+        print(f"🔍 Поиск изображения для проекта {project_id}, страница {page_num}")
+        
+        # Пробуем разные пути для поиска изображения
+        base_path = Path(__file__).parent.parent  # C:\smet4ik\backend
+        
+        # 1. Проверяем в processed_images
+        processed_path = base_path / "processed_images" / project_id
+        print(f"   Путь processed_images: {processed_path}")
+        
+        # 2. Проверяем в app/processed_images
+        app_processed_path = base_path / "app" / "processed_images" / project_id
+        print(f"   Путь app/processed_images: {app_processed_path}")
+        
+        image_path = None
+        
+        # Сначала ищем в processed_images
+        if processed_path.exists():
+            patterns = [
+                f"page_{page_num:03d}.jpg",
+                f"page_{page_num}.jpg",
+                f"page_{page_num:03d}.png",
+                f"page_{page_num}.png",
+                f"page_{page_num:03d}.jpeg",
+                f"page_{page_num}.jpeg"
+            ]
+            
+            for pattern in patterns:
+                test_path = processed_path / pattern
+                if test_path.exists():
+                    image_path = test_path
+                    print(f"✅ Найдено изображение: {image_path}")
+                    break
+        
+        # Если не нашли, ищем в app/processed_images
+        if not image_path and app_processed_path.exists():
+            patterns = [
+                f"page_{page_num:03d}.jpg",
+                f"page_{page_num}.jpg",
+                f"page_{page_num:03d}.png",
+                f"page_{page_num}.png"
+            ]
+            
+            for pattern in patterns:
+                test_path = app_processed_path / pattern
+                if test_path.exists():
+                    image_path = test_path
+                    print(f"✅ Найдено изображение в app/: {image_path}")
+                    break
+        
+        # Если все еще не нашли, ищем любой файл изображения
+        if not image_path and processed_path.exists():
+            all_images = list(processed_path.glob("*.jpg")) + \
+                        list(processed_path.glob("*.png")) + \
+                        list(processed_path.glob("*.jpeg"))
+            
+            if all_images and page_num <= len(all_images):
+                all_images.sort()
+                image_path = all_images[page_num - 1]
+                print(f"✅ Используем изображение по номеру: {image_path}")
+        
+        if not image_path:
+            print(f"❌ Изображение не найдено для проекта {project_id}, стр. {page_num}")
+            print(f"   Проверенные пути:")
+            print(f"   - {processed_path}")
+            print(f"   - {app_processed_path}")
+        
+        return image_path
+    
+    def build_page_result(self, project_id: str, page_num: int, image_path: Path,
+                          detections: PageDetections) -> Dict[str, Any]:
+        """Результат страницы в формате разметки + сохранение в auto_detected_*.json"""
+        if not detections:
+            return {
+                'success': False,
+                'message': 'Стены не обнаружены',
+                'image': image_path.name,
+                'project_id': project_id,
+                'page_num': page_num
+            }
+        
+        # Конвертируем в формат разметки
+        markup = self.convert_to_markup_format(detections, image_path)
+        markup['project_id'] = project_id
+        markup['page_num'] = page_num
+        markup['success'] = True
+        markup['image_path'] = str(image_path)
+        
+        # Сохраняем в файл
+        base_path = Path(__file__).parent.parent
+        output_file = base_path / f"auto_detected_{project_id}_p{page_num}.json"
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(markup, f, ensure_ascii=False, indent=2)
+        
+        print(f"💾 Авторазметка сохранена: {output_file}")
+        
         return markup
     
     def process_project_page(self, project_id: str, page_num: int) -> Dict[str, Any]:
@@ -270,108 +870,62 @@ class WallDetectionCVModel:
             Результаты обнаружения
         """
         try:
-            print(f"🔍 Поиск изображения для проекта {project_id}, страница {page_num}")
-            
-            # Пробуем разные пути для поиска изображения
-            base_path = Path(__file__).parent.parent  # C:\smet4ik\backend
-            
-            # 1. Проверяем в processed_images
-            processed_path = base_path / "processed_images" / project_id
-            print(f"   Путь processed_images: {processed_path}")
-            
-            # 2. Проверяем в app/processed_images
-            app_processed_path = base_path / "app" / "processed_images" / project_id
-            print(f"   Путь app/processed_images: {app_processed_path}")
-            
-            image_path = None
-            
-            # Сначала ищем в processed_images
-            if processed_path.exists():
-                patterns = [
-                    f"page_{page_num:03d}.jpg",
-                    f"page_{page_num}.jpg",
-                    f"page_{page_num:03d}.png",
-                    f"page_{page_num}.png",
-                    f"page_{page_num:03d}.jpeg",
-                    f"page_{page_num}.jpeg"
-                ]
-                
-                for pattern in patterns:
-                    test_path = processed_path / pattern
-                    if test_path.exists():
-                        image_path = test_path
-                        print(f"✅ Найдено изображение: {image_path}")
-                        break
-            
-            # Если не нашли, ищем в app/processed_images
-            if not image_path and app_processed_path.exists():
-                patterns = [
-                    f"page_{page_num:03d}.jpg",
-                    f"page_{page_num}.jpg",
-                    f"page_{page_num:03d}.png",
-                    f"page_{page_num}.png"
-                ]
-                
-                for pattern in patterns:
-                    test_path = app_processed_path / pattern
-                    if test_path.exists():
-                        image_path = test_path
-                        print(f"✅ Найдено изображение в app/: {image_path}")
-                        break
-            
-            # Если все еще не нашли, ищем любой файл изображения
-            if not image_path and processed_path.exists():
-                all_images = list(processed_path.glob("*.jpg")) + \
-                            list(processed_path.glob("*.png")) + \
-                            list(processed_path.glob("*.jpeg"))
-                
-                if all_images and page_num <= len(all_images):
-                    all_images.sort()
-                    image_path = all_images[page_num - 1]
-                    print(f"✅ Используем изображение по номеру: {image_path}")
-            
+            image_path = self.find_page_image(project_id, page_num)
             if not image_path:
                 error_msg = f"Изображение не найдено для проекта {project_id}, стр. {page_num}"
-                print(f"❌ {error_msg}")
-                print(f"   Проверенные пути:")
-                print(f"   - {processed_path}")
-                print(f"   - {app_processed_path}")
                 return {'error': error_msg, 'success': False}
             
             # Выполняем обнаружение
             print(f"🔍 Запуск обнаружения стен на: {image_path.name}")
             detections = self.detect_walls_hybrid(image_path)
             
-            if not detections:
-                return {
-                    'success': False,
-                    'message': 'Стены не обнаружены',
-                    'image': image_path.name,
-                    'project_id': project_id,
-                    'page_num': page_num
-                }
-            
-            # Конвертируем в формат разметки
-            markup = self.convert_to_markup_format(detections, image_path)
-            markup['project_id'] = project_id
-            markup['page_num'] = page_num
-            markup['success'] = True
-            markup['image_path'] = str(image_path)
-            
-            # Сохраняем в файл
-            output_file = base_path / f"auto_detected_{project_id}_p{page_num}.json"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(markup, f, ensure_ascii=False, indent=2)
-            
-            print(f"💾 Авторазметка сохранена: {output_file}")
-            
-            return markup
+            return self.build_page_result(project_id, page_num, image_path, detections)
             
         except Exception as e:
             print(f"❌ Ошибка автообнаружения: {e}")
             import traceback
             traceback.print_exc()
             return {'error': str(e), 'success': False}
+    
+    def process_project(self, project_id: str, page_nums: List[int], batch_size: int = None):
+        """
+        Обнаружение стен на страницах проекта пачками
+        
+        Args:
+            project_id: ID проекта (папка в processed_images)
+            page_nums: Номера страниц
+            batch_size: Размер пачки YOLO (по умолчанию YOLO_BATCH_SIZE из .env)
+            
+        Yields:
+            Результат каждой страницы (как process_project_page) по мере готовности пачек
+        """
+        pages = []
+        for page_num in page_nums:
+            image_path = self.find_page_image(project_id, page_num)
+            if image_path is None:
+                yield {'error': f"Изображение не найдено для проекта {project_id}, стр. {page_num}",
+                       'success': False, 'project_id': project_id, 'page_num': page_num}
+            else:
+                pages.append((page_num, image_path))
+        
+        detections_iter = self.detect_walls_batch((path for _, path in pages), batch_size)
+        for (page_num, image_path), detections in zip(pages, detections_iter):
+            try:
+                yield self.build_page_result(project_id, page_num, image_path, detections)
+            except Exception as e:
+                print(f"❌ Ошибка автообнаружения стр. {page_num}: {e}")
+                yield {'error': str(e), 'success': False, 'project_id': project_id, 'page_num': page_num}
+
+# Модель с весами из .env: создается при первом обращении, а не при импорте модуля
+# (импорт нужен и реестру моделей, которому эти веса могут быть вовсе не нужны)
+_default_model = None
+_default_model_lock = threading.Lock()
+
 
-# Глобальный экземпляр модели
-cv_model = WallDetectionCVModel()
\ No newline at end of file
+def get_default_model():
+    """Экземпляр с весами YOLO_MODEL_PATH и бэкендом CV_BACKEND (загружается один раз)"""
+    global _default_model
+    with _default_model_lock:
+        if _default_model is None:
+            _default_model = WallDetectionCVModel()
+        return _default_model
\ No newline at end of file
@@ -1,15 +1,21 @@
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extras import execute_values
 import json
 from pathlib import Path
 from datetime import datetime
 import os
 import threading
+import time
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
+# Попытки подключения при старте (Postgres может подниматься дольше сервера)
+DB_CONNECT_RETRIES = int(os.getenv('DB_CONNECT_RETRIES', '5'))
+DB_CONNECT_DELAY = float(os.getenv('DB_CONNECT_DELAY', '2'))
+
 class Database:
     def __init__(self):
         # Читаем параметры подключения из .env файла
@@ -22,14 +28,46 @@ class Database:
         }
         
         self.lock = threading.Lock()
+        self.connect_lock = threading.Lock()
         self.connection_pool = None
-        self.init_database()
-        self.init_connection_pool()
+        # Подключение и проверка схемы - не при импорте, а в connect()
+        # (lifespan сервера или первый запрос к базе)
+    
+    @property
+    def ready(self):
+        """Схема проверена и пул соединений создан"""
+        return self.connection_pool is not None
+    
+    def connect(self, retries=None, delay=None):
+        """
+        Проверка схемы и создание пула соединений с повторными попытками (один раз на процесс)
+        
+        Returns:
+            True, если база готова к работе
+        """
+        retries = max(1, retries or DB_CONNECT_RETRIES)
+        delay = DB_CONNECT_DELAY if delay is None else delay
         
-        # Выводим информацию о подключении (без пароля)
-        safe_params = self.db_params.copy()
-        safe_params['password'] = '***'
-        print(f"✅ Подключение к PostgreSQL: {safe_params}")
+        with self.connect_lock:
+            if self.connection_pool is not None:
+                return True
+            
+            for attempt in range(1, retries + 1):
+                try:
+                    if not self.init_database():
+                        raise RuntimeError("схема не создана")
+                    self.init_connection_pool()
+                    
+                    # Выводим информацию о подключении (без пароля)
+                    safe_params = self.db_params.copy()
+                    safe_params['password'] = '***'
+                    print(f"✅ Подключение к PostgreSQL: {safe_params}")
+                    return True
+                except Exception as e:
+                    print(f"⚠️ PostgreSQL недоступен (попытка {attempt}/{retries}): {e}")
+                    if attempt < retries:
+                        time.sleep(delay * attempt)
+            return False
     
     def init_connection_pool(self):
         """Инициализация пула соединений"""
@@ -44,7 +82,9 @@ class Database:
             raise
     
     def get_connection(self):
-        """Получение соединения из пула"""
+        """Получение соединения из пула (если база еще не подключена - одна попытка подключения)"""
+        if self.connection_pool is None and not self.connect(retries=1):
+            raise RuntimeError("PostgreSQL недоступен")
         return self.connection_pool.getconn()
     
     def return_connection(self, conn):
@@ -129,17 +169,191 @@ class Database:
                 )
             ''')
             
+            # Хэш содержимого PDF для повторного использования результатов
+            cursor.execute('''
+                ALTER TABLE projects ADD COLUMN IF NOT EXISTS content_hash TEXT
+            ''')
+            cursor.execute('''
+                ALTER TABLE projects ADD COLUMN IF NOT EXISTS source_project_id TEXT
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_projects_content_hash ON projects (content_hash)
+            ''')
+            
+            # Полный текст OCR (ocr_text хранит только превью) и полнотекстовый индекс.
+            # Длинный текст Postgres сжимает сам (TOAST)
+            cursor.execute('''
+                ALTER TABLE ocr_data ADD COLUMN IF NOT EXISTS full_text TEXT
+            ''')
+            cursor.execute('''
+                ALTER TABLE ocr_data ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS (
+                    to_tsvector('russian'::regconfig, coalesce(full_text, ocr_text, '')) ||
+                    to_tsvector('english'::regconfig, coalesce(full_text, ocr_text, ''))
+                ) STORED
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_ocr_data_search ON ocr_data USING GIN (search_vector)
+            ''')
+            
+            # Слова OCR с координатами (пиксели страницы при 150 DPI) и пространственным индексом
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ocr_words (
+                    id SERIAL PRIMARY KEY,
+                    project_id TEXT NOT NULL,
+                    page_num INTEGER NOT NULL,
+                    word TEXT NOT NULL,
+                    conf REAL,
+                    x REAL NOT NULL,
+                    y REAL NOT NULL,
+                    w REAL NOT NULL,
+                    h REAL NOT NULL,
+                    box BOX GENERATED ALWAYS AS (box(point(x, y), point(x + w, y + h))) STORED,
+                    FOREIGN KEY (project_id) REFERENCES projects (project_id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_ocr_words_page ON ocr_words (project_id, page_num)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_ocr_words_box ON ocr_words USING GIST (box)
+            ''')
+            
+            # Реестр моделей: версии по типу модели и одна активная версия на тип
+            cursor.execute('''
+                ALTER TABLE models ADD COLUMN IF NOT EXISTS version INTEGER
+            ''')
+            cursor.execute('''
+                ALTER TABLE models ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT FALSE
+            ''')
+            cursor.execute('''
+                ALTER TABLE models ADD COLUMN IF NOT EXISTS metadata JSONB
+            ''')
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_models_type_version ON models (model_type, version)
+            ''')
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_models_active ON models (model_type) WHERE is_active
+            ''')
+            
             conn.commit()
             print("✅ Таблицы PostgreSQL созданы/проверены")
+            return True
             
         except Exception as e:
             print(f"❌ Ошибка инициализации БД: {e}")
             if conn:
                 conn.rollback()
+            return False
         finally:
             if conn:
                 conn.close()
     
+    def create_project(self, project_id, original_filename, total_pages,
+                       content_hash=None, source_project_id=None):
+        """Создание записи проекта"""
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO projects (project_id, original_filename, total_pages, content_hash, source_project_id)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (project_id) DO UPDATE SET
+                    total_pages = EXCLUDED.total_pages,
+                    content_hash = COALESCE(EXCLUDED.content_hash, projects.content_hash),
+                    source_project_id = COALESCE(EXCLUDED.source_project_id, projects.source_project_id)
+            ''', (project_id, original_filename, total_pages, content_hash, source_project_id))
+            
+            conn.commit()
+            print(f"✅ Проект создан в базе данных: {project_id}")
+            return True
+            
+        except Exception as e:
+            print(f"⚠️ Не удалось создать проект в базе: {e}")
+            if conn:
+                conn.rollback()
+            return False
+        finally:
+            if conn:
+                self.return_connection(conn)
+    
+    def find_project_by_hash(self, content_hash):
+        """Поиск исходного (не связанного) проекта с тем же содержимым PDF"""
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT project_id FROM projects
+                WHERE content_hash = %s AND source_project_id IS NULL
+                ORDER BY created_at
+            ''', (content_hash,))
+            
+            return [row[0] for row in cursor.fetchall()]
+            
+        except Exception as e:
+            print(f"⚠️ Ошибка поиска проекта по хэшу: {e}")
+            return []
+        finally:
+            if conn:
+                self.return_connection(conn)
+    
+    def copy_project_results(self, source_project_id, project_id):
+        """Копирование OCR данных и авторазметок исходного проекта в новый"""
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO ocr_data
+                (project_id, page_num, ocr_text, full_text, measurements, keywords, measurements_count, has_architectural_data)
+                SELECT %s, page_num, ocr_text, full_text, measurements, keywords, measurements_count, has_architectural_data
+                FROM ocr_data WHERE project_id = %s
+                ON CONFLICT (project_id, page_num) DO NOTHING
+            ''', (project_id, source_project_id))
+            ocr_rows = cursor.rowcount
+
+            # Слова копируемых страниц перезаписываются, как при сохранении страницы,
+            # чтобы повторная привязка не удваивала слова
+            cursor.execute('''
+                DELETE FROM ocr_words
+                WHERE project_id = %s
+                  AND page_num IN (SELECT DISTINCT page_num FROM ocr_words WHERE project_id = %s)
+            ''', (project_id, source_project_id))
+            cursor.execute('''
+                INSERT INTO ocr_words (project_id, page_num, word, conf, x, y, w, h)
+                SELECT %s, page_num, word, conf, x, y, w, h
+                FROM ocr_words WHERE project_id = %s
+            ''', (project_id, source_project_id))
+            
+            # Переносим только автоматические обнаружения, ручная разметка остается у автора
+            cursor.execute('''
+                INSERT INTO markups (project_id, page_num, markup_data, is_training)
+                SELECT %s, page_num,
+                       jsonb_set(markup_data::jsonb, '{project_id}', to_jsonb(%s::text))::text,
+                       is_training
+                FROM markups
+                WHERE project_id = %s AND markup_data::jsonb ->> 'auto_detected' = 'true'
+            ''', (project_id, project_id, source_project_id))
+            markup_rows = cursor.rowcount
+            
+            conn.commit()
+            print(f"✅ Результаты {source_project_id} связаны с {project_id}: OCR {ocr_rows}, авторазметок {markup_rows}")
+            return {'ocr_rows': ocr_rows, 'markup_rows': markup_rows}
+            
+        except Exception as e:
+            print(f"❌ Ошибка копирования результатов проекта: {e}")
+            if conn:
+                conn.rollback()
+            return None
+        finally:
+            if conn:
+                self.return_connection(conn)
+    
     def save_ocr_data(self, project_id, page_num, ocr_result):
         """Сохранение OCR данных в базу"""
         conn = None
@@ -149,11 +363,12 @@ class Database:
             
             cursor.execute('''
                 INSERT INTO ocr_data 
-                (project_id, page_num, ocr_text, measurements, keywords, measurements_count, has_architectural_data)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                (project_id, page_num, ocr_text, full_text, measurements, keywords, measurements_count, has_architectural_data)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
                 ON CONFLICT (project_id, page_num) 
                 DO UPDATE SET 
                     ocr_text = EXCLUDED.ocr_text,
+                    full_text = EXCLUDED.full_text,
                     measurements = EXCLUDED.measurements,
                     keywords = EXCLUDED.keywords,
                     measurements_count = EXCLUDED.measurements_count,
@@ -163,12 +378,26 @@ class Database:
                 project_id, 
                 page_num,
                 ocr_result.get('text_preview', ''),
+                ocr_result.get('text', ocr_result.get('text_preview', '')),
                 json.dumps(ocr_result.get('measurements', [])),
                 json.dumps(ocr_result.get('keywords', [])),
                 ocr_result.get('measurements_count', 0),
                 ocr_result.get('has_architectural_data', False)
             ))
             
+            # Слова страницы перезаписываются целиком в той же транзакции
+            cursor.execute('''
+                DELETE FROM ocr_words WHERE project_id = %s AND page_num = %s
+            ''', (project_id, page_num))
+            words = ocr_result.get('words') or []
+            if words:
+                execute_values(cursor, '''
+                    INSERT INTO ocr_words (project_id, page_num, word, conf, x, y, w, h) VALUES %s
+                ''', [
+                    (project_id, page_num, w['text'], w.get('conf'), w['x'], w['y'], w['w'], w['h'])
+                    for w in words
+                ])
+            
             conn.commit()
             print(f"✅ OCR данные сохранены: проект {project_id}, стр. {page_num}")
             return True
@@ -182,6 +411,108 @@ class Database:
             if conn:
                 self.return_connection(conn)
     
+    def search_ocr(self, query, limit=20, offset=0):
+        """
+        Полнотекстовый поиск по распознанному тексту всех страниц
+        Запрос в синтаксисе websearch ("точная фраза", -исключить, or), русская и английская морфология
+        Возвращает: {'total': всего совпадений, 'results': [{project_id, page_num, rank, headline, ...}]}
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            # Подсветка считается только для страницы результатов, а не для всех совпадений
+            cursor.execute('''
+                WITH q AS (
+                    SELECT websearch_to_tsquery('russian', %s) || websearch_to_tsquery('english', %s) AS query
+                ),
+                hits AS (
+                    SELECT o.id, ts_rank(o.search_vector, q.query) AS rank, count(*) OVER () AS total
+                    FROM ocr_data o, q
+                    WHERE o.search_vector @@ q.query
+                    ORDER BY rank DESC, o.id
+                    LIMIT %s OFFSET %s
+                )
+                SELECT o.project_id, p.original_filename, o.page_num, hits.rank, hits.total,
+                       ts_headline('russian', coalesce(o.full_text, o.ocr_text, ''), q.query,
+                                   'StartSel=<mark>, StopSel=</mark>, MaxFragments=3, MaxWords=20, MinWords=5')
+                FROM hits
+                JOIN ocr_data o ON o.id = hits.id
+                JOIN projects p ON p.project_id = o.project_id
+                CROSS JOIN q
+                ORDER BY hits.rank DESC, o.id
+            ''', (query, query, limit, offset))
+            
+            rows = cursor.fetchall()
+            results = [{
+                'project_id': row[0],
+                'original_filename': row[1],
+                'page_num': row[2],
+                'rank': round(float(row[3]), 4),
+                'headline': row[5]
+            } for row in rows]
+            
+            return {'total': rows[0][4] if rows else 0, 'results': results}
+            
+        except Exception as e:
+            print(f"❌ Ошибка полнотекстового поиска: {e}")
+            return {'total': 0, 'results': [], 'error': str(e)}
+        finally:
+            if conn:
+                self.return_connection(conn)
+    
+    def find_ocr_words(self, project_id, page_num, x=None, y=None, radius=None, rect=None, limit=50):
+        """
+        Слова страницы рядом с точкой или внутри прямоугольника (через GiST индекс по box)
+        x, y, radius: слова, рамка которых ближе radius пикселей к точке (ближайшие первыми)
+        rect: (x1, y1, x2, y2) - слова, пересекающие прямоугольник
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            if rect is not None:
+                x1, y1, x2, y2 = rect
+                cursor.execute('''
+                    SELECT word, conf, x, y, w, h, NULL
+                    FROM ocr_words
+                    WHERE project_id = %s AND page_num = %s
+                      AND box && box(point(%s, %s), point(%s, %s))
+                    ORDER BY y, x
+                    LIMIT %s
+                ''', (project_id, page_num, x1, y1, x2, y2, limit))
+            else:
+                cursor.execute('''
+                    SELECT word, conf, x, y, w, h, point(%s, %s) <-> box AS distance
+                    FROM ocr_words
+                    WHERE project_id = %s AND page_num = %s
+                      AND box && box(point(%s, %s), point(%s, %s))
+                      AND point(%s, %s) <-> box <= %s
+                    ORDER BY distance
+                    LIMIT %s
+                ''', (x, y, project_id, page_num,
+                      x - radius, y - radius, x + radius, y + radius,
+                      x, y, radius, limit))
+            
+            return [{
+                'text': row[0],
+                'conf': row[1],
+                'x': row[2],
+                'y': row[3],
+                'w': row[4],
+                'h': row[5],
+                **({'distance': round(row[6], 1)} if row[6] is not None else {})
+            } for row in cursor.fetchall()]
+            
+        except Exception as e:
+            print(f"❌ Ошибка поиска слов на странице: {e}")
+            return []
+        finally:
+            if conn:
+                self.return_connection(conn)
+    
     def get_ocr_data(self, project_id, page_num=None):
         """Получение OCR данных"""
         conn = None
@@ -207,6 +538,7 @@ class Database:
             results = []
             for row in rows:
                 result = dict(zip(column_names, row))
+                result.pop('search_vector', None)
                 # Парсим JSON поля
                 if result.get('measurements'):
                     result['measurements'] = json.loads(result['measurements'])
@@ -514,6 +846,142 @@ class Database:
             if conn:
                 self.return_connection(conn)
     
+    def register_model(self, model_name, model_type, model_path, accuracy=0.0,
+                       training_samples=0, metadata=None):
+        """Регистрация новой версии модели (номер версии - следующий для типа)"""
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            # Номер версии выдается под блокировкой типа модели до конца транзакции
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (model_type,))
+            cursor.execute('''
+                INSERT INTO models (model_name, model_type, model_path, accuracy,
+                                    training_samples, metadata, version)
+                VALUES (%s, %s, %s, %s, %s, %s,
+                        (SELECT COALESCE(MAX(version), 0) + 1 FROM models WHERE model_type = %s))
+                RETURNING id
+            ''', (model_name, model_type, str(model_path), float(accuracy or 0.0),
+                  int(training_samples or 0), json.dumps(metadata or {}), model_type))
+            model_id = cursor.fetchone()[0]
+            
+            conn.commit()
+            return self.get_model(model_id)
+            
+        except Exception as e:
+            print(f"❌ Ошибка регистрации модели: {e}")
+            if conn:
+                conn.rollback()
+            return None
+        finally:
+            if conn:
+                self.return_connection(conn)
+    
+    def _model_rows(self, cursor):
+        column_names = [desc[0] for desc in cursor.description]
+        models = []
+        for row in cursor.fetchall():
+            model = dict(zip(column_names, row))
+            for field in ('created_at', 'updated_at'):
+                if model.get(field):
+                    model[field] = model[field].isoformat()
+            models.append(model)
+        return models
+    
+    def get_model(self, model_id):
+        """Запись модели по id"""
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM models WHERE id = %s', (model_id,))
+            models = self._model_rows(cursor)
+            return models[0] if models else None
+            
+        except Exception as e:
+            print(f"❌ Ошибка получения модели: {e}")
+            return None
+        finally:
+            if conn:
+                self.return_connection(conn)
+    
+    def list_models(self, model_type=None):
+        """Версии моделей (новые первыми)"""
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            if model_type:
+                cursor.execute('''
+                    SELECT * FROM models WHERE model_type = %s ORDER BY version DESC NULLS LAST, id DESC
+                ''', (model_type,))
+            else:
+                cursor.execute('''
+                    SELECT * FROM models ORDER BY model_type, version DESC NULLS LAST, id DESC
+                ''')
+            return self._model_rows(cursor)
+            
+        except Exception as e:
+            print(f"❌ Ошибка получения списка моделей: {e}")
+            return []
+        finally:
+            if conn:
+                self.return_connection(conn)
+    
+    def get_active_model(self, model_type):
+        """Активная версия модели типа (или None)"""
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM models WHERE model_type = %s AND is_active
+            ''', (model_type,))
+            models = self._model_rows(cursor)
+            return models[0] if models else None
+            
+        except Exception as e:
+            print(f"❌ Ошибка получения активной модели: {e}")
+            return None
+        finally:
+            if conn:
+                self.return_connection(conn)
+    
+    def activate_model(self, model_id):
+        """Атомарное переключение активной версии: в одной транзакции снимается старая и ставится новая"""
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT model_type FROM models WHERE id = %s', (model_id,))
+            row = cursor.fetchone()
+            if not row:
+                return False
+            
+            cursor.execute('''
+                UPDATE models SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
+                WHERE model_type = %s AND is_active AND id <> %s
+            ''', (row[0], model_id))
+            cursor.execute('''
+                UPDATE models SET is_active = TRUE, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (model_id,))
+            
+            conn.commit()
+            return True
+            
+        except Exception as e:
+            print(f"❌ Ошибка активации модели: {e}")
+            if conn:
+                conn.rollback()
+            return False
+        finally:
+            if conn:
+                self.return_connection(conn)
+    
     def save_prediction(self, project_id, page_num, prediction_data, confidence):
         """Сохранение предсказания ИИ"""
         conn = None
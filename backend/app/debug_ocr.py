@@ -5,6 +5,7 @@ import os
 from pathlib import Path
 from database import db
 from ocr_processor import ocr_processor
+from ocr_cache import ocr_cache
 
 # Берем последний проект
 base_dir = Path("C:/smet4ik/backend/uploaded_pdfs")
@@ -39,6 +40,7 @@ if metadata_file.exists():
             result = ocr_processor.analyze_page(images[0])
             print(f"   Найдено размеров: {result['measurements_count']}")
             print(f"   Ключевые слова: {result['keywords']}")
+            print(f"   Кэш OCR: {ocr_cache.stats()}")
             
             # 4. Пробуем сохранить в базу
             print("4. Сохраняем в базу...")
@@ -0,0 +1,137 @@
+# job_queue.py - Фоновая очередь задач обработки PDF
+import os
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class JobQueue:
+    """
+    Очередь фоновых задач с ограниченным пулом воркеров.
+    Хранит состояние задач и постраничный прогресс в памяти процесса.
+    """
+
+    def __init__(self, max_workers=None, max_finished_jobs=200):
+        self.max_workers = max_workers or int(os.getenv('JOB_WORKERS', '2'))
+        self.max_finished_jobs = max_finished_jobs
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='smet4ik-job'
+        )
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+        print(f"✅ Очередь задач запущена, воркеров: {self.max_workers}")
+
+    def create_job(self, job_type, project_id, total_pages=0):
+        """Создание новой задачи в статусе queued"""
+        job_id = uuid.uuid4().hex[:12]
+        now = datetime.now().isoformat()
+
+        with self.lock:
+            self.jobs[job_id] = {
+                'job_id': job_id,
+                'job_type': job_type,
+                'project_id': project_id,
+                'status': 'queued',
+                'total_pages': total_pages,
+                'pages': {},
+                'error': None,
+                'result': None,
+                'created_at': now,
+                'started_at': None,
+                'finished_at': None
+            }
+            self._cleanup_finished()
+
+        return job_id
+
+    def submit(self, job_id, func, *args, **kwargs):
+        """Постановка задачи в пул. func вызывается как func(job_id, *args, **kwargs)"""
+        return self.executor.submit(self._run, job_id, func, args, kwargs)
+
+    def _run(self, job_id, func, args, kwargs):
+        self._update(job_id, status='running', started_at=datetime.now().isoformat())
+        try:
+            result = func(job_id, *args, **kwargs)
+            self._update(job_id, status='completed', result=result,
+                         finished_at=datetime.now().isoformat())
+            return result
+        except Exception as e:
+            print(f"❌ Ошибка задачи {job_id}: {e}")
+            traceback.print_exc()
+            self._update(job_id, status='failed', error=str(e),
+                         finished_at=datetime.now().isoformat())
+            return None
+
+    def _update(self, job_id, **fields):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def set_total_pages(self, job_id, total_pages):
+        """Обновление общего числа страниц задачи"""
+        self._update(job_id, total_pages=total_pages)
+
+    def update_page(self, job_id, page_num, status, **info):
+        """Обновление статуса отдельной страницы (pending/processing/done/failed)"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            page = job['pages'].setdefault(page_num, {'page_num': page_num})
+            page['status'] = status
+            page['updated_at'] = datetime.now().isoformat()
+            page.update(info)
+
+    def get_job(self, job_id):
+        """Снимок состояния задачи с посчитанным прогрессом"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+
+            pages = [dict(p) for _, p in sorted(job['pages'].items())]
+            snapshot = {**job, 'pages': pages}
+
+        done = sum(1 for p in pages if p['status'] in ('done', 'failed'))
+        total = snapshot['total_pages'] or 0
+        snapshot['pages_done'] = done
+        snapshot['progress'] = round(done / total * 100, 1) if total else 0.0
+        if snapshot['status'] == 'completed':
+            snapshot['progress'] = 100.0
+        return snapshot
+
+    def list_jobs(self, project_id=None):
+        """Краткий список задач (новые сначала)"""
+        with self.lock:
+            jobs = [j for j in self.jobs.values()
+                    if project_id is None or j['project_id'] == project_id]
+            summary = [{
+                'job_id': j['job_id'],
+                'job_type': j['job_type'],
+                'project_id': j['project_id'],
+                'status': j['status'],
+                'total_pages': j['total_pages'],
+                'created_at': j['created_at']
+            } for j in jobs]
+
+        summary.sort(key=lambda j: j['created_at'], reverse=True)
+        return summary
+
+    def _cleanup_finished(self):
+        """Удаление самых старых завершенных задач сверх лимита (вызывается под lock)"""
+        finished = [j for j in self.jobs.values() if j['status'] in ('completed', 'failed')]
+        if len(finished) <= self.max_finished_jobs:
+            return
+
+        finished.sort(key=lambda j: j['finished_at'] or j['created_at'])
+        for job in finished[:len(finished) - self.max_finished_jobs]:
+            del self.jobs[job['job_id']]
+
+
+# Глобальный экземпляр очереди
+job_queue = JobQueue()
@@ -3,15 +3,19 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import fitz  # PyMuPDF
-from PIL import Image
 import shutil
 import uuid
+import hashlib
+import threading
+import time
+import itertools
+from contextlib import asynccontextmanager
 from pathlib import Path
 import json
-import io
 from dotenv import load_dotenv
 import os
 
@@ -22,9 +26,15 @@ APP_VERSION = os.getenv('APP_VERSION', '0.9.0')
 APP_NAME = os.getenv('APP_NAME', 'Smet4ik AI Trainer')
 
 # Импортируем реальные модули - без заглушек!
-from ml_model import wall_model
+from model_registry import model_registry
 from database import db
-from ocr_processor import ocr_processor
+from ocr_processor import ocr_processor, OCR_WORKERS
+from job_queue import job_queue
+from ocr_cache import ocr_cache
+from tiles import tile_pyramid
+from pdf_renderer import (convert_pdf_to_images_fitz, iter_rendered_pages, get_page_sizes,
+                          extract_text_layers,
+                          document_cache, RENDER_WORKERS)
 
 # Создаем папки для хранения данных
 UPLOAD_DIR = Path("uploaded_pdfs")
@@ -36,46 +46,76 @@ os.makedirs(PROCESSED_DIR, exist_ok=True)
 MARKUPS_DIR = Path("markups")
 MARKUPS_DIR.mkdir(exist_ok=True)
 
-app = FastAPI(title=f"{APP_NAME} API", version=APP_VERSION)
+# Размер блока при потоковом сохранении загрузки
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Ленивый режим: при загрузке только размеры страниц, рендер и OCR - при первом открытии
+LAZY_RENDERING = os.getenv('LAZY_RENDERING', '0') == '1'
+
+# Режим автообнаружения стен по умолчанию: yolo, vector или auto
+DETECTION_MODE = os.getenv('DETECTION_MODE', 'yolo')
+
+# Строить пирамиду тайлов сразу при загрузке (иначе - при первом запросе тайла)
+TILES_PRECOMPUTE = os.getenv('TILES_PRECOMPUTE', '0') == '1'
+
+# Блокировка записи metadata.json из фоновых задач
+metadata_lock = threading.Lock()
+# Страницы, для которых уже поставлена фоновая обработка: (project_id, page_num) -> job_id
+pending_page_jobs = {}
+
+# Автообнаружение стен сразу при загрузке (на том же буфере страницы, что и OCR)
+AUTO_DETECT_ON_UPLOAD = os.getenv('AUTO_DETECT_ON_UPLOAD', '0') == '1'
+
+# Прогрев моделей в фоне после старта (иначе torch/ultralytics грузятся в первом запросе)
+WARMUP_ON_STARTUP = os.getenv('WARMUP_ON_STARTUP', '1') == '1'
+
+# Состояние запуска для /health/ready
+startup_state = {
+    "database": "pending",
+    "models": "pending" if WARMUP_ON_STARTUP else "lazy",
+    "warmup_ms": None,
+    "error": None
+}
+
+def warm_up_models():
+    """Фоновый прогрев: импорт и загрузка активных моделей, пробный инференс YOLO, движок OCR"""
+    started = time.perf_counter()
+    startup_state["models"] = "warming"
+    try:
+        cv_model = model_registry.get_active('yolo')
+        cv_model.warm_up()
+        model_registry.get_active('random_forest')
+        ocr_processor.get_engine()
+        
+        startup_state["models"] = "ready"
+        startup_state["warmup_ms"] = round((time.perf_counter() - started) * 1000)
+        print(f"🔥 Модели прогреты за {startup_state['warmup_ms']} мс")
+    except Exception as e:
+        startup_state["models"] = "failed"
+        startup_state["error"] = str(e)
+        print(f"⚠️ Ошибка прогрева моделей: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    """Запуск: проверка схемы БД (с повторами), затем прогрев моделей в фоне"""
+    db_ready = await run_in_threadpool(db.connect)
+    startup_state["database"] = "ready" if db_ready else "unavailable"
+    
+    if WARMUP_ON_STARTUP:
+        # Сервер начинает принимать запросы, не дожидаясь загрузки моделей
+        threading.Thread(target=warm_up_models, name='smet4ik-warmup', daemon=True).start()
+    
+    yield
+    
+    ocr_processor.shutdown_pool()
+
+app = FastAPI(title=f"{APP_NAME} API", version=APP_VERSION, lifespan=lifespan)
 
 # Статические файлы (для будущего фронтенда)
 import os
 static_path = os.path.join(os.path.dirname(__file__), "static")
 app.mount("/static", StaticFiles(directory=static_path), name="static")
 
-def convert_pdf_to_images_fitz(pdf_path: Path, output_dir: Path, dpi=150):
-    """Конвертация PDF в изображения с использованием PyMuPDF"""
-    images = []
-    
-    try:
-        # Открываем PDF
-        doc = fitz.open(str(pdf_path))
-        print(f"PDF открыт успешно. Страниц: {len(doc)}")
-        
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            # Увеличиваем DPI для качества
-            mat = fitz.Matrix(dpi / 72, dpi / 72)
-            pix = page.get_pixmap(matrix=mat)
-            
-            # Конвертируем в JPEG
-            img_data = pix.tobytes("jpeg")
-            img = Image.open(io.BytesIO(img_data))
-            
-            # Сохраняем изображение
-            output_path = output_dir / f"page_{page_num + 1:03d}.jpg"
-            img.save(output_path, "JPEG", quality=95)
-            images.append(str(output_path))
-            
-            print(f"Страница {page_num + 1} сконвертирована: {output_path}")
-        
-        doc.close()
-        return images
-        
-    except Exception as e:
-        print(f"Ошибка конвертации PDF: {e}")
-        raise
-
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
     """Главная страница тренажера с формой загрузки"""
@@ -261,23 +301,20 @@ async def read_root():
                     
                     const result = await response.json();
                     
-                    if (response.ok) {
-                        let ocrInfo = '';
-                        if (result.ocr_results && result.ocr_results.length > 0) {
-                            ocrInfo = '<div class="ocr-info">';
-                            ocrInfo += '<h4>📊 Результаты OCR анализа:</h4>';
-                            ocrInfo += `<p><strong>Всего страниц:</strong> ${result.total_pages}</p>`;
-                            ocrInfo += `<p><strong>OCR сохранен в базу:</strong> ${result.ocr_saved_to_db ? '✅ Да' : '❌ Нет'}</p>`;
-                            ocrInfo += '</div>';
-                        }
-                        
+                    if (response.ok && !result.job_id) {
                         statusText.innerHTML = `
-                            ✅ Файл успешно загружен!<br>
+                            ${result.deduplicated ? '♻️ Этот PDF уже обрабатывался, результаты переиспользованы!' : '✅ Файл загружен, страницы обработаются при открытии'}<br>
                             <strong>ID проекта:</strong> ${result.project_id}<br>
                             <strong>Страниц:</strong> ${result.total_pages}<br>
-                            ${ocrInfo}
                             <a href="/project/${result.project_id}/" target="_blank">📁 Перейти к просмотру проекта</a>
                         `;
+                    } else if (response.ok) {
+                        statusText.innerHTML = `
+                            ⏳ Файл загружен, идет обработка...<br>
+                            <strong>ID проекта:</strong> ${result.project_id}<br>
+                            <strong>Страниц:</strong> ${result.total_pages}
+                        `;
+                        await pollJob(result.job_id, result.project_id);
                     } else {
                         statusText.textContent = `❌ Ошибка: ${result.detail || 'Неизвестная ошибка'}`;
                     }
@@ -287,6 +324,44 @@ async def read_root():
                     uploadBtn.disabled = false;
                 }
             }
+
+            async function pollJob(jobId, projectId) {
+                const progress = document.getElementById('progress');
+
+                while (true) {
+                    const response = await fetch(`/api/jobs/${jobId}`);
+                    const job = await response.json();
+
+                    if (!response.ok) {
+                        statusText.textContent = `❌ Ошибка: ${job.detail || 'Задача не найдена'}`;
+                        return;
+                    }
+
+                    progress.innerHTML = `<div class="ocr-stat">Обработано страниц: ${job.pages_done} из ${job.total_pages} (${job.progress}%)</div>`;
+
+                    if (job.status === 'completed') {
+                        const ocrSaved = job.result && job.result.ocr_saved_to_db;
+                        statusText.innerHTML = `
+                            ✅ Файл успешно обработан!<br>
+                            <strong>ID проекта:</strong> ${projectId}<br>
+                            <strong>Страниц:</strong> ${job.total_pages}<br>
+                            <div class="ocr-info">
+                                <h4>📊 Результаты OCR анализа:</h4>
+                                <p><strong>OCR сохранен в базу:</strong> ${ocrSaved ? '✅ Да' : '❌ Нет'}</p>
+                            </div>
+                            <a href="/project/${projectId}/" target="_blank">📁 Перейти к просмотру проекта</a>
+                        `;
+                        return;
+                    }
+
+                    if (job.status === 'failed') {
+                        statusText.textContent = `❌ Ошибка обработки: ${job.error || 'Неизвестная ошибка'}`;
+                        return;
+                    }
+
+                    await new Promise(resolve => setTimeout(resolve, 1500));
+                }
+            }
         </script>
     </body>
     </html>
@@ -300,9 +375,311 @@ async def marker_interface():
         html_content = f.read()
     return HTMLResponse(content=html_content)
 
+def save_project_metadata(project_dir: Path, metadata: dict):
+    """Запись metadata.json проекта"""
+    metadata_path = project_dir / "metadata.json"
+    with open(metadata_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    return metadata_path
+
+def load_project_metadata(project_id: str):
+    """Чтение metadata.json проекта (None если проекта нет)"""
+    metadata_file = UPLOAD_DIR / project_id / "metadata.json"
+    if not metadata_file.exists():
+        return None
+    with open(metadata_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def get_images_project_id(project_id: str) -> str:
+    """ID проекта, в чьей папке лежат изображения (для связанных дубликатов - исходный)"""
+    metadata = load_project_metadata(project_id)
+    if metadata and metadata.get("images_project_id"):
+        return metadata["images_project_id"]
+    return project_id
+
+def link_duplicate_project(project_id: str, original_filename: str, content_hash: str,
+                           source_metadata: dict):
+    """Связывание нового проекта с уже обработанным PDF того же содержимого"""
+    source_project_id = source_metadata["project_id"]
+    images_project_id = source_metadata.get("images_project_id", source_project_id)
+    
+    pages_info = []
+    for page in source_metadata.get("pages", []):
+        pages_info.append({
+            **page,
+            "image_url": f"/project/{project_id}/page/{page['page_num']}/image"
+        })
+    
+    db.create_project(project_id, original_filename, source_metadata["total_pages"],
+                      content_hash=content_hash, source_project_id=source_project_id)
+    copied = db.copy_project_results(source_project_id, project_id)
+    
+    metadata = {
+        **source_metadata,
+        "project_id": project_id,
+        "original_filename": original_filename,
+        "pages": pages_info,
+        "status": "uploaded",
+        "job_id": None,
+        "content_hash": content_hash,
+        "source_project_id": source_project_id,
+        "images_project_id": images_project_id,
+        "deduplicated": True,
+        "ocr_saved_to_db": bool(copied and copied['ocr_rows'])
+    }
+    save_project_metadata(UPLOAD_DIR / project_id, metadata)
+    return metadata
+
+def update_page_metadata(project_id: str, page_num: int, **fields):
+    """Атомарное обновление записи страницы в metadata.json"""
+    with metadata_lock:
+        metadata = load_project_metadata(project_id)
+        if metadata is None:
+            return None
+        
+        for page in metadata["pages"]:
+            if page["page_num"] == page_num:
+                page.update(fields)
+                break
+        
+        metadata["ocr_saved_to_db"] = metadata.get("ocr_saved_to_db") or bool(fields.get("ocr_saved_to_db"))
+        save_project_metadata(UPLOAD_DIR / project_id, metadata)
+        return metadata
+
+def render_lazy_page(project_id: str, page_num: int, metadata: dict) -> Path:
+    """Рендер страницы ленивого проекта по запросу (результат кэшируется на диске)"""
+    images_dir = PROCESSED_DIR / get_images_project_id(project_id)
+    image_path = images_dir / f"page_{page_num:03d}.jpg"
+    if image_path.exists():
+        return image_path
+    
+    os.makedirs(images_dir, exist_ok=True)
+    print(f"🖼️ Ленивый рендер: проект {project_id}, стр. {page_num}")
+    return Path(document_cache.render_page_to_file(Path(metadata["pdf_path"]), page_num, images_dir, dpi=150))
+
+def process_lazy_page_job(job_id: str, project_id: str, page_num: int):
+    """Фоновый OCR (и при включенном AUTO_DETECT_ON_UPLOAD - детекция) одной страницы"""
+    try:
+        metadata = load_project_metadata(project_id)
+        image_path = render_lazy_page(project_id, page_num, metadata)
+        job_queue.update_page(job_id, page_num, "processing")
+        
+        text_layer = document_cache.extract_text_layer(Path(metadata["pdf_path"]), page_num, dpi=150)
+        image = ocr_processor.load_gray(image_path)
+        ocr_result = ocr_processor.analyze_page(image, page_path=image_path, text_layer=text_layer)
+        ocr_saved = db.save_ocr_data(project_id, page_num, ocr_result)
+        
+        if AUTO_DETECT_ON_UPLOAD:
+            auto_detect_page(project_id, page_num, image)
+        
+        update_page_metadata(
+            project_id, page_num,
+            image_path=image_path.name,
+            rendered=True,
+            ocr_processed=True,
+            ocr_text_preview=ocr_result['text_preview'],
+            ocr_measurements=ocr_result['measurements'],
+            ocr_keywords=ocr_result['keywords'],
+            has_architectural_data=ocr_result['has_architectural_data'],
+            ocr_saved_to_db=ocr_saved
+        )
+        job_queue.update_page(job_id, page_num, "done",
+                              measurements_count=ocr_result['measurements_count'],
+                              saved_to_db=ocr_saved)
+        return {"project_id": project_id, "page_num": page_num, "ocr_saved_to_db": ocr_saved}
+    finally:
+        with metadata_lock:
+            pending_page_jobs.pop((project_id, page_num), None)
+
+def ensure_page_processed(project_id: str, page_num: int, metadata: dict, force: bool = False):
+    """Постановка OCR страницы ленивого проекта в очередь, если он еще не выполнен"""
+    page = next((p for p in metadata["pages"] if p["page_num"] == page_num), None)
+    if page is None:
+        return None
+    if page.get("ocr_processed") and not force:
+        return None
+    
+    with metadata_lock:
+        job_id = pending_page_jobs.get((project_id, page_num))
+        if job_id:
+            return job_id
+        job_id = job_queue.create_job("page_processing", project_id, 1)
+        pending_page_jobs[(project_id, page_num)] = job_id
+    
+    job_queue.submit(job_id, process_lazy_page_job, project_id, page_num)
+    return job_id
+
+def register_lazy_project(project_id: str, original_filename: str, pdf_path: Path, content_hash: str):
+    """Ленивая загрузка: сохраняем только число и размеры страниц"""
+    page_sizes = get_page_sizes(pdf_path, dpi=150)
+    db.create_project(project_id, original_filename, len(page_sizes), content_hash=content_hash)
+    
+    pages_info = [{
+        **size,
+        "image_path": f"page_{size['page_num']:03d}.jpg",
+        "image_url": f"/project/{project_id}/page/{size['page_num']}/image",
+        "rendered": False,
+        "ocr_processed": False
+    } for size in page_sizes]
+    
+    metadata = {
+        "project_id": project_id,
+        "original_filename": original_filename,
+        "pdf_path": str(pdf_path),
+        "pages": pages_info,
+        "total_pages": len(pages_info),
+        "ocr_results": [],
+        "status": "uploaded",
+        "lazy": True,
+        "content_hash": content_hash,
+        "converter": "PyMuPDF (fitz), по запросу",
+        "ocr_processed": False,
+        "ocr_saved_to_db": False
+    }
+    save_project_metadata(UPLOAD_DIR / project_id, metadata)
+    return metadata
+
+def auto_detect_page(project_id: str, page_num: int, image):
+    """Автообнаружение стен на уже отрендеренной странице (без чтения с диска)"""
+    cv_model = model_registry.get_active('yolo')
+    
+    detections = cv_model.detect_walls_hybrid(image)
+    if not detections:
+        return None
+    
+    markup = cv_model.convert_to_markup_format(detections, image)
+    markup['project_id'] = project_id
+    markup['page_num'] = page_num
+    markup['detection_method'] = "YOLO Auto-detection"
+    markup['auto_detected'] = True
+    
+    try:
+        return db.save_markup(project_id, page_num, markup, is_training=True)
+    except Exception as db_error:
+        print(f"⚠️ Не удалось сохранить авторазметку в БД: {db_error}")
+        return None
+
+def process_pdf_job(job_id: str, project_id: str, pdf_path: Path, original_filename: str,
+                    content_hash: str = None):
+    """Фоновая обработка загруженного PDF: конвертация, OCR и сохранение в базу"""
+    project_dir = UPLOAD_DIR / project_id
+    images_dir = PROCESSED_DIR / project_id
+    
+    with fitz.open(str(pdf_path)) as doc:
+        total_pages = len(doc)
+    job_queue.set_total_pages(job_id, total_pages)
+    
+    if RENDER_WORKERS > 1:
+        # Многопроцессный рендер: страницы приходят с диска
+        print(f"[{job_id}] Начало конвертации PDF в изображения...")
+        images = convert_pdf_to_images_fitz(pdf_path, images_dir, dpi=150)
+        print(f"[{job_id}] Конвертация завершена. Получено изображений: {len(images)}")
+        text_layers = extract_text_layers(pdf_path, dpi=150)
+        pages = ((i, img_path, None, text_layers[i - 1]) for i, img_path in enumerate(images, 1))
+    else:
+        # Однократный рендер: буфер страницы сразу идет в OCR и детекцию.
+        # Пул OCR читает страницы с упреждением, поэтому ему нужны копии буферов
+        pages = iter_rendered_pages(pdf_path, images_dir, dpi=150, copy=OCR_WORKERS > 1)
+    
+    # СОЗДАЕМ ПРОЕКТ В БАЗЕ ПЕРЕД OCR (ИСПРАВЛЕНИЕ!)
+    db.create_project(project_id, original_filename, total_pages, content_hash=content_hash)
+    
+    # Формируем информацию о страницах с OCR анализом
+    pages_info = []
+    ocr_results = []
+    
+    # OCR идет пакетно (в пуле процессов при OCR_WORKERS > 1), результаты - в порядке страниц
+    pages, ocr_pages = itertools.tee(pages)
+    
+    def ocr_inputs():
+        for i, img_path, image, text_layer in ocr_pages:
+            job_queue.update_page(job_id, i, "processing")
+            yield (image if image is not None else Path(img_path)), img_path, text_layer
+    
+    for (i, img_path, image, text_layer), ocr_result in zip(pages, ocr_processor.analyze_pages(ocr_inputs())):
+        img_filename = os.path.basename(img_path)
+        source = image if image is not None else Path(img_path)
+        
+        try:
+            if 'error' in ocr_result:
+                raise RuntimeError(ocr_result['error'])
+            
+            # Сохраняем OCR данные в базу данных
+            ocr_saved = db.save_ocr_data(project_id, i, ocr_result)
+            
+            if AUTO_DETECT_ON_UPLOAD:
+                auto_detect_page(project_id, i, source)
+            
+            if TILES_PRECOMPUTE:
+                tile_pyramid.ensure(Path(img_path), get_tiles_dir(project_id, i), image=image)
+        except Exception as e:
+            print(f"❌ Ошибка обработки страницы {i}: {e}")
+            job_queue.update_page(job_id, i, "failed", error=str(e))
+            continue
+        
+        pages_info.append({
+            "page_num": i,
+            "image_path": img_filename,
+            "image_url": f"/project/{project_id}/page/{i}/image",
+            "ocr_text_preview": ocr_result['text_preview'],
+            "ocr_measurements": ocr_result['measurements'],
+            "ocr_keywords": ocr_result['keywords'],
+            "has_architectural_data": ocr_result['has_architectural_data']
+        })
+        
+        ocr_results.append({
+            "page_num": i,
+            "text_source": ocr_result['text_source'],
+            "measurements_count": ocr_result['measurements_count'],
+            "keywords": ocr_result['keywords'],
+            "has_architectural_data": ocr_result['has_architectural_data'],
+            "saved_to_db": ocr_saved,
+            "ocr_timing": ocr_result['timing']
+        })
+        
+        job_queue.update_page(
+            job_id, i, "done",
+            measurements_count=ocr_result['measurements_count'],
+            saved_to_db=ocr_saved,
+            ocr_timing=ocr_result['timing']
+        )
+        print(f"📄 Страница {i}: {len(ocr_result['measurements'])} размеров, сохранено в базу: {'✅' if ocr_saved else '❌'}")
+    
+    # Сохраняем метаданные проекта
+    metadata = {
+        "project_id": project_id,
+        "original_filename": original_filename,
+        "pdf_path": str(pdf_path),
+        "pages": pages_info,
+        "total_pages": total_pages,
+        "ocr_results": ocr_results,
+        "status": "uploaded",
+        "job_id": job_id,
+        "content_hash": content_hash,
+        "converter": "PyMuPDF (fitz)",
+        "ocr_processed": True,
+        "ocr_saved_to_db": any(r.get('saved_to_db') for r in ocr_results)
+    }
+    
+    metadata_path = save_project_metadata(project_dir, metadata)
+    print(f"Метаданные сохранены: {metadata_path}")
+    
+    return {
+        "project_id": project_id,
+        "total_pages": total_pages,
+        "pages_processed": len(pages_info),
+        "ocr_saved_to_db": metadata['ocr_saved_to_db']
+    }
+
 @app.post("/upload-pdf/")
-async def upload_pdf(file: UploadFile = File(...)):
-    """Загрузка PDF файла и конвертация в изображения"""
+async def upload_pdf(file: UploadFile = File(...), lazy: bool = None):
+    """
+    Загрузка PDF файла: сохраняем файл и ставим обработку в фоновую очередь.
+    lazy=true - страницы рендерятся и распознаются только при первом открытии.
+    """
+    if lazy is None:
+        lazy = LAZY_RENDERING
+    
     try:
         # Генерируем уникальный ID для проекта
         project_id = str(uuid.uuid4())[:8]
@@ -314,102 +691,85 @@ async def upload_pdf(file: UploadFile = File(...)):
         print(f"Начало обработки PDF: {file.filename}")
         print(f"Project ID: {project_id}")
         
-        # Сохраняем PDF
+        # Сохраняем PDF, считая хэш содержимого на лету
         pdf_path = project_dir / file.filename
+        hasher = hashlib.sha256()
         with open(pdf_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        print(f"PDF сохранен: {pdf_path}")
-        
-        # Конвертируем PDF в изображения
-        print("Начало конвертации PDF в изображения...")
-        images = convert_pdf_to_images_fitz(pdf_path, images_dir, dpi=150)
-        print(f"Конвертация завершена. Получено изображений: {len(images)}")
-        
-        # СОЗДАЕМ ПРОЕКТ В БАЗЕ ПЕРЕД OCR (ИСПРАВЛЕНИЕ!)
-        try:
-            import psycopg2
-            conn = psycopg2.connect(
-                host='localhost',
-                port='5432',
-                database='smet4ik_db',
-                user='postgres',
-                password='123'
-            )
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO projects (project_id, original_filename, total_pages)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (project_id) DO NOTHING
-            ''', (project_id, file.filename, len(images)))
-            conn.commit()
-            conn.close()
-            print(f"✅ Проект создан в базе данных")
-        except Exception as e:
-            print(f"⚠️ Не удалось создать проект в базе: {e}")
-        
-        # Формируем информацию о страницах с OCR анализом
-        pages_info = []
-        ocr_results = []
-        
-        for i, img_path in enumerate(images, 1):
-            img_filename = os.path.basename(img_path)
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                buffer.write(chunk)
+        content_hash = hasher.hexdigest()
+        
+        print(f"PDF сохранен: {pdf_path} (sha256 {content_hash[:12]})")
+        
+        # Такой PDF уже обработан - переиспользуем страницы, OCR и обнаружения
+        for source_project_id in db.find_project_by_hash(content_hash):
+            source_metadata = load_project_metadata(source_project_id)
+            if not source_metadata or source_metadata.get("status") != "uploaded":
+                continue
             
-            # Выполняем OCR анализ страницы
-            print(f"🔍 Выполняем OCR анализ страницы {i}...")
-            ocr_result = ocr_processor.analyze_page(Path(img_path))
+            os.remove(pdf_path)
+            shutil.rmtree(images_dir, ignore_errors=True)
+            metadata = link_duplicate_project(project_id, file.filename, content_hash, source_metadata)
+            print(f"♻️ Повторная загрузка {source_project_id}, обработка пропущена")
             
-            # Сохраняем OCR данные в базу данных
-            ocr_saved = db.save_ocr_data(project_id, i, ocr_result)
-            
-            pages_info.append({
-                "page_num": i,
-                "image_path": img_filename,
-                "image_url": f"/project/{project_id}/page/{i}/image",
-                "ocr_text_preview": ocr_result['text_preview'],
-                "ocr_measurements": ocr_result['measurements'],
-                "ocr_keywords": ocr_result['keywords'],
-                "has_architectural_data": ocr_result['has_architectural_data']
-            })
-            
-            ocr_results.append({
-                "page_num": i,
-                "measurements_count": ocr_result['measurements_count'],
-                "keywords": ocr_result['keywords'],
-                "has_architectural_data": ocr_result['has_architectural_data'],
-                "saved_to_db": ocr_saved
-            })
-            
-            print(f"📄 Страница {i}: {len(ocr_result['measurements'])} размеров, сохранено в базу: {'✅' if ocr_saved else '❌'}")
+            return {
+                "message": "Этот PDF уже обрабатывался, результаты переиспользованы",
+                "project_id": project_id,
+                "job_id": None,
+                "status": "completed",
+                "deduplicated": True,
+                "source_project_id": source_project_id,
+                "total_pages": metadata["total_pages"],
+                "ocr_saved_to_db": metadata["ocr_saved_to_db"],
+                "converter": "PyMuPDF"
+            }
+        
+        if lazy:
+            metadata = register_lazy_project(project_id, file.filename, pdf_path, content_hash)
+            print(f"💤 Ленивый проект: {metadata['total_pages']} страниц, рендер по запросу")
+            return {
+                "message": "PDF загружен, страницы будут обработаны при открытии",
+                "project_id": project_id,
+                "job_id": None,
+                "status": "completed",
+                "lazy": True,
+                "total_pages": metadata["total_pages"],
+                "pages": metadata["pages"],
+                "converter": "PyMuPDF"
+            }
+        
+        # Проверяем что файл открывается и узнаем число страниц
+        with fitz.open(str(pdf_path)) as doc:
+            total_pages = len(doc)
         
-        # Сохраняем метаданные проекта
-        metadata = {
+        # Предварительные метаданные, чтобы проект был виден сразу
+        save_project_metadata(project_dir, {
             "project_id": project_id,
             "original_filename": file.filename,
             "pdf_path": str(pdf_path),
-            "pages": pages_info,
-            "total_pages": len(pages_info),
-            "ocr_results": ocr_results,
-            "status": "uploaded",
+            "pages": [],
+            "total_pages": total_pages,
+            "ocr_results": [],
+            "status": "processing",
+            "content_hash": content_hash,
             "converter": "PyMuPDF (fitz)",
-            "ocr_processed": True,
-            "ocr_saved_to_db": any(r.get('saved_to_db') for r in ocr_results)
-        }
-        
-        metadata_path = project_dir / "metadata.json"
-        with open(metadata_path, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
+            "ocr_processed": False,
+            "ocr_saved_to_db": False
+        })
         
-        print(f"Метаданные сохранены: {metadata_path}")
+        job_id = job_queue.create_job("pdf_processing", project_id, total_pages)
+        job_queue.submit(job_id, process_pdf_job, project_id, pdf_path, file.filename, content_hash)
+        print(f"📥 Задача {job_id} поставлена в очередь")
         
         return {
-            "message": "PDF успешно загружен и сконвертирован",
+            "message": "PDF загружен, обработка запущена в фоне",
             "project_id": project_id,
-            "pages": pages_info,
-            "ocr_results": ocr_results,
-            "total_pages": len(pages_info),
-            "converter": "PyMuPDF",
-            "ocr_saved_to_db": metadata['ocr_saved_to_db']
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/jobs/{job_id}",
+            "total_pages": total_pages,
+            "converter": "PyMuPDF"
         }
         
     except Exception as e:
@@ -418,6 +778,23 @@ async def upload_pdf(file: UploadFile = File(...)):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Ошибка обработки PDF: {str(e)}")
 
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Статус фоновой задачи с постраничным прогрессом"""
+    job = job_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+@app.get("/api/jobs/")
+async def list_jobs(project_id: str = None):
+    """Список фоновых задач"""
+    jobs = job_queue.list_jobs(project_id)
+    return {
+        "count": len(jobs),
+        "jobs": jobs
+    }
+
 @app.get("/project/{project_id}/")
 async def get_project(project_id: str):
     """Страница просмотра проекта"""
@@ -488,6 +865,7 @@ async def get_project(project_id: str):
             <h3>📄 Страница {page['page_num']} из {metadata['total_pages']}</h3>
             {ocr_info}
             <img src="{page['image_url']}" 
+                 loading="lazy"
                  alt="Страница {page['page_num']}"
                  style="max-width: 800px; border: 1px solid #ccc;">
             <p><a href="{page['image_url']}" target="_blank">Открыть в полном размере</a></p>
@@ -502,14 +880,23 @@ async def get_project(project_id: str):
     """
     return HTMLResponse(content=html_content)
 
-@app.get("/project/{project_id}/page/{page_num}/image")
-async def get_page_image(project_id: str, page_num: int):
-    """Получение изображения страницы"""
-    images_dir = PROCESSED_DIR / project_id
+def resolve_page_image(project_id: str, page_num: int) -> Path:
+    """Путь к изображению страницы (в ленивом режиме - рендер при первом запросе)"""
+    images_dir = PROCESSED_DIR / get_images_project_id(project_id)
     
     image_pattern = f"page_{page_num:03d}.jpg"
     image_path = images_dir / image_pattern
     
+    metadata = load_project_metadata(project_id)
+    if metadata and metadata.get("lazy"):
+        if page_num < 1 or page_num > metadata["total_pages"]:
+            raise HTTPException(status_code=404, detail="Страница не найдена")
+        if not image_path.exists():
+            image_path = render_lazy_page(project_id, page_num, metadata)
+        # OCR и детекция запускаются при первом открытии страницы
+        ensure_page_processed(project_id, page_num, metadata)
+        return image_path
+    
     if not image_path.exists():
         all_images = list(images_dir.glob("*.jpg")) + list(images_dir.glob("*.png"))
         if not all_images:
@@ -521,8 +908,103 @@ async def get_page_image(project_id: str, page_num: int):
         
         image_path = all_images[page_num - 1]
     
+    return image_path
+
+def get_tiles_dir(project_id: str, page_num: int) -> Path:
+    """Папка пирамиды тайлов страницы"""
+    return PROCESSED_DIR / get_images_project_id(project_id) / "tiles" / f"page_{page_num:03d}"
+
+@app.get("/project/{project_id}/page/{page_num}/image")
+async def get_page_image(project_id: str, page_num: int):
+    """Получение изображения страницы (в ленивом режиме - рендер при первом запросе)"""
+    image_path = await run_in_threadpool(resolve_page_image, project_id, page_num)
     return FileResponse(image_path)
 
+def load_tile_info(project_id: str, page_num: int):
+    image_path = resolve_page_image(project_id, page_num)
+    return tile_pyramid.ensure(image_path, get_tiles_dir(project_id, page_num))
+
+def load_tile(project_id: str, page_num: int, z: int, x: int, y: int):
+    image_path = resolve_page_image(project_id, page_num)
+    return tile_pyramid.get_tile(image_path, get_tiles_dir(project_id, page_num), z, x, y)
+
+@app.get("/project/{project_id}/page/{page_num}/tiles/info")
+async def get_page_tiles_info(project_id: str, page_num: int):
+    """Описание пирамиды тайлов страницы: размеры, размер тайла, уровни"""
+    info = await run_in_threadpool(load_tile_info, project_id, page_num)
+    return {
+        **info,
+        "tile_url": f"/project/{project_id}/page/{page_num}/tiles/{{z}}/{{x}}/{{y}}"
+    }
+
+@app.get("/project/{project_id}/page/{page_num}/tiles/{z}/{x}/{y}")
+async def get_page_tile(project_id: str, page_num: int, z: int, x: int, y: int):
+    """Тайл страницы уровня z (max_zoom - исходное разрешение)"""
+    tile_path = await run_in_threadpool(load_tile, project_id, page_num, z, x, y)
+    if tile_path is None:
+        raise HTTPException(status_code=404, detail="Тайл не найден")
+    return FileResponse(tile_path, headers={"Cache-Control": "public, max-age=86400"})
+
+@app.post("/project/{project_id}/page/{page_num}/process")
+async def process_page(project_id: str, page_num: int, force: bool = False):
+    """Явный запуск рендера и OCR страницы ленивого проекта"""
+    metadata = load_project_metadata(project_id)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="Проект не найден")
+    if not metadata.get("lazy"):
+        return {
+            "success": False,
+            "message": "Проект обработан при загрузке, ленивая обработка не требуется"
+        }
+    if page_num < 1 or page_num > metadata["total_pages"]:
+        raise HTTPException(status_code=404, detail="Страница не найдена")
+    
+    job_id = ensure_page_processed(project_id, page_num, metadata, force=force)
+    return {
+        "success": True,
+        "project_id": project_id,
+        "page_num": page_num,
+        "job_id": job_id,
+        "status_url": f"/api/jobs/{job_id}" if job_id else None,
+        "message": "Обработка страницы поставлена в очередь" if job_id else "Страница уже обработана"
+    }
+
+@app.get("/project/{project_id}/page/{page_num}/words")
+async def get_page_words(project_id: str, page_num: int,
+                         x: float = None, y: float = None, radius: float = 50,
+                         x1: float = None, y1: float = None, x2: float = None, y2: float = None,
+                         limit: int = 50):
+    """
+    Распознанные слова страницы по координатам (пиксели изображения страницы):
+    рядом с точкой (x, y, radius) или внутри прямоугольника (x1, y1, x2, y2)
+    """
+    limit = max(1, min(limit, 500))
+    
+    if None not in (x1, y1, x2, y2):
+        rect = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        words = await run_in_threadpool(db.find_ocr_words, project_id, page_num, rect=rect, limit=limit)
+        query = {"rect": rect}
+    elif x is not None and y is not None:
+        radius = max(0.0, radius)
+        words = await run_in_threadpool(db.find_ocr_words, project_id, page_num,
+                                        x=x, y=y, radius=radius, limit=limit)
+        query = {"point": [x, y], "radius": radius}
+    else:
+        return {
+            "success": False,
+            "message": "Укажите точку (x, y, radius) или прямоугольник (x1, y1, x2, y2)",
+            "words": []
+        }
+    
+    return {
+        "success": True,
+        "project_id": project_id,
+        "page_num": page_num,
+        "query": query,
+        "total": len(words),
+        "words": words
+    }
+
 @app.get("/api/ocr-data/{project_id}/")
 async def get_ocr_data(project_id: str, page_num: int = None):
     """Получение OCR данных из базы"""
@@ -553,6 +1035,35 @@ async def get_ocr_data(project_id: str, page_num: int = None):
             "data": []
         }
 
+@app.get("/api/search")
+async def search_ocr_text(q: str = "", limit: int = 20, offset: int = 0):
+    """Полнотекстовый поиск по распознанному тексту всех проектов и страниц"""
+    q = q.strip()
+    if not q:
+        return {"success": False, "message": "Пустой поисковый запрос", "total": 0, "results": []}
+    
+    limit = max(1, min(limit, 100))
+    started = time.perf_counter()
+    found = db.search_ocr(q, limit=limit, offset=max(0, offset))
+    took_ms = round((time.perf_counter() - started) * 1000, 1)
+    
+    if 'error' in found:
+        return {"success": False, "message": f"Ошибка поиска: {found['error']}", "total": 0, "results": []}
+    
+    for result in found['results']:
+        result['page_url'] = f"/project/{result['project_id']}/page/{result['page_num']}/image"
+    
+    return {
+        "success": True,
+        "message": f"Найдено страниц: {found['total']}",
+        "query": q,
+        "total": found['total'],
+        "limit": limit,
+        "offset": offset,
+        "took_ms": took_ms,
+        "results": found['results']
+    }
+
 @app.get("/health")
 async def health_check():
     """Проверка работоспособности сервера"""
@@ -575,24 +1086,46 @@ async def health_check():
         "markups_dir_exists": os.path.exists(MARKUPS_DIR),
         "converter": "PyMuPDF",
         "ocr_available": True,
-        "ocr_stats": ocr_stats
+        "ocr_stats": ocr_stats,
+        "ocr_cache": ocr_cache.stats()
     }
 
+@app.get("/health/live")
+async def health_live():
+    """Liveness: процесс отвечает (без обращения к БД и моделям)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: база подключена и модели прогреты (503, пока нет)"""
+    if startup_state["database"] != "ready" and db.ready:
+        startup_state["database"] = "ready"  # подключилась позже, при первом запросе к базе
+    
+    ready = startup_state["database"] == "ready" and startup_state["models"] in ("ready", "lazy")
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, **startup_state}
+    )
+
 # ========== ML MODEL API ENDPOINTS ==========
 
 @app.get("/api/model-status/")
 async def get_model_status():
     """Получение статуса ML модели"""
-    accuracy = 0
-    if wall_model.is_trained:
+    wall_model = await run_in_threadpool(model_registry.get_active, 'random_forest')
+    record = model_registry.status()['active'].get('random_forest') or {}
+    accuracy = record.get('accuracy') or 0
+    samples_trained = record.get('training_samples') or 0
+    
+    # Модель по умолчанию (без записи в реестре) - метаданные рядом с весами
+    if record.get('version') is None and wall_model.is_trained:
         try:
-            import json
-            from pathlib import Path
             metadata_path = Path("ml_models/model_metadata.json")
             if metadata_path.exists():
                 with open(metadata_path, 'r') as f:
                     metadata = json.load(f)
                     accuracy = metadata.get('last_accuracy', 0)
+                    samples_trained = metadata.get('samples_trained', 0)
         except:
             accuracy = 0
     
@@ -600,12 +1133,14 @@ async def get_model_status():
         "is_trained": wall_model.is_trained,
         "accuracy": accuracy,
         "model_type": "RandomForest",
-        "samples_trained": 0
+        "samples_trained": samples_trained,
+        "version": record.get('version')
     }
 
 @app.post("/api/analyze-markup/")
 async def analyze_markup(markup: dict):
     """Анализ разметки и извлечение признаков"""
+    wall_model = await run_in_threadpool(model_registry.get_active, 'random_forest')
     features = wall_model.extract_features(markup)
     
     return {
@@ -617,6 +1152,7 @@ async def analyze_markup(markup: dict):
 @app.post("/api/predict/")
 async def predict_walls(markup: dict):
     """Предсказание стен в разметке"""
+    wall_model = await run_in_threadpool(model_registry.get_active, 'random_forest')
     predictions = wall_model.predict_walls(markup)
     
     return {
@@ -640,7 +1176,8 @@ async def train_model():
                 "samples": 0
             }
         
-        result = wall_model.train(markups)
+        # Новая версия обучается отдельно и подменяет активную после сохранения
+        result = await run_in_threadpool(model_registry.train_random_forest, markups)
         
         if result:
             return {
@@ -649,7 +1186,8 @@ async def train_model():
                 "accuracy": result['accuracy'],
                 "samples": result['samples'],
                 "walls_count": result['walls_count'],
-                "non_walls_count": result['non_walls_count']
+                "non_walls_count": result['non_walls_count'],
+                "version": result.get('version')
             }
         else:
             return {
@@ -822,7 +1360,7 @@ async def train_with_selected_markups(markup_ids: list):
                 "markup_id": item["markup_id"]
             })
         
-        result = wall_model.train(training_data)
+        result = await run_in_threadpool(model_registry.train_random_forest, training_data)
         
         if result:
             return {
@@ -832,6 +1370,7 @@ async def train_with_selected_markups(markup_ids: list):
                 "samples": result['samples'],
                 "walls_count": result['walls_count'],
                 "non_walls_count": result['non_walls_count'],
+                "version": result.get('version'),
                 "markups_count": len(selected_markups),
                 "markup_ids": markup_ids
             }
@@ -950,21 +1489,46 @@ async def detect_walls_auto(request: dict):
                 "message": "Не указан project_id"
             }
         
-        print(f"🤖 Запуск автообнаружения стен: проект {project_id}, стр. {page_num}")
-        
-        # Используем нашу CV модель
-        from cv_model import cv_model
-        
-        result = cv_model.process_project_page(project_id, page_num)
+        # Режим: yolo - по растру, vector - из графики PDF, auto - вектор если страница векторная
+        mode = request.get("mode", DETECTION_MODE)
+        print(f"🤖 Запуск автообнаружения стен: проект {project_id}, стр. {page_num}, режим {mode}")
+        
+        result = None
+        detection_method = "YOLO Auto-detection"
+        
+        if mode in ("vector", "auto"):
+            metadata = load_project_metadata(project_id)
+            if metadata and metadata.get("pdf_path"):
+                from vector_walls import extract_vector_walls
+                vector_result = await run_in_threadpool(
+                    extract_vector_walls, Path(metadata["pdf_path"]), page_num, 150
+                )
+                if vector_result.get("success") or mode == "vector":
+                    result = vector_result
+                    detection_method = "PDF Vector Auto-detection"
+            elif mode == "vector":
+                result = {"success": False, "message": "PDF проекта не найден"}
+        
+        if result is None:
+            # Используем нашу CV модель
+            # Загрузка модели и инференс - вне event loop
+            cv_model = await run_in_threadpool(model_registry.get_active, 'yolo')
+            
+            result = await run_in_threadpool(
+                cv_model.process_project_page, get_images_project_id(project_id), page_num
+            )
         
         if result.get("success"):
+            result["project_id"] = project_id
+            result["page_num"] = page_num
+            
             # Сохраняем разметку в БД
             markup_data = {
                 "project_id": project_id,
                 "page_num": page_num,
                 "objects": result.get("objects", []),
                 "total_objects": result.get("total_objects", 0),
-                "detection_method": "YOLO Auto-detection",
+                "detection_method": detection_method,
                 "auto_detected": True
             }
             
@@ -986,12 +1550,73 @@ async def detect_walls_auto(request: dict):
             "message": f"Ошибка: {str(e)}"
         }
 
+@app.post("/api/detect-walls-project/")
+async def detect_walls_project(request: dict):
+    """
+    Автообнаружение стен на всех (или выбранных) страницах проекта.
+    Страницы уходят в YOLO пачками по batch_size, результаты каждой страницы
+    отдаются потоком NDJSON (одна JSON-строка на страницу) по мере готовности.
+    """
+    project_id = request.get("project_id")
+    if not project_id:
+        return {"success": False, "message": "Не указан project_id"}
+    
+    metadata = load_project_metadata(project_id)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="Проект не найден")
+    
+    page_nums = request.get("page_nums") or list(range(1, metadata.get("total_pages", 0) + 1))
+    batch_size = request.get("batch_size")
+    images_project_id = get_images_project_id(project_id)
+    
+    def stream():
+        cv_model = model_registry.get_active('yolo')
+        
+        started = time.perf_counter()
+        if metadata.get("lazy"):
+            # Ленивый проект: недостающие страницы сначала рендерятся
+            for page_num in page_nums:
+                if not (PROCESSED_DIR / images_project_id / f"page_{page_num:03d}.jpg").exists():
+                    render_lazy_page(project_id, page_num, metadata)
+        
+        processed = 0
+        for result in cv_model.process_project(images_project_id, page_nums, batch_size):
+            page_num = result.get("page_num")
+            result["project_id"] = project_id
+            
+            if result.get("success"):
+                markup_data = {
+                    "project_id": project_id,
+                    "page_num": page_num,
+                    "objects": result.get("objects", []),
+                    "total_objects": result.get("total_objects", 0),
+                    "detection_method": "YOLO Batch Auto-detection",
+                    "auto_detected": True
+                }
+                try:
+                    result["db_markup_id"] = db.save_markup(project_id, page_num, markup_data, is_training=True)
+                except Exception as db_error:
+                    print(f"⚠️ Не удалось сохранить в БД: {db_error}")
+                    result["db_error"] = str(db_error)
+            
+            processed += 1
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        
+        yield json.dumps({
+            "done": True,
+            "project_id": project_id,
+            "pages_processed": processed,
+            "elapsed_s": round(time.perf_counter() - started, 2)
+        }, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.get("/api/compare-detection/{project_id}/{page_num}/")
 async def compare_detection_methods(project_id: str, page_num: int):
     """Сравнение RandomForest и YOLO методов обнаружения"""
     try:
         # Получаем изображение
-        images_dir = PROCESSED_DIR / project_id
+        images_dir = PROCESSED_DIR / get_images_project_id(project_id)
         image_pattern = f"page_{page_num:03d}.jpg"
         image_path = images_dir / image_pattern
         
@@ -1007,12 +1632,12 @@ async def compare_detection_methods(project_id: str, page_num: int):
                 }
         
         # 1. YOLO обнаружение
-        from cv_model import cv_model
-        yolo_detections = cv_model.detect_walls_hybrid(image_path)
+        cv_model = await run_in_threadpool(model_registry.get_active, 'yolo')
+        yolo_detections = await run_in_threadpool(cv_model.detect_walls_hybrid, image_path)
         yolo_count = len(yolo_detections)
         
         # 2. RandomForest обнаружение (старый метод)
-        from ml_model import wall_model
+        wall_model = await run_in_threadpool(model_registry.get_active, 'random_forest')
         # Создаем фиктивную разметку для RF
         fake_markup = {
             "objects": [{"type": "wall", "points": [{"x": 0, "y": 0}]}]  # Минимальная разметка
@@ -1021,7 +1646,7 @@ async def compare_detection_methods(project_id: str, page_num: int):
         rf_count = len(rf_predictions)
         
         # 3. Геометрический анализ
-        geometry = cv_model.analyze_geometry(image_path)
+        geometry = await run_in_threadpool(cv_model.analyze_geometry, image_path)
         
         comparison = {
             "success": True,
@@ -1046,7 +1671,7 @@ async def compare_detection_methods(project_id: str, page_num: int):
             },
             "geometry_analysis": geometry,
             "recommendation": "YOLO" if yolo_count > 0 else "Ручная разметка",
-            "timestamp": str(np.datetime64('now'))
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S')
         }
         
         return comparison
@@ -1097,6 +1722,61 @@ async def train_yolo_custom():
         }
 
 # Новый endpoint для веб-интерфейса
+@app.get("/api/cv-status/")
+async def cv_status():
+    """Статус CV модели: активный бэкенд инференса и задержка на изображение"""
+    try:
+        # Статус не загружает модель: до прогрева отдается состояние запуска
+        cv_model = model_registry.peek('yolo')
+        if cv_model is None:
+            return {"success": True, "model_loaded": False, "warmup": startup_state["models"]}
+        return {"success": True, **cv_model.get_status()}
+    except Exception as e:
+        return {"success": False, "message": f"CV модель недоступна: {str(e)}"}
+
+# ========== РЕЕСТР МОДЕЛЕЙ ==========
+
+@app.get("/api/models/")
+async def list_models(model_type: str = None):
+    """Версии моделей из реестра и активные версии"""
+    models = db.list_models(model_type)
+    status = model_registry.status()
+    warm = set(status['warm_model_ids'])
+    for model in models:
+        model['warm'] = model['id'] in warm
+    return {"success": True, "models": models, **status}
+
+@app.post("/api/models/register")
+async def register_model(request: dict):
+    """Регистрация новой версии модели (например, best_walls_yolo.pt после train_yolo_real.py)"""
+    try:
+        record = await run_in_threadpool(
+            model_registry.register,
+            request.get("model_type", "yolo"),
+            request.get("model_path"),
+            request.get("model_name"),
+            request.get("accuracy", 0.0),
+            request.get("training_samples", 0),
+            request.get("metadata"),
+            bool(request.get("activate", False))
+        )
+        return {"success": True, "model": record,
+                "message": f"Зарегистрирована версия {record['version']}"}
+    except (ValueError, FileNotFoundError, RuntimeError, TypeError) as e:
+        return {"success": False, "message": str(e)}
+
+@app.post("/api/models/{model_id}/activate")
+async def activate_model(model_id: int):
+    """Горячая замена активной версии: загрузка, переключение в БД, подмена без перезапуска"""
+    try:
+        record = await run_in_threadpool(model_registry.activate, model_id)
+        return {"success": True, "model": record,
+                "message": f"Активна версия {record['version']} ({record['model_type']})"}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        return {"success": False, "message": f"Версия не активирована: {str(e)}"}
+
 @app.get("/cv-dashboard/")
 async def cv_dashboard():
     """Дашборд для управления CV моделью"""
@@ -1213,13 +1893,21 @@ async def cv_dashboard():
                 try {
                     const response = await fetch('/health');
                     const data = await response.json();
+                    const cvResponse = await fetch('/api/cv-status/');
+                    const cv = await cvResponse.json();
+                    
+                    const latency = cv.latency_ms_avg !== null && cv.latency_ms_avg !== undefined
+                        ? `${cv.latency_ms_avg} мс/изобр. (последнее: ${cv.latency_ms_last} мс, всего ${cv.images_processed})`
+                        : 'нет данных (еще не было инференса)';
                     
                     statusEl.innerHTML = `
                         <div class="success status">
                             <strong>✅ CV система активна</strong><br>
                             Версия: ${data.version || '0.9.0'}<br>
                             OCR доступен: ${data.ocr_available ? 'Да' : 'Нет'}<br>
-                            YOLO модель: Загружена
+                            YOLO модель: ${cv.model_loaded ? 'Загружена' : 'Не загружена'} (${cv.backend_model_path || cv.model_path || 'N/A'})<br>
+                            Бэкенд: ${cv.backend || 'N/A'}${cv.backend !== cv.requested_backend ? ` (запрошен ${cv.requested_backend})` : ''}, устройство: ${cv.device || 'N/A'}<br>
+                            Задержка: ${latency}
                         </div>
                     `;
                 } catch (error) {
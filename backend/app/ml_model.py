@@ -10,7 +10,7 @@ import os
 class WallDetectionModel:
     def __init__(self, model_dir="ml_models"):
         self.model_dir = Path(model_dir)
-        self.model_dir.mkdir(exist_ok=True)
+        self.model_dir.mkdir(parents=True, exist_ok=True)
         
         self.model = RandomForestClassifier(n_estimators=100, random_state=42)
         self.scaler = StandardScaler()
@@ -0,0 +1,221 @@
+# model_registry.py - Реестр версий моделей (YOLO и RandomForest) поверх таблицы models
+# Модели грузятся лениво и держатся "теплыми" в LRU. Активная версия переключается
+# атомарно: новая версия сначала загружается, затем в одной транзакции помечается
+# активной в БД, и только потом подменяется ссылка в памяти. Запросы, которые уже
+# получили старый экземпляр, спокойно дорабатывают на нем.
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from database import db
+
+MODEL_TYPES = ('yolo', 'random_forest')
+
+# Сколько загруженных версий держать в памяти (активные не вытесняются)
+MODEL_CACHE_SIZE = int(os.getenv('MODEL_CACHE_SIZE', '2'))
+
+# Каталог версий RandomForest: ml_models/random_forest/<метка версии>/
+RF_VERSIONS_DIR = Path("ml_models") / "random_forest"
+
+
+def load_yolo(model_path):
+    from cv_model import WallDetectionCVModel
+    model = WallDetectionCVModel(model_path=model_path)
+    if not model.model_loaded:
+        raise RuntimeError(f"Не удалось загрузить веса YOLO: {model_path}")
+    return model
+
+
+def load_random_forest(model_path):
+    from ml_model import WallDetectionModel
+    model = WallDetectionModel(model_dir=model_path)
+    if not model.is_trained:
+        raise RuntimeError(f"В {model_path} нет обученной модели RandomForest")
+    return model
+
+
+def default_model(model_type):
+    """Модель без записи в реестре: экземпляр по умолчанию (веса из .env / ml_models)"""
+    if model_type == 'yolo':
+        from cv_model import get_default_model
+        return get_default_model()
+    from ml_model import wall_model
+    return wall_model
+
+
+LOADERS = {
+    'yolo': load_yolo,
+    'random_forest': load_random_forest
+}
+
+
+class ModelRegistry:
+    """Ленивая загрузка версий моделей, LRU теплых экземпляров и горячая замена активной версии"""
+
+    def __init__(self, cache_size=MODEL_CACHE_SIZE):
+        self.cache_size = max(1, cache_size)
+        self.instances = OrderedDict()  # id модели -> загруженный экземпляр
+        self.active = {}                # тип модели -> (запись из БД или None, экземпляр)
+        self.lock = threading.Lock()
+        self.loading_locks = {}
+
+    def get_active(self, model_type):
+        """Экземпляр активной версии (при первом обращении - загрузка версии из БД)"""
+        with self.lock:
+            entry = self.active.get(model_type)
+        if entry is not None:
+            return entry[1]
+
+        record = db.get_active_model(model_type)
+        instance = None
+        if record:
+            try:
+                instance = self.load(record)
+            except Exception as e:
+                print(f"⚠️ Активная версия {model_type} v{record['version']} не загрузилась ({e}), "
+                      f"используется модель по умолчанию")
+                record = None
+        if instance is None:
+            instance = default_model(model_type)
+        with self.lock:
+            # Параллельный первый запрос мог успеть раньше - оставляем его экземпляр
+            entry = self.active.setdefault(model_type, (record, instance))
+        return entry[1]
+
+    def peek(self, model_type):
+        """Экземпляр активной версии, только если он уже загружен (без загрузки)"""
+        with self.lock:
+            entry = self.active.get(model_type)
+        return entry[1] if entry is not None else None
+
+    def load(self, record):
+        """Загруженный экземпляр версии из LRU или с диска (одна загрузка на версию)"""
+        model_id = record['id']
+        with self.lock:
+            if model_id in self.instances:
+                self.instances.move_to_end(model_id)
+                return self.instances[model_id]
+            loading_lock = self.loading_locks.setdefault(model_id, threading.Lock())
+
+        with loading_lock:
+            with self.lock:
+                if model_id in self.instances:
+                    return self.instances[model_id]
+
+            print(f"⏳ Загрузка модели {record['model_type']} v{record['version']}: {record['model_path']}")
+            try:
+                instance = LOADERS[record['model_type']](record['model_path'])
+            finally:
+                with self.lock:
+                    self.loading_locks.pop(model_id, None)
+
+            with self.lock:
+                self.instances[model_id] = instance
+                self._evict()
+            return instance
+
+    def _evict(self):
+        """Вытеснение самых давно использованных версий, кроме активных (под self.lock)"""
+        active_ids = {record['id'] for record, _ in self.active.values() if record}
+        # Последняя загруженная версия не вытесняется: она может как раз становиться активной
+        for model_id in list(self.instances)[:-1]:
+            if len(self.instances) <= self.cache_size:
+                break
+            if model_id not in active_ids:
+                del self.instances[model_id]
+
+    def activate(self, model_id):
+        """
+        Переключение активной версии без перезапуска сервера
+
+        Returns:
+            Запись активированной модели
+        Raises:
+            KeyError: модели нет в реестре
+            RuntimeError: версия не загрузилась или не записалась в БД (активная не меняется)
+        """
+        record = db.get_model(model_id)
+        if record is None:
+            raise KeyError(f"Модель {model_id} не найдена")
+
+        instance = self.load(record)
+        if not db.activate_model(model_id):
+            raise RuntimeError("Не удалось сохранить активную версию в БД")
+
+        record = db.get_model(model_id) or record
+        with self.lock:
+            self.active[record['model_type']] = (record, instance)
+        print(f"✅ Активна модель {record['model_type']} v{record['version']}: {record['model_path']}")
+        return record
+
+    def register(self, model_type, model_path, model_name=None, accuracy=0.0,
+                 training_samples=0, metadata=None, activate=False):
+        """Регистрация новой версии (файлы уже на диске), при activate - сразу в работу"""
+        if model_type not in LOADERS:
+            raise ValueError(f"Неизвестный тип модели: {model_type}")
+        if not Path(model_path).exists():
+            raise FileNotFoundError(f"Файл модели не найден: {model_path}")
+
+        record = db.register_model(model_name or Path(model_path).name, model_type, model_path,
+                                   accuracy, training_samples, metadata)
+        if record is None:
+            raise RuntimeError("Не удалось зарегистрировать модель в БД")
+        print(f"📦 Зарегистрирована модель {model_type} v{record['version']}: {model_path}")
+
+        if activate:
+            record = self.activate(record['id'])
+        return record
+
+    def train_random_forest(self, markups):
+        """
+        Обучение новой версии RandomForest в отдельном каталоге версии,
+        регистрация и активация (предыдущая версия остается на диске для отката)
+        """
+        from ml_model import WallDetectionModel
+
+        version_dir = RF_VERSIONS_DIR / datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        model = WallDetectionModel(model_dir=version_dir)
+        result = model.train(markups)
+        if not result:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            return result
+
+        metadata = {
+            'walls_count': int(result['walls_count']),
+            'non_walls_count': int(result['non_walls_count'])
+        }
+        record = db.register_model('RandomForest', 'random_forest', str(version_dir),
+                                   result['accuracy'], result['samples'], metadata)
+
+        if record is None:
+            # Без БД новая версия все равно обслуживается до перезапуска
+            with self.lock:
+                self.active['random_forest'] = (None, model)
+            return result
+
+        with self.lock:
+            self.instances[record['id']] = model
+            self._evict()
+        if db.activate_model(record['id']):
+            record = db.get_model(record['id']) or record
+        with self.lock:
+            self.active['random_forest'] = (record, model)
+
+        return {**result, 'model_id': record['id'], 'version': record['version']}
+
+    def status(self):
+        """Активные версии и загруженные в память экземпляры"""
+        with self.lock:
+            active = {
+                model_type: record if record else {'model_path': 'default', 'version': None}
+                for model_type, (record, _) in self.active.items()
+            }
+            warm = list(self.instances.keys())
+        return {'active': active, 'warm_model_ids': warm, 'cache_size': self.cache_size}
+
+
+# Глобальный реестр моделей
+model_registry = ModelRegistry()
@@ -0,0 +1,138 @@
+# ocr_cache.py - Дисковый кэш результатов OCR
+# Ключ - хэш содержимого изображения + параметры предобработки + конфиг Tesseract,
+# поэтому повторный анализ той же страницы (переобработка, debug_ocr.py, рестарт
+# сервера) не запускает Tesseract заново.
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+OCR_CACHE_DIR = os.getenv('OCR_CACHE_DIR', 'ocr_cache')
+OCR_CACHE_MAX_MB = int(os.getenv('OCR_CACHE_MAX_MB', '256'))
+
+
+def make_cache_key(image: np.ndarray, params: dict) -> str:
+    """Ключ кэша: содержимое и форма изображения + параметры распознавания"""
+    h = hashlib.sha256()
+    h.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    h.update(str(image.shape).encode('ascii'))
+    h.update(np.ascontiguousarray(image).data)
+    return h.hexdigest()
+
+
+class OCRCache:
+    """
+    Кэш OCR на диске с LRU-вытеснением по размеру.
+    Время последнего обращения - mtime файла (обновляется при чтении),
+    поэтому порядок вытеснения переживает перезапуск.
+    """
+
+    def __init__(self, cache_dir=OCR_CACHE_DIR, max_mb=OCR_CACHE_MAX_MB):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.enabled = max_mb > 0
+        self.total_bytes = None  # считается при первой записи
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        """Сохраненный результат OCR или None"""
+        if not self.enabled:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)  # отметка использования для LRU
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry['result']
+
+    def put(self, key: str, result, params: dict = None):
+        """Запись результата OCR (атомарно: через временный файл)"""
+        if not self.enabled:
+            return
+
+        path = self._path(key)
+        entry = {'result': result, 'params': params, 'created_at': datetime.now().isoformat()}
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            size = path.stat().st_size
+        except OSError as e:
+            print(f"⚠️ Не удалось записать кэш OCR: {e}")
+            return
+
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(p.stat().st_size for p in self._entries())
+            else:
+                self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        if not self.cache_dir.exists():
+            return []
+        return list(self.cache_dir.glob("*/*.json"))
+
+    def _evict(self):
+        """Удаление давно не использованных записей до 90% лимита (вызывается под lock)"""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort(key=lambda e: e[0])
+        total = sum(e[1] for e in entries)
+        target = self.max_bytes * 0.9
+        removed = 0
+
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= size
+                removed += 1
+            except OSError:
+                continue
+
+        self.total_bytes = total
+        print(f"🧹 Кэш OCR: удалено {removed} записей, занято {total / 1024 / 1024:.1f} МБ")
+
+    def stats(self):
+        """Статистика попаданий и размер кэша"""
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(p.stat().st_size for p in self._entries())
+            return {
+                'enabled': self.enabled,
+                'cache_dir': str(self.cache_dir),
+                'size_mb': round(self.total_bytes / 1024 / 1024, 2),
+                'max_mb': self.max_bytes // (1024 * 1024),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# Глобальный экземпляр
+ocr_cache = OCRCache()
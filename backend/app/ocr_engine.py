@@ -0,0 +1,216 @@
+# ocr_engine.py - Движки распознавания Tesseract
+# tesserocr держит языковые модели загруженными в процессе и принимает буфер
+# NumPy напрямую; pytesseract на каждый вызов пишет временный файл и запускает
+# новый процесс tesseract - остается запасным вариантом.
+import os
+import shlex
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytesseract
+
+# auto - tesserocr, если установлен, иначе pytesseract
+OCR_ENGINE = os.getenv('OCR_ENGINE', 'auto')
+
+
+def parse_config(config: str):
+    """
+    Разбор строки конфига в стиле CLI tesseract
+    Returns:
+        (oem, psm, {переменная: значение})
+    """
+    oem, psm, variables = 3, 3, {}
+    args = shlex.split(config or "")
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '--oem' and i + 1 < len(args):
+            oem = int(args[i + 1])
+            i += 1
+        elif arg == '--psm' and i + 1 < len(args):
+            psm = int(args[i + 1])
+            i += 1
+        elif arg == '-c' and i + 1 < len(args):
+            name, _, value = args[i + 1].partition('=')
+            variables[name] = value
+            i += 1
+        i += 1
+    return oem, psm, variables
+
+
+class PytesseractEngine:
+    """Запуск внешнего процесса tesseract на каждый вызов"""
+
+    name = 'pytesseract'
+
+    def version(self):
+        try:
+            return str(pytesseract.get_tesseract_version())
+        except Exception:
+            return 'unknown'
+
+    def image_to_string(self, image: np.ndarray, lang: str, config: str) -> str:
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+    def image_to_data(self, image: np.ndarray, lang: str, config: str):
+        """Слова с координатами в формате pytesseract.Output.DICT"""
+        return pytesseract.image_to_data(image, lang=lang, config=config,
+                                         output_type=pytesseract.Output.DICT)
+
+
+class TesserocrEngine:
+    """
+    Tesseract в текущем процессе через tesserocr.
+    На каждый поток и набор языков держится свой загруженный API
+    (экземпляры PyTessBaseAPI не потокобезопасны).
+    Если tesserocr не смог распознать изображение, этот вызов повторяется в pytesseract.
+    Если не создается сам API (нет библиотеки/tessdata), все следующие вызовы
+    идут в pytesseract, и движок сообщает имя pytesseract (для ключа кэша OCR).
+    """
+
+    def __init__(self, tessdata_path=None):
+        import tesserocr  # импорт здесь: OMP_THREAD_LIMIT должен быть задан до загрузки libtesseract
+        self.tesserocr = tesserocr
+        self.tessdata_path = tessdata_path or self._find_tessdata()
+        self.local = threading.local()
+        self.fallback = PytesseractEngine()
+        self.failed = False
+
+    @property
+    def name(self):
+        """Движок, который на самом деле распознает"""
+        return self.fallback.name if self.failed else 'tesserocr'
+
+    def _fail_over(self, error):
+        """Окончательный переход на pytesseract, если API не создается (сообщение - один раз)"""
+        if not self.failed:
+            self.failed = True
+            print(f"⚠️ tesserocr не загрузился ({error}), дальше используется pytesseract")
+        return self.fallback
+
+    def _call_failed(self, error):
+        """Ошибка одного вызова: только он повторяется в pytesseract"""
+        print(f"⚠️ Ошибка tesserocr ({error}), вызов повторен в pytesseract")
+        return self.fallback
+
+    def _find_tessdata(self):
+        """tessdata рядом с tesseract.exe (Windows) или путь по умолчанию из сборки"""
+        if os.getenv('TESSDATA_PREFIX'):
+            return os.getenv('TESSDATA_PREFIX')
+        tesseract_cmd = Path(pytesseract.pytesseract.tesseract_cmd)
+        candidate = tesseract_cmd.parent / 'tessdata'
+        if candidate.exists():
+            return str(candidate)
+        return None
+
+    def version(self):
+        if self.failed:
+            return self.fallback.version()
+        return f"tesserocr-{self.tesserocr.tesseract_version().splitlines()[0]}"
+
+    def _api(self, lang: str, oem: int):
+        """Загруженный API для языков и режима движка (создается один раз на поток)"""
+        apis = getattr(self.local, 'apis', None)
+        if apis is None:
+            apis = self.local.apis = {}
+
+        key = (lang, oem)
+        api = apis.get(key)
+        if api is None:
+            # OEM/PSM в tesserocr - перечисления-константы, передаются как int
+            kwargs = {'lang': lang, 'oem': oem}
+            if self.tessdata_path:
+                kwargs['path'] = self.tessdata_path
+            api = self.tesserocr.PyTessBaseAPI(**kwargs)
+            apis[key] = api
+            print(f"✅ Tesseract загружен в процесс: {lang}")
+        return api
+
+    def _prepare(self, api, image: np.ndarray, psm: int, variables: dict):
+        """Настройка API под вызов и передача буфера без временных файлов"""
+        api.SetPageSegMode(psm)
+        # Переменные сбрасываются на каждый вызов: API переиспользуется с разными конфигами
+        api.SetVariable('tessedit_char_whitelist', variables.pop('tessedit_char_whitelist', ''))
+        for name, value in variables.items():
+            api.SetVariable(name, value)
+
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+        return api
+
+    def image_to_string(self, image: np.ndarray, lang: str, config: str) -> str:
+        if self.failed:
+            return self.fallback.image_to_string(image, lang, config)
+        oem, psm, variables = parse_config(config)
+        try:
+            api = self._api(lang, oem)
+        except Exception as e:
+            return self._fail_over(e).image_to_string(image, lang, config)
+
+        try:
+            self._prepare(api, image, psm, variables)
+            try:
+                return api.GetUTF8Text()
+            finally:
+                api.Clear()
+        except Exception as e:
+            return self._call_failed(e).image_to_string(image, lang, config)
+
+    def image_to_data(self, image: np.ndarray, lang: str, config: str):
+        """Слова с координатами в формате pytesseract.Output.DICT"""
+        if self.failed:
+            return self.fallback.image_to_data(image, lang, config)
+        oem, psm, variables = parse_config(config)
+        try:
+            api = self._api(lang, oem)
+        except Exception as e:
+            return self._fail_over(e).image_to_data(image, lang, config)
+
+        try:
+            return self._image_to_data(api, image, psm, variables)
+        except Exception as e:
+            return self._call_failed(e).image_to_data(image, lang, config)
+
+    def _image_to_data(self, api, image: np.ndarray, psm: int, variables: dict):
+        data = {'text': [], 'conf': [], 'left': [], 'top': [], 'width': [], 'height': []}
+        self._prepare(api, image, psm, variables)
+        try:
+            api.Recognize()
+            iterator = api.GetIterator()
+            level = self.tesserocr.RIL.WORD
+            if iterator is None:
+                return data
+
+            while True:
+                word = iterator.GetUTF8Text(level)
+                box = iterator.BoundingBox(level)
+                if word and box:
+                    x1, y1, x2, y2 = box
+                    data['text'].append(word)
+                    data['conf'].append(iterator.Confidence(level))
+                    data['left'].append(x1)
+                    data['top'].append(y1)
+                    data['width'].append(x2 - x1)
+                    data['height'].append(y2 - y1)
+                if not iterator.Next(level):
+                    break
+            return data
+        finally:
+            api.Clear()
+
+
+def create_engine(name=None):
+    """Движок OCR по имени (tesserocr / pytesseract / auto)"""
+    name = name or OCR_ENGINE
+    if name in ('auto', 'tesserocr'):
+        try:
+            return TesserocrEngine()
+        except ImportError as e:
+            if name == 'tesserocr':
+                print(f"⚠️ tesserocr не установлен ({e}), используется pytesseract")
+        except Exception as e:
+            print(f"⚠️ tesserocr не запустился ({e}), используется pytesseract")
+    return PytesseractEngine()
@@ -7,6 +7,55 @@ import re
 from pathlib import Path
 import os
 import json
+import bisect
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from ocr_cache import ocr_cache, make_cache_key
+from ocr_engine import create_engine
+
+# Минимум слов в текстовом слое PDF, чтобы опираться на него; блоки страницы без слов
+# текстового слоя (размеры, нарисованные контурами) все равно распознаются OCR
+MIN_TEXT_LAYER_WORDS = int(os.getenv('MIN_TEXT_LAYER_WORDS', '3'))
+
+# Число процессов OCR для многостраничных документов (1 = последовательно в текущем процессе)
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', '1'))
+# Потоков Tesseract на процесс: параллелизм дают процессы, а не OpenMP внутри Tesseract
+OCR_THREAD_LIMIT = os.getenv('OCR_THREAD_LIMIT', '1')
+
+# Параметры предобработки и распознавания (входят в ключ кэша OCR)
+OCR_PARAMS = {
+    'clahe_clip_limit': 2.0,
+    'clahe_tile_grid': 8,
+    'threshold': 'otsu',
+    'config': '--oem 3 --psm 6',
+    'lang': 'rus+eng',
+    # Распознавание только найденных текстовых блоков вместо всей страницы
+    'region_mode': os.getenv('OCR_REGION_MODE', '1') == '1',
+    # Быстрый проход по цифрам и единицам, полный rus+eng - только для блоков со словами
+    'two_tier': os.getenv('OCR_TWO_TIER', '1') == '1',
+    'digits_lang': 'eng',
+    'digits_config': '--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789.,xX×*RØmM',
+    'digits_min_conf': 60
+}
+
+# Версия формата кэшируемого результата (меняется вместе с его полями)
+OCR_RESULT_FORMAT = 2
+
+# Поиск текстовых блоков на бинарном изображении (пиксели при 150 DPI)
+REGION_PARAMS = {
+    'line_length': 40,       # прямые длиннее - линии чертежа, а не буквы
+    'char_min_height': 6,
+    'char_max_height': 60,
+    'char_min_area': 8,
+    'group_gap_x': 9,        # расстояние между буквами одного блока
+    'group_gap_y': 3,
+    'padding': 3,
+    'max_regions': 1500,     # больше - страница состоит из текста, дешевле распознать целиком
+    'strip_gap': 12,         # промежуток между блоками в собранной полосе
+    'strip_max_height': 8000
+}
 
 class OCRProcessor:
     def __init__(self, tesseract_path=None):
@@ -29,39 +78,397 @@ class OCRProcessor:
                     break
             else:
                 print("⚠️ Tesseract не найден в стандартных путях")
+        
+        # Движок Tesseract (создается при первом распознавании, в каждом процессе свой)
+        self.engine = None
+        self.engine_lock = threading.Lock()
+        
+        # Пул процессов для пакетного OCR (создается лениво)
+        self.pool = None
+        self.pool_workers = 0
+        self.pool_lock = threading.Lock()
     
-    def extract_text_from_image(self, image_path):
+    def load_gray(self, image):
         """
-        Извлечение текста из изображения чертежа
+        Получение grayscale изображения из пути или массива NumPy.
+        Готовый массив (например, буфер отрендеренной страницы) не декодируется повторно.
         """
-        try:
-            # Загружаем изображение
-            image = cv2.imread(str(image_path))
-            if image is None:
-                return ""
+        if isinstance(image, np.ndarray):
+            if image.ndim == 2:
+                return image
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        
+        return cv2.imread(str(image), cv2.IMREAD_GRAYSCALE)
+    
+    def get_engine(self):
+        """Движок OCR: tesserocr в процессе или pytesseract (OCR_ENGINE в .env)"""
+        with self.engine_lock:
+            if self.engine is None:
+                self.engine = create_engine()
+                self.engine_name = self.engine.name
+                self.engine_version = self.engine.version()
+                print(f"✅ Движок OCR: {self.engine.name} ({self.engine_version})")
+            elif self.engine.name != self.engine_name:
+                # tesserocr перешел на pytesseract: в ключ кэша - движок, который реально работает
+                self.engine_name = self.engine.name
+                self.engine_version = self.engine.version()
+            return self.engine
+    
+    def cache_result(self, gray, cache_key, result, params):
+        """
+        Сохранение результата в кэш под ключом движка, который его получил
+        (если движок сменился во время распознавания, ключ считается заново)
+        """
+        if self.get_engine().name != params['engine']:
+            params = {**params, **self.cache_params()}
+            cache_key = make_cache_key(gray, params)
+        ocr_cache.put(cache_key, result, params)
+    
+    def cache_params(self):
+        """Параметры для ключа кэша OCR (включая движок и версию Tesseract)"""
+        engine = self.get_engine()
+        params = {**OCR_PARAMS, 'engine': engine.name, 'tesseract_version': self.engine_version,
+                  'result_format': OCR_RESULT_FORMAT}
+        if OCR_PARAMS['region_mode']:
+            params['regions'] = REGION_PARAMS
+        return params
+    
+    def preprocess(self, gray):
+        """Контраст (CLAHE) и бинаризация Оцу: текст черный на белом"""
+        tile = OCR_PARAMS['clahe_tile_grid']
+        clahe = cv2.createCLAHE(clipLimit=OCR_PARAMS['clahe_clip_limit'], tileGridSize=(tile, tile))
+        enhanced = clahe.apply(gray)
+        
+        _, binary = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return binary
+    
+    def detect_text_regions(self, binary):
+        """
+        Поиск текстовых блоков на бинарной странице
+        Длинные прямые (стены, размерные линии) вычитаются морфологическим открытием,
+        из оставшегося берутся компоненты размером с букву, соседние буквы
+        склеиваются дилатацией в блоки.
+        Возвращает: список (x, y, w, h), отсортированный по строкам
+        """
+        p = REGION_PARAMS
+        ink = cv2.bitwise_not(binary)
+        
+        # Убираем линии чертежа
+        length = p['line_length']
+        h_lines = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (length, 1)))
+        v_lines = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, length)))
+        residual = cv2.subtract(ink, cv2.bitwise_or(h_lines, v_lines))
+        
+        # Оставляем компоненты размером с букву (штриховка и крупная графика отсеиваются)
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(residual, connectivity=8)
+        widths = stats[:, cv2.CC_STAT_WIDTH]
+        heights = stats[:, cv2.CC_STAT_HEIGHT]
+        areas = stats[:, cv2.CC_STAT_AREA]
+        size = np.maximum(widths, heights)
+        is_char = (size >= p['char_min_height']) & (size <= p['char_max_height']) & \
+                  (areas >= p['char_min_area'])
+        is_char[0] = False  # фон
+        chars = (is_char[labels] * 255).astype(np.uint8)
+        
+        # Склеиваем буквы в блоки
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (p['group_gap_x'], p['group_gap_y']))
+        grouped = cv2.dilate(chars, kernel)
+        contours, _ = cv2.findContours(grouped, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        
+        height, width = binary.shape[:2]
+        pad = p['padding']
+        regions = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if min(w, h) < p['char_min_height'] // 2:
+                continue
+            x0, y0 = max(0, x - pad), max(0, y - pad)
+            x1, y1 = min(width, x + w + pad), min(height, y + h + pad)
+            regions.append((x0, y0, x1 - x0, y1 - y0))
+        
+        regions.sort(key=lambda r: (r[1] // p['char_max_height'], r[0]))
+        return regions
+    
+    def ocr_full_page(self, binary):
+        """OCR всей страницы одним блоком (--psm 6) со словами и их координатами"""
+        data = self.get_engine().image_to_data(
+            binary,
+            config=OCR_PARAMS['config'],
+            lang=OCR_PARAMS['lang']
+        )
+        
+        words = []
+        for i, word in enumerate(data['text']):
+            word = word.strip()
+            if not word or float(data['conf'][i]) < 0:
+                continue
+            words.append({
+                'text': word,
+                'x': data['left'][i],
+                'y': data['top'][i],
+                'w': data['width'][i],
+                'h': data['height'][i],
+                'conf': float(data['conf'][i])
+            })
+        
+        return {'text': self.join_words(words), 'words': words}
+    
+    def ocr_regions(self, binary, regions, lang=None, config=None):
+        """
+        OCR найденных блоков: вырезки складываются столбиком в полосу (один блок -
+        одна строка), полоса распознается одним вызовом Tesseract, слова
+        возвращаются на место по своей строке полосы.
+        Вертикальные подписи (размеры вдоль стен) поворачиваются в горизонталь.
+        Возвращает: список слов с координатами и индексом блока ('region')
+        """
+        lang = lang or OCR_PARAMS['lang']
+        config = config or OCR_PARAMS['config']
+        p = REGION_PARAMS
+        gap = p['strip_gap']
+        words = []
+        
+        # Собираем полосы ограниченной высоты
+        strips, current, current_height = [], [], gap
+        for index, region in enumerate(regions):
+            x, y, w, h = region
+            crop = binary[y:y + h, x:x + w]
+            rotated = h > w * 1.5 and h > p['char_max_height']
+            if rotated:
+                crop = cv2.rotate(crop, cv2.ROTATE_90_CLOCKWISE)
+            if current and current_height + crop.shape[0] + gap > p['strip_max_height']:
+                strips.append(current)
+                current, current_height = [], gap
+            current.append((index, crop, rotated, current_height))
+            current_height += crop.shape[0] + gap
+        if current:
+            strips.append(current)
+        
+        for strip in strips:
+            strip_width = max(crop.shape[1] for _, crop, _, _ in strip) + 2 * gap
+            strip_height = strip[-1][3] + strip[-1][1].shape[0] + gap
+            canvas = np.full((strip_height, strip_width), 255, dtype=np.uint8)
+            tops = []
+            for _, crop, _, top in strip:
+                canvas[top:top + crop.shape[0], gap:gap + crop.shape[1]] = crop
+                tops.append(top)
             
-            # Конвертируем в grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            data = self.get_engine().image_to_data(canvas, config=config, lang=lang)
             
-            # Увеличиваем контраст
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            enhanced = clahe.apply(gray)
+            for i, word in enumerate(data['text']):
+                word = word.strip()
+                if not word or float(data['conf'][i]) < 0:
+                    continue
+                
+                center_y = data['top'][i] + data['height'][i] / 2
+                region_index, _, rotated, top = strip[max(0, bisect.bisect_right(tops, center_y) - 1)]
+                x, y, w, h = regions[region_index]
+                
+                if rotated:
+                    # Для повернутого блока координатами слова служит сам блок
+                    box = {'x': x, 'y': y, 'w': w, 'h': h}
+                else:
+                    box = {
+                        'x': x + data['left'][i] - gap,
+                        'y': y + data['top'][i] - top,
+                        'w': data['width'][i],
+                        'h': data['height'][i]
+                    }
+                words.append({'text': word, **box, 'conf': float(data['conf'][i]), 'region': region_index})
+        
+        return words
+    
+    def ocr_regions_two_tier(self, binary, regions):
+        """
+        Двухуровневый OCR блоков:
+        1) быстрый проход eng с белым списком цифр и единиц по всем блокам -
+           уверенно распознанные числовые блоки (размеры) на этом и заканчиваются;
+        2) полный rus+eng только по остальным блокам (подписи помещений и т.п.)
+        """
+        timing = {}
+        
+        start = time.perf_counter()
+        digit_words = self.ocr_regions(binary, regions, lang=OCR_PARAMS['digits_lang'],
+                                       config=OCR_PARAMS['digits_config'])
+        timing['digits_pass_s'] = round(time.perf_counter() - start, 3)
+        
+        # Блок числовой, если все его слова уверенно прочитаны и в основном состоят из цифр
+        by_region = {}
+        for word in digit_words:
+            by_region.setdefault(word['region'], []).append(word)
+        numeric = {
+            index for index, region_words in by_region.items()
+            if min(w['conf'] for w in region_words) >= OCR_PARAMS['digits_min_conf']
+            and self.is_numeric_text("".join(w['text'] for w in region_words))
+        }
+        words = [w for w in digit_words if w['region'] in numeric]
+        
+        text_indices = [i for i in range(len(regions)) if i not in numeric]
+        start = time.perf_counter()
+        if text_indices:
+            text_words = self.ocr_regions(binary, [regions[i] for i in text_indices])
+            for word in text_words:
+                word['region'] = text_indices[word['region']]
+            words.extend(text_words)
+        timing['text_pass_s'] = round(time.perf_counter() - start, 3)
+        
+        timing['regions_numeric'] = len(numeric)
+        timing['regions_text'] = len(text_indices)
+        return words, timing
+    
+    def is_numeric_text(self, text):
+        """Похоже ли содержимое блока на размер (цифры, а не слово)"""
+        alnum = [ch for ch in text if ch.isalnum()]
+        if not alnum:
+            return False
+        return sum(ch.isdigit() for ch in alnum) / len(alnum) >= 0.5
+    
+    def join_words(self, words):
+        """Сборка текста страницы из слов с координатами: строки сверху вниз, слова слева направо"""
+        lines = []
+        for word in sorted(words, key=lambda w: (w['y'] + w['h'] / 2, w['x'])):
+            center_y = word['y'] + word['h'] / 2
+            if lines and abs(center_y - lines[-1]['center_y']) <= max(word['h'], lines[-1]['h']) / 2:
+                lines[-1]['words'].append(word)
+            else:
+                lines.append({'center_y': center_y, 'h': word['h'], 'words': [word]})
+        
+        return "\n".join(
+            " ".join(w['text'] for w in sorted(line['words'], key=lambda w: w['x']))
+            for line in lines
+        )
+    
+    def recognize(self, image_path):
+        """
+        OCR страницы: {'text': текст, 'words': слова с координатами}
+        image_path: путь к файлу или массив NumPy (grayscale или BGR)
+        Результат берется из кэша OCR, если эта страница уже распознавалась
+        """
+        try:
+            # Загружаем изображение сразу в grayscale
+            gray = self.load_gray(image_path)
+            if gray is None:
+                return {'text': "", 'words': []}
+            
+            params = self.cache_params()
+            cache_key = make_cache_key(gray, params)
+            cached = ocr_cache.get(cache_key)
+            if cached is not None:
+                print("⚡ OCR из кэша")
+                cached['timing'] = {**cached.get('timing', {}), 'cached': True}
+                return cached
             
-            # Бинаризация
-            _, binary = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            binary = self.preprocess(gray)
             
             # Применяем OCR (русский + английский)
-            text = pytesseract.image_to_string(
-                binary, 
-                config='--oem 3 --psm 6',
-                lang='rus+eng'
-            )
+            start = time.perf_counter()
+            timing = {}
+            if OCR_PARAMS['region_mode']:
+                regions = self.detect_text_regions(binary)
+                timing['regions_total'] = len(regions)
+                if len(regions) > REGION_PARAMS['max_regions']:
+                    print(f"📄 Текстовых блоков {len(regions)} - распознаем страницу целиком")
+                    result = self.ocr_full_page(binary)
+                elif regions:
+                    print(f"🔤 Текстовых блоков: {len(regions)}")
+                    if OCR_PARAMS['two_tier']:
+                        words, pass_timing = self.ocr_regions_two_tier(binary, regions)
+                        timing.update(pass_timing)
+                    else:
+                        words = self.ocr_regions(binary, regions)
+                    result = {'text': self.join_words(words), 'words': words}
+                else:
+                    result = {'text': "", 'words': []}
+            else:
+                result = self.ocr_full_page(binary)
+            timing['total_s'] = round(time.perf_counter() - start, 3)
+            result['timing'] = timing
+            print(f"⏱️ OCR: {timing}")
             
-            return text.strip()
+            self.cache_result(gray, cache_key, result, params)
+            return result
             
         except Exception as e:
             print(f"❌ Ошибка OCR: {e}")
-            return ""
+            return {'text': "", 'words': []}
+    
+    def uncovered_regions(self, regions, layer_words):
+        """Текстовые блоки растра, которых не касается ни одно слово текстового слоя"""
+        if not regions or not layer_words:
+            return list(regions)
+        
+        boxes = np.array([[w['x'], w['y'], w['x'] + w['w'], w['y'] + w['h']] for w in layer_words],
+                         dtype=np.float64)
+        rects = np.array([[x, y, x + w, y + h] for x, y, w, h in regions], dtype=np.float64)
+        # Пересечение каждого блока с каждым словом (M x N) одним проходом
+        overlaps = ((rects[:, None, 0] < boxes[None, :, 2]) & (boxes[None, :, 0] < rects[:, None, 2]) &
+                    (rects[:, None, 1] < boxes[None, :, 3]) & (boxes[None, :, 1] < rects[:, None, 3]))
+        covered = overlaps.any(axis=1)
+        return [region for region, is_covered in zip(regions, covered) if not is_covered]
+    
+    def uncovered_cache_params(self, layer_words):
+        """Параметры кэша OCR блоков вне текстового слоя (результат зависит и от рамок слоя)"""
+        boxes = [[w['x'], w['y'], w['w'], w['h']] for w in layer_words]
+        return {**self.cache_params(), 'mode': 'uncovered', 'text_layer_boxes': boxes}
+    
+    def has_cached_uncovered(self, image_path, layer_words):
+        """Есть ли в кэше OCR блоков вне слоя - тогда распознавать на странице уже нечего"""
+        try:
+            gray = self.load_gray(image_path)
+            if gray is None:
+                return True
+            cache_key = make_cache_key(gray, self.uncovered_cache_params(layer_words))
+            return ocr_cache.get(cache_key) is not None
+        except Exception:
+            return False
+    
+    def recognize_uncovered(self, image_path, layer_words):
+        """
+        OCR только тех текстовых блоков страницы, которых нет в текстовом слое PDF
+        (размеры и подписи, экспортированные из CAD кривыми, а не текстом)
+        Returns:
+            {'text', 'words', 'timing'} - только распознанные OCR слова
+        """
+        try:
+            gray = self.load_gray(image_path)
+            if gray is None:
+                return {'text': "", 'words': []}
+            
+            params = self.uncovered_cache_params(layer_words)
+            cache_key = make_cache_key(gray, params)
+            cached = ocr_cache.get(cache_key)
+            if cached is not None:
+                cached['timing'] = {**cached.get('timing', {}), 'cached': True}
+                return cached
+            
+            start = time.perf_counter()
+            binary = self.preprocess(gray)
+            regions = self.detect_text_regions(binary)
+            uncovered = self.uncovered_regions(regions, layer_words)
+            timing = {'regions_total': len(regions), 'regions_uncovered': len(uncovered)}
+            
+            words = []
+            if uncovered:
+                if OCR_PARAMS['two_tier']:
+                    words, pass_timing = self.ocr_regions_two_tier(binary, uncovered)
+                    timing.update(pass_timing)
+                else:
+                    words = self.ocr_regions(binary, uncovered)
+            timing['total_s'] = round(time.perf_counter() - start, 3)
+            
+            result = {'text': self.join_words(words), 'words': words, 'timing': timing}
+            self.cache_result(gray, cache_key, result, params)
+            return result
+            
+        except Exception as e:
+            print(f"❌ Ошибка OCR блоков вне текстового слоя: {e}")
+            return {'text': "", 'words': []}
+    
+    def extract_text_from_image(self, image_path):
+        """
+        Извлечение текста из изображения чертежа
+        image_path: путь к файлу или массив NumPy (grayscale или BGR)
+        """
+        return self.recognize(image_path)['text']
     
     def extract_measurements(self, image_path):
         """
@@ -69,7 +476,13 @@ class OCRProcessor:
         Возвращает: список найденных размеров в миллиметрах
         """
         text = self.extract_text_from_image(image_path)
-        
+        return self.parse_measurements(text)
+    
+    def parse_measurements(self, text):
+        """
+        Поиск размеров в уже распознанном тексте
+        Возвращает: список найденных размеров в миллиметрах
+        """
         if not text:
             return []
         
@@ -107,18 +520,135 @@ class OCRProcessor:
         
         return measurements
     
-    def analyze_page(self, image_path):
+    def has_usable_text_layer(self, text_layer):
+        """
+        Пригоден ли текстовый слой PDF как основной источник текста: достаточно слов
+        и нет мусора из шрифтов без таблицы Unicode
+        """
+        if not text_layer:
+            return False
+        
+        text = text_layer.get('text', '')
+        words = text_layer.get('words', [])
+        if len(words) < MIN_TEXT_LAYER_WORDS:
+            return False
+        
+        bad_chars = sum(1 for ch in text if ch == '\ufffd' or (ord(ch) < 32 and ch not in '\n\t\r'))
+        return bad_chars <= len(text) * 0.05
+    
+    def analyze_page(self, image_path, page_path=None, text_layer=None):
         """
         Полный анализ страницы чертежа
+        image_path: путь к файлу или массив NumPy; page_path - путь для отчета
+        text_layer: текстовый слой PDF {'text', 'words'} - если пригоден, Tesseract не запускается
         """
-        print(f"🔍 Анализ страницы: {image_path}")
+        if page_path is None:
+            page_path = image_path if not isinstance(image_path, np.ndarray) else 'memory'
         
-        # Извлекаем текст
-        text = self.extract_text_from_image(image_path)
+        if self.has_usable_text_layer(text_layer):
+            # Слой может покрывать только штамп и подписи: блоки без его слов распознаются OCR
+            layer_words = text_layer['words']
+            ocr = self.recognize_uncovered(image_path, layer_words)
+            timing = ocr.get('timing', {})
+            print(f"📝 Текстовый слой PDF: {page_path} ({len(layer_words)} слов), "
+                  f"OCR блоков вне слоя: {timing.get('regions_uncovered', 0)}")
+            
+            text = text_layer['text'].strip()
+            if ocr['words']:
+                text = "\n".join(part for part in (text, ocr['text']) if part)
+                text_source = 'pdf_text_layer+tesseract'
+            else:
+                text_source = 'pdf_text_layer'
+            return self.build_result(text, self.parse_measurements(text), page_path,
+                                     text_source=text_source, words=layer_words + ocr['words'],
+                                     timing=timing)
+        
+        print(f"🔍 Анализ страницы: {page_path}")
+        
+        # Один проход OCR: размеры ищутся в уже распознанном тексте
+        ocr = self.recognize(image_path)
+        measurements = self.parse_measurements(ocr['text'])
+        
+        return self.build_result(ocr['text'], measurements, page_path, text_source='tesseract',
+                                 words=ocr['words'], timing=ocr.get('timing'))
+    
+    def get_pool(self, workers):
+        """Долгоживущий пул процессов OCR (создается при первом пакетном анализе)"""
+        with self.pool_lock:
+            if self.pool is None or self.pool_workers != workers:
+                if self.pool is not None:
+                    self.pool.shutdown(wait=False)
+                self.pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=_init_ocr_worker,
+                    initargs=(pytesseract.pytesseract.tesseract_cmd, OCR_THREAD_LIMIT)
+                )
+                self.pool_workers = workers
+                print(f"✅ Пул OCR запущен, процессов: {workers}")
+            return self.pool
+    
+    def shutdown_pool(self):
+        """Остановка пула процессов OCR"""
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=True)
+                self.pool = None
+                self.pool_workers = 0
+    
+    def analyze_pages(self, pages, max_workers=None):
+        """
+        Пакетный анализ страниц в пуле процессов
+        pages: итерируемое (изображение или путь, page_path, text_layer); массивы
+               должны оставаться валидными до выдачи их результата
+        max_workers: число процессов (по умолчанию OCR_WORKERS из .env)
+        Выдает результаты analyze_page строго в порядке страниц; в обработке
+        одновременно не больше 2 * max_workers страниц. Если страница не обработана,
+        вместо результата выдается {'error': ...}
+        """
+        workers = max_workers or OCR_WORKERS
+        if workers <= 1:
+            for image, page_path, text_layer in pages:
+                try:
+                    yield self.analyze_page(image, page_path=page_path, text_layer=text_layer)
+                except Exception as e:
+                    print(f"❌ Ошибка OCR страницы {page_path}: {e}")
+                    yield {'error': str(e)}
+            return
         
-        # Извлекаем измерения
-        measurements = self.extract_measurements(image_path)
+        pool = self.get_pool(workers)
+        in_flight = deque()
         
+        for image, page_path, text_layer in pages:
+            if self.has_usable_text_layer(text_layer) and \
+                    self.has_cached_uncovered(image, text_layer['words']):
+                # Слой есть и блоки вне слоя уже распознаны (кэш) - OCR не нужен, пул не занимаем
+                future = Future()
+                future.set_result(self.analyze_page(image, page_path=page_path, text_layer=text_layer))
+            else:
+                future = pool.submit(_analyze_page_worker, image, page_path, text_layer)
+            in_flight.append((future, image, page_path, text_layer))
+            
+            if len(in_flight) >= workers * 2:
+                yield self._page_result(*in_flight.popleft())
+        
+        while in_flight:
+            yield self._page_result(*in_flight.popleft())
+    
+    def _page_result(self, future, image, page_path, text_layer):
+        """Результат страницы из пула; при сбое процесса - повтор в текущем процессе"""
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"⚠️ Сбой процесса OCR на {page_path}: {e}, повтор в основном процессе")
+        
+        try:
+            return self.analyze_page(image, page_path=page_path, text_layer=text_layer)
+        except Exception as e:
+            print(f"❌ Ошибка OCR страницы {page_path}: {e}")
+            return {'error': str(e)}
+    
+    def build_result(self, text, measurements, page_path, text_source, words=None, timing=None):
+        """Результат анализа страницы: размеры, ключевые слова и превью текста"""
         # Анализ текста на наличие ключевых слов
         keywords = {
             'стена': ['стен', 'стена', 'стены', 'wall'],
@@ -132,23 +662,40 @@ class OCRProcessor:
         found_keywords = []
         text_lower = text.lower()
         
-        for category, words in keywords.items():
-            for word in words:
+        for category, words_list in keywords.items():
+            for word in words_list:
                 if word in text_lower:
                     found_keywords.append(category)
                     break
         
         result = {
-            'page_path': str(image_path),
+            'page_path': str(page_path),
+            'text': text,
             'text_preview': text[:200] + "..." if len(text) > 200 else text,
             'total_text_length': len(text),
             'measurements_count': len(measurements),
             'measurements': measurements,
             'keywords': list(set(found_keywords)),
-            'has_architectural_data': len(measurements) > 0 or len(found_keywords) > 0
+            'has_architectural_data': len(measurements) > 0 or len(found_keywords) > 0,
+            'text_source': text_source,
+            'words': words or [],
+            'timing': timing or {}
         }
         
         return result
 
+
+def _init_ocr_worker(tesseract_cmd, thread_limit):
+    """Инициализация процесса пула: путь к Tesseract и лимит его потоков"""
+    os.environ['OMP_THREAD_LIMIT'] = str(thread_limit)
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def _analyze_page_worker(image, page_path, text_layer):
+    """Анализ одной страницы в процессе пула"""
+    return ocr_processor.analyze_page(image, page_path=page_path, text_layer=text_layer)
+
+
 # Глобальный экземпляр
 ocr_processor = OCRProcessor()
\ No newline at end of file
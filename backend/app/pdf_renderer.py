@@ -0,0 +1,251 @@
+# pdf_renderer.py - Растеризация страниц PDF через PyMuPDF
+# Модуль намеренно легкий (без БД и моделей): его импортируют
+# дочерние процессы пула рендеринга.
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+# Число процессов рендеринга по умолчанию (1 = в текущем процессе)
+RENDER_WORKERS = int(os.getenv('PDF_RENDER_WORKERS', '1'))
+# Чертежам для OCR и детекции достаточно оттенков серого
+RENDER_GRAYSCALE = os.getenv('PDF_RENDER_GRAYSCALE', '1') == '1'
+JPEG_QUALITY = 95
+# Сколько открытых документов держать для ленивого рендеринга
+OPEN_DOCUMENTS_CACHE_SIZE = int(os.getenv('PDF_OPEN_DOCUMENTS', '4'))
+
+
+def render_page_array(doc, page_num: int, dpi=150, grayscale=None):
+    """
+    Однократный рендер страницы (нумерация с 0) в массив NumPy
+
+    В режиме grayscale массив (H, W) смотрит прямо в буфер pixmap без копирования,
+    поэтому pixmap возвращается вместе с массивом и должен жить, пока массив нужен.
+    Цветной режим отдает (H, W, 3) в порядке BGR, как cv2.imread.
+
+    Returns:
+        (pix, image)
+    """
+    if grayscale is None:
+        grayscale = RENDER_GRAYSCALE
+
+    page = doc.load_page(page_num)
+    # Увеличиваем DPI для качества
+    mat = fitz.Matrix(dpi / 72, dpi / 72)
+    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+    pix = page.get_pixmap(matrix=mat, colorspace=colorspace, alpha=False)
+
+    samples = pix.samples_mv if hasattr(pix, 'samples_mv') else pix.samples
+    image = np.frombuffer(samples, dtype=np.uint8)
+    if pix.n == 1:
+        image = image.reshape(pix.height, pix.width)
+    else:
+        image = image.reshape(pix.height, pix.width, pix.n)
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+    return pix, image
+
+
+def save_page_jpeg(image, page_num: int, output_dir: Path) -> str:
+    """Запись отрендеренной страницы (нумерация с 0) на диск как побочный результат"""
+    output_path = Path(output_dir) / f"page_{page_num + 1:03d}.jpg"
+    cv2.imwrite(str(output_path), image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return str(output_path)
+
+
+def render_page_to_file(doc, page_num: int, output_dir: Path, dpi=150) -> str:
+    """Рендер одной страницы (нумерация с 0) в JPEG"""
+    pix, image = render_page_array(doc, page_num, dpi)
+    return save_page_jpeg(image, page_num, output_dir)
+
+
+def extract_text_layer(page, dpi=150):
+    """
+    Встроенный текстовый слой страницы (CAD-экспорт обычно его содержит)
+
+    Returns:
+        {'text': текст страницы, 'words': [{'text', 'x', 'y', 'w', 'h'}]}
+        координаты слов - в пикселях растра с заданным DPI
+    """
+    matrix = page.rotation_matrix * fitz.Matrix(dpi / 72, dpi / 72)
+    words = []
+    for x0, y0, x1, y1, word, *_ in page.get_text("words"):
+        rect = fitz.Rect(x0, y0, x1, y1) * matrix
+        words.append({
+            'text': word,
+            'x': round(rect.x0, 1),
+            'y': round(rect.y0, 1),
+            'w': round(rect.width, 1),
+            'h': round(rect.height, 1)
+        })
+
+    return {'text': page.get_text("text"), 'words': words}
+
+
+def extract_text_layers(pdf_path: Path, dpi=150):
+    """Текстовые слои всех страниц документа (по порядку страниц)"""
+    with fitz.open(str(pdf_path)) as doc:
+        return [extract_text_layer(page, dpi) for page in doc]
+
+
+def iter_rendered_pages(pdf_path: Path, output_dir: Path, dpi=150, grayscale=None, copy=False):
+    """
+    Потоковый рендер документа: каждая страница рендерится один раз,
+    JPEG пишется на диск, а сам буфер отдается дальше (OCR, детекция).
+    Массив действителен только до следующей итерации; copy=True отдает
+    независимые копии (для потребителя, который читает страницы с упреждением).
+
+    Yields:
+        (page_num с 1, путь к JPEG, массив страницы, текстовый слой страницы)
+    """
+    with fitz.open(str(pdf_path)) as doc:
+        print(f"PDF открыт успешно. Страниц: {len(doc)}")
+        for page_num in range(len(doc)):
+            # pix держит буфер массива живым до следующей итерации
+            pix, image = render_page_array(doc, page_num, dpi, grayscale)
+            output_path = save_page_jpeg(image, page_num, output_dir)
+            if copy:
+                image = image.copy()
+            text_layer = extract_text_layer(doc.load_page(page_num), dpi)
+            print(f"Страница {page_num + 1} отрендерена: {output_path}")
+            yield page_num + 1, output_path, image, text_layer
+            del image, pix
+
+
+def _render_pages_worker(pdf_path: str, output_dir: str, page_numbers, dpi):
+    """
+    Воркер пула: открывает документ сам (PyMuPDF не потокобезопасен
+    и объекты fitz нельзя передавать между процессами) и рендерит свой срез страниц
+    """
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in page_numbers:
+            results.append((page_num, render_page_to_file(doc, page_num, Path(output_dir), dpi)))
+    return results
+
+
+def _split_pages(page_count: int, workers: int):
+    """Разбиение страниц на срезы с чередованием: тяжелые листы распределяются равномерно"""
+    return [list(range(start, page_count, workers)) for start in range(workers)]
+
+
+def convert_pdf_to_images_fitz(pdf_path: Path, output_dir: Path, dpi=150, workers=None):
+    """
+    Конвертация PDF в изображения с использованием PyMuPDF
+
+    Args:
+        pdf_path: Путь к PDF
+        output_dir: Папка для JPEG страниц
+        dpi: Разрешение рендеринга
+        workers: Число процессов (по умолчанию PDF_RENDER_WORKERS из .env)
+
+    Returns:
+        Список путей к изображениям в порядке страниц
+    """
+    workers = workers or RENDER_WORKERS
+
+    try:
+        # Открываем PDF
+        with fitz.open(str(pdf_path)) as doc:
+            page_count = len(doc)
+            print(f"PDF открыт успешно. Страниц: {page_count}")
+
+            workers = max(1, min(workers, page_count))
+            if workers == 1:
+                images = []
+                for page_num in range(page_count):
+                    output_path = render_page_to_file(doc, page_num, output_dir, dpi)
+                    images.append(output_path)
+                    print(f"Страница {page_num + 1} сконвертирована: {output_path}")
+                return images
+
+        print(f"Рендеринг в {workers} процессах...")
+        rendered = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_render_pages_worker, str(pdf_path), str(output_dir), pages, dpi)
+                for pages in _split_pages(page_count, workers)
+            ]
+            for future in futures:
+                rendered.extend(future.result())
+
+        # Возвращаем результаты в порядке страниц
+        rendered.sort(key=lambda item: item[0])
+        print(f"Сконвертировано страниц: {len(rendered)}")
+        return [path for _, path in rendered]
+
+    except Exception as e:
+        print(f"Ошибка конвертации PDF: {e}")
+        raise
+
+
+def get_page_sizes(pdf_path: Path, dpi=150):
+    """Число страниц и их размеры (в пунктах и в пикселях при заданном DPI) без рендеринга"""
+    scale = dpi / 72
+    sizes = []
+    with fitz.open(str(pdf_path)) as doc:
+        for page_num, page in enumerate(doc, 1):
+            rect = page.rect
+            sizes.append({
+                'page_num': page_num,
+                'width_pt': round(rect.width, 2),
+                'height_pt': round(rect.height, 2),
+                'width_px': int(round(rect.width * scale)),
+                'height_px': int(round(rect.height * scale))
+            })
+    return sizes
+
+
+class DocumentCache:
+    """
+    Небольшой LRU открытых документов fitz для рендеринга страниц по запросу.
+    Документы PyMuPDF не потокобезопасны, поэтому рендер идет под общей блокировкой.
+    """
+
+    def __init__(self, max_documents=OPEN_DOCUMENTS_CACHE_SIZE):
+        self.max_documents = max_documents
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get_document(self, pdf_path: str):
+        doc = self.documents.get(pdf_path)
+        if doc is not None:
+            self.documents.move_to_end(pdf_path)
+            return doc
+
+        doc = fitz.open(pdf_path)
+        self.documents[pdf_path] = doc
+        while len(self.documents) > self.max_documents:
+            _, oldest = self.documents.popitem(last=False)
+            oldest.close()
+        return doc
+
+    def render_page_to_file(self, pdf_path: Path, page_num: int, output_dir: Path, dpi=150) -> str:
+        """Рендер страницы (нумерация с 1) в JPEG через открытый документ из кэша"""
+        with self.lock:
+            doc = self._get_document(str(pdf_path))
+            if page_num < 1 or page_num > len(doc):
+                raise ValueError(f"Страница {page_num} вне диапазона 1..{len(doc)}")
+            return render_page_to_file(doc, page_num - 1, output_dir, dpi)
+
+    def extract_text_layer(self, pdf_path: Path, page_num: int, dpi=150):
+        """Текстовый слой страницы (нумерация с 1) через открытый документ из кэша"""
+        with self.lock:
+            doc = self._get_document(str(pdf_path))
+            return extract_text_layer(doc.load_page(page_num - 1), dpi)
+
+    def close(self):
+        """Закрытие всех открытых документов"""
+        with self.lock:
+            for doc in self.documents.values():
+                doc.close()
+            self.documents.clear()
+
+
+# Глобальный кэш документов для ленивого рендеринга
+document_cache = DocumentCache()
@@ -0,0 +1,101 @@
+# profile_imports.py - Профиль времени импорта сервера (python -X importtime)
+# Запуск из backend/: python app/profile_imports.py [--module app.main] [--top 25] [--json отчет.json]
+# Показывает, сколько занимает импорт main и какие пакеты его съедают,
+# и проверяет, что тяжелые ML-библиотеки не грузятся при импорте (только при прогреве).
+import argparse
+import json
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+# Должны импортироваться лениво (прогрев в фоне или первый запрос)
+HEAVY_PACKAGES = ('torch', 'ultralytics', 'sklearn', 'onnxruntime', 'openvino', 'tesserocr')
+
+LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def run_importtime(module: str):
+    """Импорт модуля в отдельном процессе с -X importtime; возвращает строки профиля"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=str(BACKEND_DIR), capture_output=True, text=True, encoding='utf-8', errors='replace'
+    )
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append({
+                'module': name,
+                'self_ms': int(self_us) / 1000,
+                'cumulative_ms': int(cumulative_us) / 1000,
+                'depth': (len(indent) - 1) // 2
+            })
+    return entries, completed.returncode, completed.stderr
+
+
+def summarize(entries, module: str, top: int):
+    """Итог импорта, пакеты верхнего уровня по суммарному времени и тяжелые пакеты"""
+    total = next((e['cumulative_ms'] for e in reversed(entries) if e['module'] == module), None)
+
+    # Время пакета - его корневой импорт (самая большая cumulative по корню имени)
+    packages = {}
+    for entry in entries:
+        root = entry['module'].split('.')[0]
+        packages[root] = max(packages.get(root, 0), entry['cumulative_ms'])
+    packages.pop(module.split('.')[0], None)
+
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    loaded_heavy = {name: round(packages[name], 1) for name in HEAVY_PACKAGES if name in packages}
+
+    return {
+        'module': module,
+        'total_ms': round(total, 1) if total is not None else None,
+        'modules_imported': len(entries),
+        'top_packages': [{'package': name, 'cumulative_ms': round(ms, 1)} for name, ms in heaviest],
+        'heavy_packages_loaded': loaded_heavy
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Профиль времени импорта сервера")
+    parser.add_argument('--module', default='app.main')
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument('--json', help="Сохранить отчет в JSON")
+    args = parser.parse_args()
+
+    print(f"⏳ python -X importtime -c 'import {args.module}' (из {BACKEND_DIR})")
+    entries, returncode, stderr = run_importtime(args.module)
+    if returncode != 0:
+        print("❌ Импорт завершился ошибкой:")
+        print("\n".join(line for line in stderr.splitlines() if not line.startswith('import time:')))
+        return
+
+    report = summarize(entries, args.module, args.top)
+
+    print("=" * 60)
+    print(f"📦 Импорт {report['module']}: {report['total_ms']} мс, модулей: {report['modules_imported']}")
+    print("=" * 60)
+    print(f"{'пакет':<30}{'мс':>12}")
+    for item in report['top_packages']:
+        print(f"{item['package']:<30}{item['cumulative_ms']:>12.1f}")
+    print("=" * 60)
+
+    if report['heavy_packages_loaded']:
+        print("⚠️ Тяжелые пакеты грузятся при импорте:")
+        for name, ms in report['heavy_packages_loaded'].items():
+            print(f"   {name}: {ms} мс")
+    else:
+        print(f"✅ Тяжелые пакеты ({', '.join(HEAVY_PACKAGES)}) при импорте не грузятся")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📄 Отчет: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+# quantize_yolo.py - INT8 квантование детектора стен для CPU (ONNX Runtime)
+# 1. Экспорт FP32 весов в ONNX (как бэкенд onnx в cv_model)
+# 2. Статическая калибровка на наших страницах из processed_images
+# 3. Сравнение FP32 и INT8 на отложенных страницах: задержка и совпадение обнаружений,
+#    при наличии размеченного датасета - еще и mAP
+# Результат: <веса>_int8.onnx рядом с весами (CV_BACKEND=onnx_int8) и отчет <веса>_int8_report.json
+import json
+import os
+import random
+import re
+import statistics
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from ultralytics import YOLO
+
+load_dotenv()
+
+BACKEND_DIR = Path(__file__).parent.parent
+PROCESSED_DIR = BACKEND_DIR / "processed_images"
+DATASET_YAML = BACKEND_DIR / "yolo_dataset_fixed" / "dataset.yaml"
+MODEL_PATH = Path(os.getenv('YOLO_MODEL_PATH', 'yolov8n-seg.pt'))
+
+# Размер входа: как в cv_model (YOLO_IMGSZ, иначе imgsz обучения из чекпойнта, иначе 640)
+YOLO_IMGSZ = int(os.getenv('YOLO_IMGSZ', '0'))
+CALIBRATION_IMAGES = 64   # сколько страниц для калибровки
+HOLDOUT_FRACTION = 0.2    # доля страниц, отложенных для сравнения (в калибровку не попадают)
+MAX_HOLDOUT_IMAGES = 50
+MATCH_IOU = 0.5
+SEED = 42
+
+
+def read_imgsz(weights: Path) -> int:
+    """Размер входа, на котором работает сервер: YOLO_IMGSZ или train_args чекпойнта, иначе 640"""
+    if YOLO_IMGSZ:
+        return YOLO_IMGSZ
+    try:
+        imgsz = (YOLO(str(weights)).ckpt or {}).get('train_args', {}).get('imgsz')
+    except Exception:
+        imgsz = None
+    if isinstance(imgsz, (list, tuple)):
+        imgsz = max(imgsz)
+    return int(imgsz or 640)
+
+
+def int8_model_path(weights: Path) -> Path:
+    """Имя INT8 модели рядом с весами (его же ищет cv_model для бэкенда onnx_int8)"""
+    return weights.parent / f"{weights.stem}_int8.onnx"
+
+
+def collect_pages():
+    """Все страницы из processed_images, разбитые на калибровочные и отложенные"""
+    pages = sorted(p for p in PROCESSED_DIR.glob("*/page_*.jpg"))
+    random.Random(SEED).shuffle(pages)
+
+    holdout_count = min(MAX_HOLDOUT_IMAGES, max(1, int(len(pages) * HOLDOUT_FRACTION)))
+    holdout = pages[:holdout_count]
+    calibration = pages[holdout_count:holdout_count + CALIBRATION_IMAGES]
+    return calibration, holdout
+
+
+def letterbox(image: np.ndarray, size: int) -> np.ndarray:
+    """Подготовка входа как в ultralytics: вписывание с полями 114, RGB, NCHW float32 0..1"""
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - new_h) // 2, (size - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+
+    rgb = cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB)
+    return np.ascontiguousarray(rgb.transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+class PagesCalibrationReader:
+    """Источник калибровочных данных для ONNX Runtime: по одной странице за раз"""
+
+    def __init__(self, pages, input_name, imgsz):
+        self.pages = iter(pages)
+        self.input_name = input_name
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for page in self.pages:
+            image = cv2.imread(str(page))
+            if image is not None:
+                return {self.input_name: letterbox(image, self.imgsz)}
+        return None
+
+
+def export_fp32(weights: Path, imgsz: int) -> Path:
+    """FP32 ONNX рядом с весами (повторно - только если веса обновились)"""
+    target = weights.with_suffix(".onnx")
+    if not weights.exists():
+        YOLO(str(weights))  # ultralytics скачает стандартные веса
+
+    if target.exists() and target.stat().st_mtime >= weights.stat().st_mtime:
+        print(f"✅ FP32 ONNX уже есть: {target}")
+        return target
+
+    print(f"📦 Экспорт {weights} в ONNX...")
+    return Path(YOLO(str(weights)).export(format="onnx", imgsz=imgsz, dynamic=True))
+
+
+def head_node_names(model) -> list:
+    """
+    Узлы головы (последний модуль ultralytics: Detect/Segment) - они остаются в FP32.
+    Экспорт ultralytics называет узлы по модулям: /model.<номер>/...
+    """
+    indices = {}
+    for node in model.graph.node:
+        match = re.match(r'^/model\.(\d+)/', node.name)
+        if match:
+            indices.setdefault(int(match.group(1)), []).append(node.name)
+    return indices[max(indices)] if indices else []
+
+
+def quantize(fp32_path: Path, int8_path: Path, calibration_pages, imgsz: int):
+    """Статическое INT8 квантование (QDQ, веса по каналам) с калибровкой на страницах"""
+    import onnx
+    import onnxruntime as ort
+    from onnxruntime.quantization import (CalibrationMethod, QuantFormat, QuantType,
+                                          quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepared_path = fp32_path.with_name(f"{fp32_path.stem}_prep.onnx")
+    quant_pre_process(str(fp32_path), str(prepared_path))
+
+    input_name = ort.InferenceSession(str(prepared_path), providers=["CPUExecutionProvider"]) \
+        .get_inputs()[0].name
+    reader = PagesCalibrationReader(calibration_pages, input_name, imgsz)
+    head_nodes = head_node_names(onnx.load(str(prepared_path)))
+
+    print(f"⏳ Калибровка на {len(calibration_pages)} страницах...")
+    quantize_static(
+        str(prepared_path),
+        str(int8_path),
+        reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+        calibrate_method=CalibrationMethod.Percentile,
+        # Свертки и матричные умножения дают почти весь выигрыш; голова остается в FP32
+        op_types_to_quantize=["Conv", "MatMul"],
+        nodes_to_exclude=head_nodes
+    )
+    prepared_path.unlink(missing_ok=True)
+
+    # Метаданные ultralytics (классы, stride, imgsz, задача) нужны для загрузки через YOLO()
+    fp32_model = onnx.load(str(fp32_path))
+    int8_model = onnx.load(str(int8_path))
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, str(int8_path))
+
+    print(f"✅ INT8 модель: {int8_path} "
+          f"({fp32_path.stat().st_size / 1024 / 1024:.1f} -> {int8_path.stat().st_size / 1024 / 1024:.1f} MB)")
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Матрица IoU рамок xyxy"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def run_model(model_path: Path, pages, imgsz: int):
+    """Обнаружения и задержка на каждой отложенной странице"""
+    model = YOLO(str(model_path))
+    model(source=np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, device="cpu", verbose=False)
+
+    boxes, latencies = [], []
+    for page in pages:
+        started = time.perf_counter()
+        result = model(source=str(page), imgsz=imgsz, conf=0.2, device="cpu", verbose=False)[0]
+        latencies.append((time.perf_counter() - started) * 1000)
+        boxes.append(result.boxes.xyxy.cpu().numpy() if result.boxes is not None else np.zeros((0, 4)))
+    return boxes, latencies
+
+
+def agreement(reference, candidate):
+    """Совпадение обнаружений INT8 с FP32 (FP32 - эталон) при IoU >= MATCH_IOU"""
+    matched, total_ref, total_cand, ious = 0, 0, 0, []
+    for ref, cand in zip(reference, candidate):
+        total_ref += len(ref)
+        total_cand += len(cand)
+        iou = box_iou(ref, cand)
+        # Жадное сопоставление: каждая рамка INT8 засчитывается не более одного раза
+        order = np.argsort(-iou.max(axis=1)) if iou.size else []
+        for i in order:
+            j = int(np.argmax(iou[i]))
+            if iou[i, j] >= MATCH_IOU:
+                matched += 1
+                ious.append(float(iou[i, j]))
+                iou[:, j] = -1
+
+    return {
+        'fp32_boxes': total_ref,
+        'int8_boxes': total_cand,
+        'recall_vs_fp32': round(matched / total_ref, 4) if total_ref else 1.0,
+        'precision_vs_fp32': round(matched / total_cand, 4) if total_cand else 1.0,
+        'mean_iou_matched': round(statistics.mean(ious), 4) if ious else None
+    }
+
+
+def latency_summary(latencies):
+    ordered = sorted(latencies)
+    return {
+        'mean_ms': round(statistics.mean(ordered), 1),
+        'p50_ms': round(ordered[len(ordered) // 2], 1),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1)
+    }
+
+
+def dataset_map(model_path: Path, imgsz: int):
+    """mAP50 на размеченной валидации (если датасет есть)"""
+    if not DATASET_YAML.exists():
+        return None
+    try:
+        metrics = YOLO(str(model_path)).val(data=str(DATASET_YAML), imgsz=imgsz, device="cpu",
+                                             verbose=False, plots=False)
+        return round(float(metrics.box.map50), 4)
+    except Exception as e:
+        print(f"⚠️ Валидация на датасете не удалась: {e}")
+        return None
+
+
+def main():
+    print("=" * 60)
+    print("🧮 INT8 КВАНТОВАНИЕ ДЕТЕКТОРА СТЕН")
+    print("=" * 60)
+
+    calibration, holdout = collect_pages()
+    if not calibration or not holdout:
+        print(f"❌ Мало страниц в {PROCESSED_DIR}: нужна хотя бы пара обработанных страниц")
+        return
+
+    imgsz = read_imgsz(MODEL_PATH)
+    print(f"📁 Веса: {MODEL_PATH}, вход {imgsz}px")
+    print(f"📄 Калибровка: {len(calibration)} стр., отложено для сравнения: {len(holdout)} стр.")
+
+    fp32_path = export_fp32(MODEL_PATH, imgsz)
+    int8_path = int8_model_path(MODEL_PATH)
+    quantize(fp32_path, int8_path, calibration, imgsz)
+
+    print("\n⏳ Сравнение FP32 и INT8 на отложенных страницах...")
+    fp32_boxes, fp32_latency = run_model(fp32_path, holdout, imgsz)
+    int8_boxes, int8_latency = run_model(int8_path, holdout, imgsz)
+
+    fp32_summary = latency_summary(fp32_latency)
+    int8_summary = latency_summary(int8_latency)
+    speedup = round(fp32_summary['mean_ms'] / int8_summary['mean_ms'], 2)
+    match = agreement(fp32_boxes, int8_boxes)
+
+    report = {
+        'weights': str(MODEL_PATH),
+        'imgsz': imgsz,
+        'fp32_model': str(fp32_path),
+        'int8_model': str(int8_path),
+        'calibration_pages': len(calibration),
+        'holdout_pages': [str(p) for p in holdout],
+        'latency': {'fp32': fp32_summary, 'int8': int8_summary, 'speedup': speedup},
+        'agreement': match,
+        'map50': {'fp32': dataset_map(fp32_path, imgsz), 'int8': dataset_map(int8_path, imgsz)},
+        'size_mb': {
+            'fp32': round(fp32_path.stat().st_size / 1024 / 1024, 2),
+            'int8': round(int8_path.stat().st_size / 1024 / 1024, 2)
+        },
+        # Порог: заметно быстрее и почти все обнаружения FP32 сохранены
+        'recommend_int8': speedup >= 1.3 and match['recall_vs_fp32'] >= 0.9,
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+    report_path = MODEL_PATH.parent / f"{MODEL_PATH.stem}_int8_report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print("\n" + "=" * 60)
+    print(f"⚡ Задержка: FP32 {fp32_summary['mean_ms']} мс, INT8 {int8_summary['mean_ms']} мс (x{speedup})")
+    print(f"🎯 Совпадение с FP32: recall {match['recall_vs_fp32']}, precision {match['precision_vs_fp32']}")
+    if report['map50']['fp32'] is not None:
+        print(f"📊 mAP50: FP32 {report['map50']['fp32']}, INT8 {report['map50']['int8']}")
+    print(f"{'✅ Рекомендуется' if report['recommend_int8'] else '⚠️ Не рекомендуется'} "
+          f"включить CV_BACKEND=onnx_int8")
+    print(f"📄 Отчет: {report_path}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -44,7 +44,7 @@ except Exception as e:
 try:
     print("4. Проверка CV модели...")
     import cv_model
-    from cv_model import cv_model as cv_model_instance
+    from cv_model import get_default_model
     print("✅ CV модель импортирована")
     print(f"   Файл: {cv_model.__file__}")
 except Exception as e:
@@ -0,0 +1,127 @@
+# tiles.py - Пирамида тайлов (deep zoom) для больших чертежей
+import json
+import math
+import os
+import threading
+from pathlib import Path
+
+import cv2
+
+# Размер тайла в пикселях
+TILE_SIZE = int(os.getenv('TILE_SIZE', '256'))
+TILE_JPEG_QUALITY = 85
+
+
+def get_pyramid_info(width: int, height: int, tile_size: int = TILE_SIZE):
+    """
+    Описание пирамиды: уровень max_zoom - исходное разрешение,
+    каждый уровень ниже в 2 раза меньше, уровень 0 помещается в один тайл
+    """
+    max_zoom = max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+    levels = []
+    for z in range(max_zoom + 1):
+        scale = 2 ** (z - max_zoom)
+        level_width = max(1, math.ceil(width * scale))
+        level_height = max(1, math.ceil(height * scale))
+        levels.append({
+            'z': z,
+            'scale': scale,
+            'width': level_width,
+            'height': level_height,
+            'cols': math.ceil(level_width / tile_size),
+            'rows': math.ceil(level_height / tile_size)
+        })
+
+    return {
+        'width': width,
+        'height': height,
+        'tile_size': tile_size,
+        'max_zoom': max_zoom,
+        'levels': levels
+    }
+
+
+class TilePyramid:
+    """
+    Лениво строящаяся пирамида тайлов страницы.
+    Строится целиком при первом обращении (одно декодирование страницы)
+    и кэшируется на диске рядом с изображением.
+    """
+
+    def __init__(self, tile_size: int = TILE_SIZE):
+        self.tile_size = tile_size
+        self.locks = {}
+        self.locks_guard = threading.Lock()
+
+    def _lock_for(self, tiles_dir: Path):
+        with self.locks_guard:
+            return self.locks.setdefault(str(tiles_dir), threading.Lock())
+
+    def _is_fresh(self, image_path: Path, tiles_dir: Path) -> bool:
+        info_path = tiles_dir / "info.json"
+        return info_path.exists() and info_path.stat().st_mtime >= Path(image_path).stat().st_mtime
+
+    def build(self, image_path: Path, tiles_dir: Path, image=None):
+        """
+        Построение всех уровней пирамиды
+
+        Args:
+            image_path: JPEG страницы (источник и отметка свежести)
+            tiles_dir: Папка для тайлов страницы
+            image: Уже декодированная страница (например, буфер рендера), чтобы не читать с диска
+        """
+        if image is None:
+            image = cv2.imread(str(image_path), cv2.IMREAD_UNCHANGED)
+            if image is None:
+                raise FileNotFoundError(f"Изображение не найдено: {image_path}")
+
+        height, width = image.shape[:2]
+        info = get_pyramid_info(width, height, self.tile_size)
+        params = [cv2.IMWRITE_JPEG_QUALITY, TILE_JPEG_QUALITY]
+
+        # От крупного уровня к мелкому, каждый следующий - уменьшение предыдущего в 2 раза
+        level_image = image
+        for level in reversed(info['levels']):
+            if level_image.shape[1] != level['width'] or level_image.shape[0] != level['height']:
+                level_image = cv2.resize(level_image, (level['width'], level['height']),
+                                         interpolation=cv2.INTER_AREA)
+
+            level_dir = tiles_dir / str(level['z'])
+            level_dir.mkdir(parents=True, exist_ok=True)
+            for row in range(level['rows']):
+                for col in range(level['cols']):
+                    y0, x0 = row * self.tile_size, col * self.tile_size
+                    tile = level_image[y0:y0 + self.tile_size, x0:x0 + self.tile_size]
+                    cv2.imwrite(str(level_dir / f"{col}_{row}.jpg"), tile, params)
+
+        # info.json пишется последним: он же признак готовой пирамиды
+        with open(tiles_dir / "info.json", "w", encoding="utf-8") as f:
+            json.dump(info, f)
+
+        print(f"🧩 Пирамида тайлов построена: {tiles_dir} ({info['max_zoom'] + 1} уровней)")
+        return info
+
+    def ensure(self, image_path: Path, tiles_dir: Path, image=None):
+        """Пирамида страницы (строится при первом обращении или если страница обновилась)"""
+        tiles_dir = Path(tiles_dir)
+        with self._lock_for(tiles_dir):
+            if self._is_fresh(image_path, tiles_dir):
+                with open(tiles_dir / "info.json", "r", encoding="utf-8") as f:
+                    return json.load(f)
+            return self.build(image_path, tiles_dir, image)
+
+    def get_tile(self, image_path: Path, tiles_dir: Path, z: int, x: int, y: int):
+        """Путь к тайлу или None, если такого тайла нет"""
+        info = self.ensure(image_path, tiles_dir)
+        if z < 0 or z > info['max_zoom']:
+            return None
+
+        level = info['levels'][z]
+        if x < 0 or y < 0 or x >= level['cols'] or y >= level['rows']:
+            return None
+
+        return Path(tiles_dir) / str(z) / f"{x}_{y}.jpg"
+
+
+# Глобальный экземпляр
+tile_pyramid = TilePyramid()
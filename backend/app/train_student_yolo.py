@@ -0,0 +1,235 @@
+# train_student_yolo.py - Облегченная модель стен, обученная на псевдоразметке дообученной модели
+# Учитель: дообученный yolov8n-seg из ml_models (train_yolo_real.py).
+# Ученик: более узкая архитектура YOLOv8-seg (width_multiple вдвое меньше, чем у "n"),
+# один класс "wall", меньший вход. Учится с нуля на разметке датасета
+# и на жесткой псевдоразметке учителя (полигоны масок) по страницам из processed_images.
+# Упрощение сознательное: это не прунинг весов учителя и не дистилляция с мягкими
+# целями (веса учителя не наследуются, функция потерь - стандартная ultralytics).
+# В конце - mAP и задержка на CPU учителя и ученика рядом, отчет в ml_models/student_report.json.
+# Подключение ученика: YOLO_MODEL_PATH=app/ml_models/best_walls_student.pt (размер входа cv_model берет из чекпойнта)
+import json
+import os
+import shutil
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import yaml
+from ultralytics import YOLO
+
+BACKEND_DIR = Path(__file__).parent.parent
+APP_DIR = Path(__file__).parent
+PROCESSED_DIR = BACKEND_DIR / "processed_images"
+DATASET_DIR = BACKEND_DIR / "yolo_dataset_fixed"
+DATASET_YAML = DATASET_DIR / "dataset.yaml"
+STUDENT_DATASET_DIR = BACKEND_DIR / "yolo_dataset_student"
+MODELS_DIR = APP_DIR / "ml_models"
+
+TEACHER_CANDIDATES = [
+    MODELS_DIR / "best_walls_yolo.pt",
+    MODELS_DIR / "walls_yolo_v1" / "weights" / "best.pt"
+]
+STUDENT_PATH = MODELS_DIR / "best_walls_student.pt"
+
+TEACHER_IMGSZ = 640
+STUDENT_IMGSZ = int(os.getenv('STUDENT_IMGSZ', '416'))
+# Ширина ученика относительно "n" (0.25): 0.125 - вдвое меньше каналов в каждом слое
+STUDENT_WIDTH = float(os.getenv('STUDENT_WIDTH', '0.125'))
+STUDENT_DEPTH = 0.33
+PSEUDO_LABEL_CONF = 0.35
+EPOCHS = 100
+LATENCY_IMAGES = 20
+
+
+def find_teacher():
+    for path in TEACHER_CANDIDATES:
+        if path.exists():
+            return path
+    return None
+
+
+def build_student_config() -> Path:
+    """Конфиг ученика: YOLOv8-seg с уменьшенной шириной и одним классом (обучается с нуля)"""
+    from ultralytics.nn.tasks import yaml_model_load
+
+    config = yaml_model_load("yolov8n-seg.yaml")
+    config.pop("scales", None)
+    config.pop("scale", None)
+    config.pop("yaml_file", None)
+    config["nc"] = 1
+    config["depth_multiple"] = STUDENT_DEPTH
+    config["width_multiple"] = STUDENT_WIDTH
+
+    config_path = MODELS_DIR / "walls_student-seg.yaml"
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+    return config_path
+
+
+def teacher_wall_classes(teacher):
+    """Классы учителя, которые считаются стеной (у дообученной модели - класс wall)"""
+    wall = [cls for cls, name in teacher.names.items() if str(name).lower() == "wall"]
+    return wall or list(teacher.names.keys())
+
+
+def write_pseudo_labels(teacher, images, labels_dir: Path, images_dir: Path):
+    """Псевдоразметка учителя: полигоны масок в формате YOLO-seg (класс 0)"""
+    wall_classes = set(teacher_wall_classes(teacher))
+    labeled = 0
+
+    for image_path in images:
+        result = teacher(source=str(image_path), imgsz=TEACHER_IMGSZ, conf=PSEUDO_LABEL_CONF,
+                         device="cpu", verbose=False)[0]
+        lines = []
+        if result.masks is not None:
+            for polygon, cls in zip(result.masks.xyn, result.boxes.cls.cpu().numpy()):
+                if int(cls) in wall_classes and len(polygon) >= 3:
+                    coords = " ".join(f"{v:.6f}" for v in np.asarray(polygon).reshape(-1))
+                    lines.append(f"0 {coords}")
+
+        name = f"{image_path.parent.name}_{image_path.stem}"
+        shutil.copy2(image_path, images_dir / f"{name}{image_path.suffix}")
+        with open(labels_dir / f"{name}.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        labeled += bool(lines)
+
+    return labeled
+
+
+def build_student_dataset(teacher) -> Path:
+    """Датасет ученика: разметка датасета + псевдоразметка учителя, валидация - настоящая разметка"""
+    with open(DATASET_YAML, "r", encoding="utf-8") as f:
+        dataset_config = yaml.safe_load(f)
+
+    if STUDENT_DATASET_DIR.exists():
+        shutil.rmtree(STUDENT_DATASET_DIR)
+    for split in ("train", "val"):
+        (STUDENT_DATASET_DIR / "images" / split).mkdir(parents=True)
+        (STUDENT_DATASET_DIR / "labels" / split).mkdir(parents=True)
+
+    # Размеченные изображения переносятся как есть
+    for split in ("train", "val"):
+        source_images = DATASET_DIR / dataset_config.get(split, f"images/{split}")
+        for image_path in list(source_images.glob("*.jpg")) + list(source_images.glob("*.png")):
+            shutil.copy2(image_path, STUDENT_DATASET_DIR / "images" / split / image_path.name)
+            label_path = DATASET_DIR / "labels" / split / f"{image_path.stem}.txt"
+            if label_path.exists():
+                shutil.copy2(label_path, STUDENT_DATASET_DIR / "labels" / split / label_path.name)
+
+    # Неразмеченные страницы проектов получают разметку учителя
+    pages = sorted(PROCESSED_DIR.glob("*/page_*.jpg"))
+    print(f"⏳ Псевдоразметка учителем: {len(pages)} страниц...")
+    labeled = write_pseudo_labels(teacher, pages, STUDENT_DATASET_DIR / "labels" / "train",
+                                  STUDENT_DATASET_DIR / "images" / "train")
+    print(f"✅ Страниц со стенами по мнению учителя: {labeled}")
+
+    student_yaml = STUDENT_DATASET_DIR / "dataset.yaml"
+    with open(student_yaml, "w", encoding="utf-8") as f:
+        yaml.safe_dump({
+            "path": str(STUDENT_DATASET_DIR),
+            "train": "images/train",
+            "val": "images/val",
+            "names": {0: "wall"}
+        }, f, allow_unicode=True, sort_keys=False)
+    return student_yaml
+
+
+def measure_latency(model, imgsz, images):
+    """Средняя задержка на изображение на CPU (после прогрева)"""
+    model(source=np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, device="cpu", verbose=False)
+    latencies = []
+    for image_path in images:
+        started = time.perf_counter()
+        model(source=str(image_path), imgsz=imgsz, device="cpu", verbose=False)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return round(statistics.mean(latencies), 1) if latencies else None
+
+
+def evaluate(model, imgsz, images):
+    """mAP на настоящей валидации, число параметров и задержка"""
+    metrics = model.val(data=str(DATASET_YAML), imgsz=imgsz, device="cpu", plots=False, verbose=False)
+    seg = getattr(metrics, "seg", None)
+    return {
+        "imgsz": imgsz,
+        "parameters": sum(p.numel() for p in model.model.parameters()),
+        "box_map50": round(float(metrics.box.map50), 4),
+        "box_map50_95": round(float(metrics.box.map), 4),
+        "mask_map50": round(float(seg.map50), 4) if seg is not None else None,
+        "latency_ms": measure_latency(model, imgsz, images)
+    }
+
+
+def main():
+    print("=" * 70)
+    print("🎓 ОБУЧЕНИЕ ОБЛЕГЧЕННОЙ МОДЕЛИ СТЕН НА ПСЕВДОРАЗМЕТКЕ УЧИТЕЛЯ")
+    print("=" * 70)
+
+    teacher_path = find_teacher()
+    if teacher_path is None:
+        print("❌ Дообученная модель не найдена, сначала запустите train_yolo_real.py")
+        return
+    if not DATASET_YAML.exists():
+        print(f"❌ Файл dataset.yaml не найден: {DATASET_YAML}")
+        return
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    print(f"👨‍🏫 Учитель: {teacher_path}")
+    print(f"🧒 Ученик: ширина x{STUDENT_WIDTH}, вход {STUDENT_IMGSZ}px, 1 класс")
+    print(f"💻 Устройство для обучения: {device}")
+
+    teacher = YOLO(str(teacher_path))
+    student_yaml = build_student_dataset(teacher)
+
+    student = YOLO(str(build_student_config()), task="segment")
+    print("\n⏳ Обучение ученика...")
+    student.train(
+        data=str(student_yaml),
+        epochs=EPOCHS,
+        imgsz=STUDENT_IMGSZ,
+        batch=8,
+        device=device,
+        workers=2,
+        patience=20,
+        seed=42,
+        project=str(MODELS_DIR),
+        name="walls_student",
+        exist_ok=True,
+        verbose=True
+    )
+
+    best_student = MODELS_DIR / "walls_student" / "weights" / "best.pt"
+    shutil.copy2(best_student, STUDENT_PATH)
+    print(f"💾 Ученик сохранен: {STUDENT_PATH}")
+
+    val_dir = DATASET_DIR / "images" / "val"
+    latency_images = (list(val_dir.glob("*.jpg")) + list(val_dir.glob("*.png")))[:LATENCY_IMAGES]
+
+    print("\n⏳ Сравнение учителя и ученика...")
+    report = {
+        "teacher": {"path": str(teacher_path), **evaluate(YOLO(str(teacher_path)), TEACHER_IMGSZ, latency_images)},
+        "student": {"path": str(STUDENT_PATH), **evaluate(YOLO(str(STUDENT_PATH)), STUDENT_IMGSZ, latency_images)},
+        "student_config": {"width_multiple": STUDENT_WIDTH, "depth_multiple": STUDENT_DEPTH,
+                           "pseudo_label_conf": PSEUDO_LABEL_CONF,
+                           "method": "hard pseudo-labels, trained from scratch (no pruning, no soft targets)"},
+        "created_at": time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+    report_path = MODELS_DIR / "student_report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print("\n" + "=" * 70)
+    print(f"{'':<14}{'параметры':>12}{'вход':>8}{'mAP50 box':>12}{'mAP50 mask':>12}{'CPU, мс':>10}")
+    for role in ("teacher", "student"):
+        r = report[role]
+        print(f"{role:<14}{r['parameters']:>12,}{r['imgsz']:>8}{r['box_map50']:>12}"
+              f"{str(r['mask_map50']):>12}{str(r['latency_ms']):>10}")
+    print("=" * 70)
+    print(f"📄 Отчет: {report_path}")
+    print(f"🚀 Подключение: YOLO_MODEL_PATH={STUDENT_PATH.relative_to(BACKEND_DIR).as_posix()} в .env")
+
+
+if __name__ == "__main__":
+    main()
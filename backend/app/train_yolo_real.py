@@ -135,6 +135,25 @@ try:
             # Показываем размер
             size_mb = dest_best.stat().st_size / (1024 * 1024)
             print(f"📦 Размер модели: {size_mb:.1f} MB")
+            
+            # Версия в реестре моделей (best_walls_yolo.pt перезаписывается при каждом обучении)
+            try:
+                from datetime import datetime
+                from database import db
+                
+                versioned = MODELS_DIR / f"walls_yolo_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pt"
+                shutil.copy2(best_model, versioned)
+                metrics = getattr(results, 'results_dict', {}) or {}
+                record = db.register_model(
+                    'walls_yolo_v1', 'yolo', str(versioned),
+                    accuracy=metrics.get('metrics/mAP50(M)', metrics.get('metrics/mAP50(B)', 0.0)),
+                    metadata={'dataset': str(DATASET_YAML), 'imgsz': 640}
+                )
+                if record:
+                    print(f"📦 Зарегистрирована версия {record['version']} (id {record['id']})")
+                    print(f"   Включить: POST /api/models/{record['id']}/activate")
+            except Exception as e:
+                print(f"⚠️ Модель не зарегистрирована в реестре: {e}")
         
         # Показываем все файлы в папке
         print(f"\n📋 Содержимое папки {trained_model_dir.name}:")
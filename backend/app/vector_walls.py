@@ -0,0 +1,332 @@
+# vector_walls.py - Извлечение стен прямо из векторной графики PDF
+# Для CAD-экспорта линии стен уже есть в PDF: не нужно ни растеризовать страницу,
+# ни запускать Canny/Hough или YOLO.
+from pathlib import Path
+from typing import Any, Dict, List
+
+import fitz  # PyMuPDF
+import numpy as np
+
+# Параметры по умолчанию (толщины - в пунктах PDF, длины - в пикселях результата)
+DEFAULT_PARAMS = {
+    'min_stroke_width': 0.5,    # тоньше - размерные и выносные линии
+    'max_stroke_width': 20.0,
+    'min_length_px': 60,        # короче - штриховка, засечки, текст
+    'angle_tolerance_deg': 2.0, # допуск на горизонталь/вертикаль
+    'merge_gap_px': 6,          # разрыв, который еще считается одной линией
+    'merge_offset_px': 3,       # допуск по смещению коллинеарных отрезков
+    'max_wall_thickness_px': 30,  # параллельные контуры ближе этого - две стороны одной стены
+    'min_pair_overlap': 0.5,    # доля более короткого контура, которую должен перекрывать второй
+    'min_segments': 50          # меньше отрезков (l/re/qu во всех путях) - страница растровая
+}
+
+# Операторы рисования, которые считаются отрезками векторной графики
+SEGMENT_KINDS = ('l', 're', 'qu')
+
+
+def _solid_wall_axis(rect, params):
+    """Ось залитого узкого прямоугольника (это сама стена) или None, если он не похож на стену"""
+    short_side = min(rect.width, rect.height)
+    long_side = max(rect.width, rect.height)
+    if not (params['min_stroke_width'] <= short_side <= params['max_stroke_width']
+            and long_side >= 4 * short_side):
+        return None
+
+    if rect.width >= rect.height:
+        cy = (rect.y0 + rect.y1) / 2
+        return (rect.x0, cy, rect.x1, cy, short_side)
+    cx = (rect.x0 + rect.x1) / 2
+    return (cx, rect.y0, cx, rect.y1, short_side)
+
+
+def _collect_segments(page, drawings, params) -> List[tuple]:
+    """
+    Отрезки стен из операторов рисования страницы
+
+    Returns:
+        Список (x1, y1, x2, y2, толщина) в координатах отрендеренной страницы (пункты)
+    """
+    segments = []
+    rotation = page.rotation_matrix
+
+    for path in drawings:
+        width = path.get('width') or 0.0
+        is_filled = path.get('fill') is not None
+        is_stroked = params['min_stroke_width'] <= width <= params['max_stroke_width']
+        items = path.get('items', [])
+
+        if is_filled and not is_stroked:
+            # Залитая полилиния без обводки (частый CAD-экспорт стен): узкая - берем ось,
+            # иначе ее ребра идут как контуры и потом собираются в стены попарно
+            edges = [(item[1] * rotation, item[2] * rotation) for item in items if item[0] == 'l']
+            if edges:
+                bounds = fitz.Rect(edges[0][0], edges[0][0])
+                for p1, p2 in edges:
+                    bounds |= p1
+                    bounds |= p2
+                axis = _solid_wall_axis(bounds, params)
+                if axis is not None:
+                    segments.append(axis)
+                else:
+                    segments.extend((p1.x, p1.y, p2.x, p2.y, 0.0) for p1, p2 in edges)
+
+        for item in items:
+            kind = item[0]
+
+            if kind == 'l' and is_stroked:
+                p1, p2 = item[1] * rotation, item[2] * rotation
+                segments.append((p1.x, p1.y, p2.x, p2.y, width))
+
+            elif kind == 're':
+                rect = item[1] * rotation
+                rect.normalize()
+                axis = _solid_wall_axis(rect, params) if is_filled else None
+
+                if axis is not None:
+                    segments.append(axis)
+
+                elif is_stroked:
+                    # Обводка прямоугольника - четыре ребра
+                    x0, y0, x1, y1 = rect.x0, rect.y0, rect.x1, rect.y1
+                    segments.extend([
+                        (x0, y0, x1, y0, width), (x1, y0, x1, y1, width),
+                        (x1, y1, x0, y1, width), (x0, y1, x0, y0, width)
+                    ])
+
+    return segments
+
+
+def _merge_collinear(axis_segments: np.ndarray, params) -> List[tuple]:
+    """
+    Слияние коллинеарных отрезков одной ориентации
+
+    Args:
+        axis_segments: массив (N, 4): смещение поперек оси, начало, конец, толщина
+
+    Returns:
+        Список (смещение, начало, конец, толщина)
+    """
+    if len(axis_segments) == 0:
+        return []
+
+    # Квантуем смещение, чтобы отрезки одной линии шли подряд, затем сортируем по началу
+    line_keys = np.round(axis_segments[:, 0] / params['merge_offset_px']).astype(np.int64)
+    order = np.lexsort((axis_segments[:, 1], line_keys))
+    segments = axis_segments[order]
+    line_keys = line_keys[order]
+
+    merged = []
+    offset, start, end, width = segments[0]
+    key = line_keys[0]
+    count = 1
+
+    for seg_key, (seg_offset, seg_start, seg_end, seg_width) in zip(line_keys[1:], segments[1:]):
+        if seg_key == key and seg_start <= end + params['merge_gap_px']:
+            end = max(end, seg_end)
+            offset += seg_offset
+            width = max(width, seg_width)
+            count += 1
+        else:
+            merged.append((offset / count, start, end, width))
+            offset, start, end, width = seg_offset, seg_start, seg_end, seg_width
+            key = seg_key
+            count = 1
+
+    merged.append((offset / count, start, end, width))
+    return merged
+
+
+def _pair_parallel(lines: List[tuple], params) -> List[tuple]:
+    """
+    Стена, нарисованная двумя параллельными контурами, - одна стена по оси между ними
+
+    Args:
+        lines: Слитые линии одной ориентации (смещение, начало, конец, толщина)
+
+    Returns:
+        Список (смещение, начало, конец, толщина); непарные линии остаются как есть
+    """
+    lines = sorted(lines)
+    used = [False] * len(lines)
+    walls = []
+
+    for i, (offset, start, end, width) in enumerate(lines):
+        if used[i]:
+            continue
+        partner = None
+
+        # Ближайшая по смещению линия, перекрывающаяся по длине
+        for j in range(i + 1, len(lines)):
+            other_offset, other_start, other_end, other_width = lines[j]
+            gap = other_offset - offset
+            if gap > params['max_wall_thickness_px']:
+                break
+            # Наложенные полосы (например, залитая стена и ее обводка) - не пара контуров
+            if used[j] or gap <= (width + other_width) / 2:
+                continue
+            overlap = min(end, other_end) - max(start, other_start)
+            shorter = max(min(end - start, other_end - other_start), 1e-6)
+            if overlap >= params['min_pair_overlap'] * shorter:
+                partner = j
+                break
+
+        if partner is None:
+            walls.append((offset, start, end, width))
+            continue
+
+        used[partner] = True
+        other_offset, other_start, other_end, other_width = lines[partner]
+        walls.append((
+            (offset + other_offset) / 2,
+            min(start, other_start),
+            max(end, other_end),
+            other_offset - offset + (width + other_width) / 2
+        ))
+
+    return walls
+
+
+def _wall_object(x1, y1, x2, y2, thickness) -> Dict[str, Any]:
+    """Стена в формате объектов разметки (полигон из 4 точек вокруг оси)"""
+    half = thickness / 2
+    if y1 == y2:
+        points = [(x1, y1 - half), (x2, y1 - half), (x2, y1 + half), (x1, y1 + half)]
+    else:
+        points = [(x1 - half, y1), (x1 + half, y1), (x1 + half, y2), (x1 - half, y2)]
+
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    width = max(xs) - min(xs)
+    height = max(ys) - min(ys)
+
+    return {
+        'type': 'wall',
+        'points': [{'x': float(x), 'y': float(y)} for x, y in points],
+        'confidence': 1.0,
+        'dimensions': {
+            'width_px': float(width),
+            'height_px': float(height),
+            'aspect_ratio': float(width / height) if height > 0 else 0.0
+        },
+        'center': {
+            'x': float((x1 + x2) / 2),
+            'y': float((y1 + y2) / 2)
+        },
+        'source': 'pdf_vector'
+    }
+
+
+def count_segments(drawings) -> int:
+    """Число отрезков во всех путях (CAD-экспорт собирает много отрезков в один путь)"""
+    return sum(1 for path in drawings for item in path.get('items', []) if item[0] in SEGMENT_KINDS)
+
+
+def is_vector_page(page, min_segments=None, drawings=None) -> bool:
+    """Есть ли на странице достаточно векторной графики для извлечения стен"""
+    if min_segments is None:
+        min_segments = DEFAULT_PARAMS['min_segments']
+    if drawings is None:
+        drawings = page.get_drawings()
+    return count_segments(drawings) >= min_segments
+
+
+def extract_walls_from_page(page, dpi=150, drawings=None, **overrides) -> Dict[str, Any]:
+    """
+    Извлечение кандидатов в стены из векторной графики страницы
+
+    Args:
+        page: Страница fitz
+        dpi: DPI растра, в пикселях которого выдаются координаты (совпадает с page_XXX.jpg)
+        drawings: Уже полученный page.get_drawings() (чтобы не разбирать страницу дважды)
+        overrides: Переопределение параметров из DEFAULT_PARAMS
+
+    Returns:
+        Разметка в формате convert_to_markup_format
+    """
+    params = {**DEFAULT_PARAMS, **overrides}
+    scale = dpi / 72
+
+    if drawings is None:
+        drawings = page.get_drawings()
+    raw = _collect_segments(page, drawings, params)
+    objects = []
+
+    if raw:
+        seg = np.array(raw, dtype=np.float64)
+        seg[:, :4] *= scale
+        dx = seg[:, 2] - seg[:, 0]
+        dy = seg[:, 3] - seg[:, 1]
+
+        # Ориентация всех отрезков одним векторным проходом
+        angles = np.degrees(np.abs(np.arctan2(dy, dx))) % 180
+        tolerance = params['angle_tolerance_deg']
+        horizontal = (angles <= tolerance) | (angles >= 180 - tolerance)
+        vertical = np.abs(angles - 90) <= tolerance
+
+        # (смещение поперек оси, начало, конец, толщина)
+        h = seg[horizontal]
+        h_axis = np.column_stack([
+            (h[:, 1] + h[:, 3]) / 2,
+            np.minimum(h[:, 0], h[:, 2]),
+            np.maximum(h[:, 0], h[:, 2]),
+            h[:, 4] * scale
+        ])
+        v = seg[vertical]
+        v_axis = np.column_stack([
+            (v[:, 0] + v[:, 2]) / 2,
+            np.minimum(v[:, 1], v[:, 3]),
+            np.maximum(v[:, 1], v[:, 3]),
+            v[:, 4] * scale
+        ])
+
+        for y, x1, x2, thickness in _pair_parallel(_merge_collinear(h_axis, params), params):
+            if x2 - x1 >= params['min_length_px']:
+                objects.append(_wall_object(x1, y, x2, y, max(thickness, 2.0)))
+
+        for x, y1, y2, thickness in _pair_parallel(_merge_collinear(v_axis, params), params):
+            if y2 - y1 >= params['min_length_px']:
+                objects.append(_wall_object(x, y1, x, y2, max(thickness, 2.0)))
+
+    return {
+        'image_dimensions': {
+            'width_px': int(round(page.rect.width * scale)),
+            'height_px': int(round(page.rect.height * scale))
+        },
+        'objects': objects,
+        'total_objects': len(objects),
+        'detection_method': 'PDF Vector Geometry',
+        'created_at': str(np.datetime64('now')),
+        'model_version': 'v1.0-vector',
+        'vector_segments_total': len(raw)
+    }
+
+
+def extract_vector_walls(pdf_path: Path, page_num: int, dpi=150, **overrides) -> Dict[str, Any]:
+    """
+    Извлечение стен со страницы PDF (нумерация с 1)
+
+    Returns:
+        Разметка с success=False, если страница не векторная
+    """
+    with fitz.open(str(pdf_path)) as doc:
+        if page_num < 1 or page_num > len(doc):
+            return {'success': False, 'message': f"Страница {page_num} вне диапазона 1..{len(doc)}"}
+
+        page = doc.load_page(page_num - 1)
+        drawings = page.get_drawings()
+        min_segments = overrides.get('min_segments', DEFAULT_PARAMS['min_segments'])
+        if not is_vector_page(page, min_segments, drawings):
+            return {'success': False, 'vector_page': False,
+                    'message': 'Страница не содержит векторной графики'}
+
+        markup = extract_walls_from_page(page, dpi, drawings, **overrides)
+
+    markup['page_num'] = page_num
+    markup['vector_page'] = True
+    markup['success'] = markup['total_objects'] > 0
+    if not markup['success']:
+        markup['message'] = 'Стены не обнаружены в векторной графике'
+
+    print(f"📐 Векторное извлечение: {markup['total_objects']} стен "
+          f"из {markup['vector_segments_total']} отрезков (стр. {page_num})")
+    return markup
@@ -0,0 +1,100 @@
+# wall_masks.py - Маски сегментации YOLO: полигоны стен и компактное хранение (RLE)
+# Маски yolov8-seg приходят в разрешении входа модели с полями letterbox;
+# здесь они обрезаются до области страницы, превращаются в упрощенные полигоны
+# в координатах страницы и кодируются длинами серий для хранения в разметке.
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def crop_letterbox(masks: np.ndarray, orig_shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Обрезка полей letterbox у масок (N, H, W) входа модели
+
+    Returns:
+        Маски (N, h, w) пропорциональные исходному изображению orig_shape
+    """
+    height, width = masks.shape[1:]
+    orig_h, orig_w = orig_shape[:2]
+    gain = min(height / orig_h, width / orig_w)
+    pad_x = (width - orig_w * gain) / 2
+    pad_y = (height - orig_h * gain) / 2
+    # Так же, как ultralytics.utils.ops.scale_image
+    top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    bottom, right = height - int(round(pad_y + 0.1)), width - int(round(pad_x + 0.1))
+    return masks[:, top:bottom, left:right]
+
+
+def mask_polygons(masks: np.ndarray, orig_shape: Tuple[int, int], offset=(0, 0),
+                  epsilon: float = 1.5) -> List[Optional[List[List[float]]]]:
+    """
+    Упрощенные полигоны масок в координатах страницы
+
+    Args:
+        masks: Обрезанные маски (N, h, w), bool
+        orig_shape: Размер исходного изображения (высота, ширина)
+        offset: Смещение (x, y) - для тайлов
+        epsilon: Допуск approxPolyDP в пикселях маски
+
+    Returns:
+        Для каждой маски список точек [[x, y], ...] или None (пустая маска)
+    """
+    if len(masks) == 0:
+        return []
+
+    height, width = masks.shape[1:]
+    scale = np.array([orig_shape[1] / width, orig_shape[0] / height])
+    shift = np.asarray(offset, dtype=np.float64)
+
+    polygons = []
+    for mask in masks.astype(np.uint8):
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            polygons.append(None)
+            continue
+
+        # Несколько кусков одной маски - берется основной
+        contour = max(contours, key=cv2.contourArea)
+        approx = cv2.approxPolyDP(contour, epsilon, True).reshape(-1, 2)
+        if len(approx) < 3:
+            polygons.append(None)
+            continue
+
+        points = (approx + 0.5) * scale + shift
+        polygons.append(np.round(points, 1).tolist())
+    return polygons
+
+
+def rle_encode(masks: np.ndarray) -> List[List[int]]:
+    """
+    Кодирование масок (N, h, w) длинами серий, построчно.
+    Серии чередуются начиная с нулей (первая серия может быть нулевой длины)
+    """
+    count, height, width = masks.shape
+    if count == 0:
+        return []
+
+    flat = masks.reshape(count, -1).astype(np.int8)
+    padded = np.pad(flat, ((0, 0), (1, 1)))
+    rows, positions = np.nonzero(np.diff(padded, axis=1))
+
+    # Границы серий всех масок одним проходом, затем разрезка по маскам
+    bounds = np.split(positions, np.searchsorted(rows, np.arange(1, count)))
+    size = height * width
+    return [np.diff(np.concatenate(([0], row_bounds, [size]))).tolist() for row_bounds in bounds]
+
+
+def rle_decode(counts: List[int], size: Tuple[int, int]) -> np.ndarray:
+    """Обратное преобразование одной маски из длин серий"""
+    values = np.arange(len(counts)) % 2
+    return np.repeat(values, counts).astype(bool).reshape(size)
+
+
+def masks_to_rle(masks: np.ndarray) -> Dict[str, Any]:
+    """Маски страницы для сохранения в разметку"""
+    return {
+        'size': list(masks.shape[1:]),
+        'order': 'row-major',
+        'counts': rle_encode(masks)
+    }
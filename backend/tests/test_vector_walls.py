@@ -0,0 +1,73 @@
+# test_vector_walls.py - Проверка классификации векторных страниц и извлечения стен
+# Запуск из backend/: python -m pytest tests
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+fitz = pytest.importorskip("fitz")
+
+BACKEND_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BACKEND_DIR / "app"))
+
+from vector_walls import count_segments, extract_vector_walls, is_vector_page  # noqa: E402
+
+TEST_PDF = next(iter(sorted(BACKEND_DIR.glob("uploaded_pdfs/*/test.pdf"))), None)
+
+
+def single_path_page(segments=60):
+    """Страница, где все отрезки нарисованы одним путем (как в CAD-экспорте)"""
+    doc = fitz.open()
+    page = doc.new_page(width=842, height=595)
+    shape = page.new_shape()
+    for i in range(segments):
+        y = 20 + i * 9
+        shape.draw_line((20, y), (400, y))
+    shape.finish(width=1.0, color=(0, 0, 0))
+    shape.commit()
+    return doc, page
+
+
+def test_single_path_with_many_segments_is_vector():
+    doc, page = single_path_page()
+    with doc:
+        drawings = page.get_drawings()
+        assert len(drawings) == 1
+        assert count_segments(drawings) >= 60
+        assert is_vector_page(page, drawings=drawings)
+
+
+def test_few_segments_is_raster():
+    doc, page = single_path_page(segments=5)
+    with doc:
+        assert not is_vector_page(page)
+
+
+def test_double_line_wall_is_one_wall(tmp_path):
+    doc = fitz.open()
+    page = doc.new_page(width=842, height=595)
+    shape = page.new_shape()
+    # Стена двумя контурами на расстоянии 5 пт, плюс отрезки, чтобы страница считалась векторной
+    shape.draw_line((100, 300), (500, 300))
+    shape.draw_line((100, 305), (500, 305))
+    for i in range(60):
+        shape.draw_line((600, 20 + i * 9), (610, 20 + i * 9))
+    shape.finish(width=1.0, color=(0, 0, 0))
+    shape.commit()
+    pdf_path = tmp_path / "double_line.pdf"
+    doc.save(str(pdf_path))
+    doc.close()
+
+    markup = extract_vector_walls(pdf_path, 1, dpi=72)
+    assert markup['vector_page']
+    assert markup['total_objects'] == 1
+    wall = markup['objects'][0]
+    assert wall['center']['y'] == pytest.approx(302.5)
+    assert wall['dimensions']['height_px'] == pytest.approx(6.0)
+
+
+@pytest.mark.skipif(TEST_PDF is None, reason="нет uploaded_pdfs/*/test.pdf")
+def test_repo_sample_pdf_is_vector():
+    markup = extract_vector_walls(TEST_PDF, 1)
+    assert markup['vector_page']